@@ -0,0 +1,538 @@
+"""
+Benchmark offline da pipeline do RAG, sem OpenAI e sem Milvus.
+
+Gera PDFs sintéticos (com texto e digitalizados), ingere-os com `RAGPipeline.process_document`
+e faz perguntas com `answer_question`, usando backends falsos e determinísticos de embedding e de LLM
+e o índice local de vetores. Para cada estágio, registra páginas/s, chunks/s, latências (p50/p95/p99)
+e o pico de memória (RSS), e salva tudo em JSON para comparar commits.
+
+Uso (a partir da pasta `app`):
+
+    python benchmark.py --pages 200 --scanned-pages 10 --questions 500
+
+As demais variáveis de ambiente (CHUNK_SIZE, PDF_EXTRACTION_WORKERS, RERANKER, ...) valem normalmente.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import pymupdf
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from services.embedding_backends import EmbeddingBackend
+from services.embedding_service import EmbeddingService
+from services.keyword_index import tokenize
+
+# Sílabas usadas para formar as palavras do texto sintético
+SYLLABLES = [consonant + vowel for consonant in "bcdflmnprstv" for vowel in "aeiou"]
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Embedding determinístico por feature hashing: cada palavra soma ±1 numa posição do vetor.
+    Textos com palavras em comum ficam próximos, o que basta para exercitar a busca.
+    """
+
+    retryable_errors = ()
+
+    def __init__(self, dim: int = 256, latency_ms: float = 0):
+        self.dim = dim
+        self.model_name = f"hashing:{dim}"
+        self.query_model_name = self.model_name
+        self.latency_seconds = latency_ms / 1000
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                hashed = zlib.crc32(token.encode())
+                vectors[row, hashed % self.dim] += 1 if hashed & 1 << 31 else -1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.tolist()
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Simula a latência de rede de uma requisição por lote
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self._embed(texts)
+
+    async def embed_query(self, text: str) -> List[float]:
+        return (await self.embed_documents([text]))[0]
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self.embed_documents(texts)
+
+
+class FakeLLMService:
+    """
+    LLM determinístico: responde citando os chunks recebidos, após uma latência opcional.
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_seconds = latency_ms / 1000
+
+    async def generate_answer(
+        self, question: str, chat_history: list, context_chunks: List[Dict[str, Any]]
+    ) -> str:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        sources = ", ".join(chunk["id"] for chunk in context_chunks)
+        return f"Resposta para '{question}' com base em: {sources}"
+
+    async def stream_answer(
+        self, question: str, chat_history: list, context_chunks: List[Dict[str, Any]]
+    ):
+        answer = await self.generate_answer(question, chat_history, context_chunks)
+        for token in answer.split(" "):
+            yield token + " "
+
+
+class RSSSampler:
+    """
+    Mede o pico de memória residente (RSS) do processo durante um estágio, amostrando /proc/self/statm
+    numa thread. Fora do Linux, usa o pico do processo inteiro informado pelo `resource`.
+
+    Mede também a soma do RSS dos processos filhos (o pool de extração roda em processos
+    separados) e o pico do total, processo mais filhos, na mesma amostra.
+    """
+
+    def __init__(self, interval_seconds: float = 0.01):
+        self.interval_seconds = interval_seconds
+        self.peak_bytes = 0
+        self.peak_children_bytes = 0
+        self.peak_total_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def _current_bytes(self) -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self._page_size
+        except OSError:
+            # ru_maxrss vem em KB no Linux e em bytes no macOS
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _children_bytes(self) -> int:
+        """
+        Soma o RSS dos processos descendentes, lendo o /proc. Fora do Linux, usa o pico do maior
+        filho já encerrado informado pelo `resource` (filhos ainda vivos não entram).
+        """
+
+        try:
+            entries = os.listdir("/proc")
+        except OSError:
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+
+        children = {}
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    # O nome do processo vem entre parênteses e pode ter espaços; o PPID vem depois do estado
+                    parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+
+        total = 0
+        pending = list(children.get(os.getpid(), []))
+        while pending:
+            pid = pending.pop()
+            pending.extend(children.get(pid, []))
+            try:
+                with open(f"/proc/{pid}/statm") as statm:
+                    total += int(statm.read().split()[1]) * self._page_size
+            except (OSError, IndexError, ValueError):
+                continue
+        return total
+
+    def _sample(self):
+        current = self._current_bytes()
+        children = self._children_bytes()
+        self.peak_bytes = max(self.peak_bytes, current)
+        self.peak_children_bytes = max(self.peak_children_bytes, children)
+        self.peak_total_bytes = max(self.peak_total_bytes, current + children)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self._sample()
+
+    def __enter__(self) -> "RSSSampler":
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak_bytes / 1024 / 1024, 1)
+
+    @property
+    def peak_children_mb(self) -> float:
+        return round(self.peak_children_bytes / 1024 / 1024, 1)
+
+    @property
+    def peak_total_mb(self) -> float:
+        return round(self.peak_total_bytes / 1024 / 1024, 1)
+
+
+class SyntheticCorpus:
+    """
+    Gera texto pseudo-aleatório e reproduzível (pela semente), com frequência das palavras
+    parecida com a de textos reais (lei de Zipf), e guarda as frases para montar perguntas.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 5000):
+        self.rng = random.Random(seed)
+        vocabulary = set()
+        while len(vocabulary) < vocabulary_size:
+            vocabulary.add(
+                "".join(self.rng.choices(SYLLABLES, k=self.rng.randint(2, 4)))
+            )
+        self.vocabulary = sorted(vocabulary)
+        self.rng.shuffle(self.vocabulary)
+        self.weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+        self.sentences = []
+
+    def sentence(self) -> str:
+        words = self.rng.choices(
+            self.vocabulary, self.weights, k=self.rng.randint(8, 24)
+        )
+        sentence = " ".join(words).capitalize() + "."
+        self.sentences.append(sentence)
+        return sentence
+
+    def page(self, words: int) -> str:
+        paragraphs = []
+        total = 0
+        while total < words:
+            paragraph = " ".join(self.sentence() for _ in range(self.rng.randint(2, 6)))
+            paragraphs.append(paragraph)
+            total += len(paragraph.split())
+        return "\n\n".join(paragraphs)
+
+    def questions(self, count: int) -> List[str]:
+        questions = []
+        for _ in range(count):
+            words = self.rng.choice(self.sentences).rstrip(".").split()
+            start = self.rng.randint(0, max(len(words) - 6, 0))
+            questions.append(
+                f"O que o documento diz sobre {' '.join(words[start : start + 6]).lower()}?"
+            )
+        return questions
+
+
+def write_text_pdf(path: str, corpus: SyntheticCorpus, pages: int, words: int):
+    """
+    Gera um PDF com camada de texto.
+
+    Args:
+        path (str): Caminho do PDF gerado.
+        corpus (SyntheticCorpus): Gerador do texto das páginas.
+        pages (int): Número de páginas.
+        words (int): Palavras por página.
+    """
+    pdf = pymupdf.open()
+    for _ in range(pages):
+        page = pdf.new_page()
+        page.insert_textbox(
+            page.rect + (40, 40, -40, -40), corpus.page(words), fontsize=8
+        )
+    pdf.save(path)
+    pdf.close()
+
+
+def write_scanned_pdf(
+    path: str, corpus: SyntheticCorpus, pages: int, words: int, dpi: int = 150
+):
+    """
+    Gera um PDF "digitalizado": cada página é só uma imagem do texto, sem camada de texto, e precisa de OCR.
+
+    Args:
+        path (str): Caminho do PDF gerado.
+        corpus (SyntheticCorpus): Gerador do texto das páginas.
+        pages (int): Número de páginas.
+        words (int): Palavras por página.
+        dpi (int): Resolução das imagens das páginas.
+    """
+    text_pdf = pymupdf.open()
+    scanned_pdf = pymupdf.open()
+    for _ in range(pages):
+        text_page = text_pdf.new_page()
+        text_page.insert_textbox(
+            text_page.rect + (40, 40, -40, -40), corpus.page(words), fontsize=10
+        )
+        pixmap = text_page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY)
+        scanned_page = scanned_pdf.new_page(
+            width=text_page.rect.width, height=text_page.rect.height
+        )
+        scanned_page.insert_image(scanned_page.rect, pixmap=pixmap)
+    scanned_pdf.save(path, deflate=True)
+    scanned_pdf.close()
+    text_pdf.close()
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """
+    Resume latências (em segundos) em milissegundos: média e percentis 50, 95 e 99.
+
+    Args:
+        latencies (List[float]): Latência de cada operação.
+    """
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+async def run_ingest_stage(
+    pipeline, path: str, filename: str, session_id: str
+) -> Dict[str, Any]:
+    """
+    Ingere um PDF e mede a vazão da ingestão e o pico de memória.
+
+    Args:
+        pipeline (RAGPipeline): Pipeline com os backends falsos.
+        path (str): Caminho do PDF.
+        filename (str): Nome do documento nos metadados.
+        session_id (str): Coleção onde os chunks são indexados.
+    """
+
+    counts = {"pages": 0, "chunks": 0}
+    # Tempo até a primeira página ficar pronta, que mostra o ganho do streaming
+    first_page = []
+
+    # Páginas por backend de extração
+    backends = {}
+
+    def progress(field: str, amount: int):
+        if field in counts:
+            counts[field] += amount
+        elif field.startswith("pages_"):
+            backend = field[len("pages_") :]
+            backends[backend] = backends.get(backend, 0) + amount
+        if field == "pages" and not first_page:
+            first_page.append(time.perf_counter() - started)
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        chunks = await pipeline.process_document(path, filename, session_id, progress)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "pages": counts["pages"],
+        "page_backends": backends,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(counts["pages"] / elapsed, 2),
+        "chunks_per_second": round(chunks / elapsed, 2),
+        "first_page_seconds": round(first_page[0], 3) if first_page else None,
+        "peak_rss_mb": rss.peak_mb,
+        "peak_children_rss_mb": rss.peak_children_mb,
+        "peak_total_rss_mb": rss.peak_total_mb,
+    }
+
+
+async def run_query_stage(
+    pipeline, questions: List[str], session_id: str, concurrency: int
+) -> Dict[str, Any]:
+    """
+    Faz as perguntas com `answer_question`, até `concurrency` ao mesmo tempo, e mede as latências.
+
+    Args:
+        pipeline (RAGPipeline): Pipeline com os backends falsos.
+        questions (List[str]): Perguntas a fazer.
+        session_id (str): Coleção consultada.
+        concurrency (int): Perguntas simultâneas.
+    """
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask(question: str):
+        async with semaphore:
+            started = time.perf_counter()
+            await pipeline.answer_question(question, [], session_id)
+            latencies.append(time.perf_counter() - started)
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*[ask(question) for question in questions])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "questions": len(questions),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "questions_per_second": round(len(questions) / elapsed, 2),
+        **latency_summary(latencies),
+        "peak_rss_mb": rss.peak_mb,
+        "peak_children_rss_mb": rss.peak_children_mb,
+        "peak_total_rss_mb": rss.peak_total_mb,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    """
+    Gera os PDFs, monta a pipeline com os backends falsos e roda os estágios.
+
+    Args:
+        args (argparse.Namespace): Opções da linha de comando.
+        workdir (str): Diretório temporário dos PDFs e do índice local.
+    """
+
+    # Tudo num diretório temporário e sem caches em disco, para que as execuções sejam comparáveis
+    os.environ["LOCAL_VECTOR_STORE_PATH"] = os.path.join(workdir, "vectors")
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["DOCUMENT_REGISTRY_PATH"] = ""
+
+    from services.document_processor import DocumentProcessor
+    from services.local_vector_store import LocalVectorStore
+    from services.rag_pipeline import RAGPipeline
+
+    corpus = SyntheticCorpus(args.seed)
+    stages = {}
+
+    started = time.perf_counter()
+    text_path = os.path.join(workdir, "text.pdf")
+    write_text_pdf(text_path, corpus, args.pages, args.words_per_page)
+    scanned_path = None
+    if args.scanned_pages:
+        scanned_path = os.path.join(workdir, "scanned.pdf")
+        write_scanned_pdf(scanned_path, corpus, args.scanned_pages, args.words_per_page)
+    stages["generate"] = {"seconds": round(time.perf_counter() - started, 3)}
+
+    embeddings = EmbeddingService(
+        HashingEmbeddingBackend(args.embedding_dim, args.embedding_latency_ms)
+    )
+    document_processor = DocumentProcessor(embeddings)
+    pipeline = RAGPipeline(
+        document_processor,
+        LocalVectorStore(dim=embeddings.dim, model_name=embeddings.model_name),
+        FakeLLMService(args.llm_latency_ms),
+    )
+
+    stages["ingest_text"] = await run_ingest_stage(
+        pipeline, text_path, "text.pdf", "benchmark"
+    )
+
+    if scanned_path is not None and shutil.which("tesseract") is None:
+        stages["ingest_scanned"] = {"skipped": "tesseract não encontrado no PATH"}
+    elif scanned_path is not None:
+        stages["ingest_scanned"] = await run_ingest_stage(
+            pipeline, scanned_path, "scanned.pdf", "benchmark"
+        )
+
+    stages["query"] = await run_query_stage(
+        pipeline, corpus.questions(args.questions), "benchmark", args.concurrency
+    )
+
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--pages", type=int, default=100, help="páginas do PDF com texto"
+    )
+    parser.add_argument(
+        "--scanned-pages",
+        type=int,
+        default=5,
+        help="páginas do PDF digitalizado (0 pula o OCR)",
+    )
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="perguntas simultâneas"
+    )
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument(
+        "--embedding-latency-ms",
+        type=float,
+        default=0,
+        help="latência simulada por lote de embedding",
+    )
+    parser.add_argument(
+        "--llm-latency-ms",
+        type=float,
+        default=0,
+        help="latência simulada por resposta do LLM",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        help="arquivo JSON dos resultados (padrão: cache/benchmarks/<commit>-<data>.json)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as workdir:
+        stages = asyncio.run(run_benchmark(args, workdir))
+
+    commit = git_commit()
+    timestamp = datetime.now(timezone.utc)
+    results = {
+        "commit": commit,
+        "timestamp": timestamp.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": vars(args),
+        "stages": stages,
+    }
+
+    output = args.output or os.path.join(
+        "cache",
+        "benchmarks",
+        f"{commit or 'unknown'}-{timestamp.strftime('%Y%m%dT%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+
+    print(json.dumps(stages, indent=2, ensure_ascii=False))
+    print(f"Resultados salvos em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,56 @@
 import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List
-import tempfile
-import shutil
 
-from services.document_processor import DocumentProcessor
-from services.vector_store import MilvusVectorStore
-from services.llm_service import LangGraphLLMService
-from services.rag_pipeline import RAGPipeline
+from services.container import ServiceContainer, ServiceUnavailable
+from services.document_source import DocumentSource
+from services.metrics import REGISTRY, record_timings
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-app = FastAPI(title="Document QA System")
+# Serviços da API, criados em segundo plano depois que o servidor sobe (ver `/readyz`)
+services = ServiceContainer()
+
+# Uploads ficam em memória; acima do limite, esperam pela fila em disco
+upload_dir = os.getenv("INGEST_UPLOAD_DIR", "cache/uploads")
+upload_spill_threshold = int(
+    float(os.getenv("UPLOAD_SPILL_THRESHOLD_MB", "8")) * 1024 * 1024
+)
+os.makedirs(upload_dir, exist_ok=True)
+# Máximo de perguntas por requisição de `/questions/batch`
+batch_max_questions = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await services.start()
+    yield
+    await services.stop()
+
+
+def require_services() -> ServiceContainer:
+    """
+    Retorna os serviços prontos ou responde 503 enquanto ainda estão sendo inicializados.
+    """
+    try:
+        return services.require()
+    except ServiceUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Serviço indisponível: {e}",
+            headers={"Retry-After": "1"},
+        )
+
+
+app = FastAPI(title="Document QA System", lifespan=lifespan)
 
 # CORS para evitar problemas futuros
 app.add_middleware(
@@ -26,65 +61,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Serviços da API
-vector_store = MilvusVectorStore()
-document_processor = DocumentProcessor()
-llm_service = LangGraphLLMService()
-rag_pipeline = RAGPipeline(document_processor, vector_store, llm_service)
-
 
 # Aqui, o único parâmetro obrigatório é o "question", o resto pode ser vazio
 class QuestionRequest(BaseModel):
     session_id: str = "default"
     question: str
     chat_history: list = []
+    # Inclui na resposta o tempo (em ms) de cada estágio da pergunta
+    include_timings: bool = False
+
+
+class BatchQuestionRequest(BaseModel):
+    session_id: str = "default"
+    questions: List[str]
+    chat_history: list = []
+    include_timings: bool = False
+
 
+def format_timings(timings: dict) -> dict:
+    """
+    Converte os tempos dos estágios de segundos para milissegundos.
+
+    Args:
+        timings (dict): Tempos coletados por `record_timings`.
+    """
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
 
-@app.post("/documents")
+
+@app.post("/documents", status_code=202)
 async def upload_documents(
     files: List[UploadFile] = File(...), session_id: str = "default"
 ):
     """
     Faz o upload de um ou mais PDFs.
+
+    Os PDFs são processados em segundo plano; acompanhe o progresso em `/documents/jobs/{job_id}`.
     """
 
+    ingestion_jobs = require_services().ingestion_jobs
+
     if not files:
         raise HTTPException(status_code=400, detail="Nenhum PDF foi providenciado.")
 
-    total_chunks = 0
-    documents_indexed = 0
+    saved_files = []
 
     for file in files:
         if not file.filename.lower().endswith(".pdf"):
             continue
 
-        # Salva temporariamente
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
-
-        try:
-            chunks = await rag_pipeline.process_document(
-                temp_file_path, file.filename, session_id
+        # Mantém em memória; só documentos grandes são gravados no diretório da fila. A leitura
+        # do upload é bloqueante, então roda numa thread
+        saved_files.append(
+            (
+                file.filename,
+                await asyncio.to_thread(
+                    DocumentSource.from_upload,
+                    file.file,
+                    upload_spill_threshold,
+                    upload_dir,
+                ),
             )
-            total_chunks += len(chunks)
-            documents_indexed += 1
-        finally:
-            # Remove o arquivo temporário
-            os.unlink(temp_file_path)
+        )
 
-    if documents_indexed == 0:
+    if not saved_files:
         raise HTTPException(
             status_code=400, detail="Nenhum PDF válido foi providenciado"
         )
 
+    job_id = await ingestion_jobs.submit(session_id, saved_files)
+
     return {
-        "message": "Documentos processados com sucesso",
-        "documents_indexed": documents_indexed,
-        "total_chunks": total_chunks,
+        "message": "Documentos recebidos, processando em segundo plano",
+        "job_id": job_id,
+        "documents_received": len(saved_files),
     }
 
 
+@app.get("/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """
+    Retorna o status de um job de ingestão e o progresso de cada PDF.
+    """
+    job = await require_services().ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+
+    return job
+
+
 @app.post("/question")
 async def ask_question(request: QuestionRequest):
     """
@@ -95,11 +159,151 @@ async def ask_question(request: QuestionRequest):
             status_code=400, detail="O campo 'question' não pode estar vazio."
         )
 
-    answer, context_chunks = await rag_pipeline.answer_question(
-        request.question, request.chat_history, request.session_id
-    )
+    rag_pipeline = require_services().rag_pipeline
 
-    return {
+    try:
+        with record_timings() as timings:
+            answer, context_chunks = await rag_pipeline.answer_question(
+                request.question, request.chat_history, request.session_id
+            )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504, detail="O LLM demorou demais para responder."
+        )
+
+    response = {
         "answer": answer,
         "context_chunks": context_chunks,
     }
+    if request.include_timings:
+        response["timings"] = format_timings(timings)
+
+    return response
+
+
+@app.post("/questions/batch")
+async def ask_questions_batch(request: BatchQuestionRequest):
+    """
+    Envia várias mensagens de uma vez para a API do RAG, para avaliações e perguntas em massa.
+
+    As mensagens são embedadas num só lote e buscadas numa só consulta; as respostas são geradas em paralelo.
+    Uma mensagem cujo LLM falhar volta com "error" em vez de "answer", sem afetar as outras.
+    """
+    if not request.questions or not all(request.questions):
+        raise HTTPException(
+            status_code=400,
+            detail="O campo 'questions' não pode estar vazio nem ter perguntas vazias.",
+        )
+    if len(request.questions) > batch_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No máximo {batch_max_questions} perguntas por requisição.",
+        )
+
+    rag_pipeline = require_services().rag_pipeline
+
+    with record_timings() as timings:
+        results = await rag_pipeline.answer_questions(
+            request.questions, request.chat_history, request.session_id
+        )
+
+    answers = []
+    for question, result in zip(request.questions, results):
+        if isinstance(result, asyncio.TimeoutError):
+            answers.append(
+                {"question": question, "error": "O LLM demorou demais para responder."}
+            )
+        elif isinstance(result, BaseException):
+            answers.append({"question": question, "error": str(result)})
+        else:
+            answer, context_chunks = result
+            answers.append(
+                {
+                    "question": question,
+                    "answer": answer,
+                    "context_chunks": context_chunks,
+                }
+            )
+
+    response = {"answers": answers}
+    if request.include_timings:
+        # Estágios executados em paralelo para várias perguntas têm os tempos somados
+        response["timings"] = format_timings(timings)
+
+    return response
+
+
+@app.post("/question/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Envia uma mensagem para a API do RAG e recebe a resposta via Server-Sent Events.
+
+    Eventos: "context" (chunks usados), "token" (trecho da resposta), "done" e "error".
+    """
+    if not request.question:
+        raise HTTPException(
+            status_code=400, detail="O campo 'question' não pode estar vazio."
+        )
+
+    rag_pipeline = require_services().rag_pipeline
+
+    async def events():
+        try:
+            async for event, data in rag_pipeline.stream_answer(
+                request.question, request.chat_history, request.session_id
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            # O status HTTP já foi enviado, então o erro vai como evento
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/index/tune")
+async def tune_index(session_id: str = "default", target_recall: float = 0.95):
+    """
+    Ajusta o parâmetro de busca (ef/nprobe) da sessão para o recall@k alvo e retorna as medições.
+    """
+    vector_store = require_services().vector_store
+
+    if not hasattr(vector_store, "tune_search"):
+        raise HTTPException(
+            status_code=400,
+            detail="O vector store configurado não tem parâmetros de busca ajustáveis.",
+        )
+    if not 0 < target_recall <= 1:
+        raise HTTPException(
+            status_code=400, detail="O 'target_recall' deve estar entre 0 e 1."
+        )
+
+    return await vector_store.tune_search(session_id, target_recall)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Métricas da API no formato do Prometheus: duração de cada estágio, páginas, chunks, tokens,
+    acertos dos caches e operações em andamento.
+    """
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: responde enquanto o processo está de pé, mesmo com os serviços ainda inicializando.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 só quando os serviços estão criados e o vector store responde; senão, 503.
+    """
+    status = await services.check()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
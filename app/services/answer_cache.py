@@ -0,0 +1,200 @@
+import re
+import time
+import hashlib
+import unicodedata
+import numpy as np
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from .metrics import CACHE_REQUESTS
+
+
+class CachedAnswer(NamedTuple):
+    answer: str
+    context_chunks: List[Dict[str, Any]]
+    expires_at: float
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normaliza a mensagem do usuário para que variações triviais caiam na mesma entrada do cache.
+
+    Args:
+        question (str): A mensagem do usuário.
+    """
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip("?!. ")
+
+
+def _normalize(vector: List[float]) -> Optional[np.ndarray]:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        similarity_threshold: Optional[float] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Sem limiar, só perguntas idênticas (após normalização) são reaproveitadas
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        # Embeddings normalizados das perguntas de cada grupo, para a busca por similaridade, e a
+        # matriz do grupo, refeita só quando o grupo muda
+        self._embeddings = defaultdict(dict)
+        self._matrices = {}
+
+    def _group_key(
+        self, session_id: str, chunk_ids: List[str], chat_history: list
+    ) -> Tuple[str, frozenset, str]:
+        """
+        Agrupa as entradas que compartilham sessão, chunks recuperados e histórico do chat.
+        """
+        history_digest = hashlib.sha256("\n".join(chat_history).encode("utf-8"))
+        return session_id, frozenset(chunk_ids), history_digest.hexdigest()
+
+    def get(
+        self,
+        session_id: str,
+        chunk_ids: List[str],
+        chat_history: list,
+        question: str,
+        question_embedding: List[float],
+    ) -> Optional[CachedAnswer]:
+        """
+        Busca uma resposta no cache, pela pergunta normalizada ou, se habilitado, pela similaridade do embedding.
+
+        Args:
+            session_id (str): ID da sessão.
+            chunk_ids (List[str]): IDs dos chunks recuperados para a pergunta.
+            chat_history (list): Histórico do chat enviado junto com a pergunta.
+            question (str): A mensagem do usuário.
+            question_embedding (List[float]): Embedding da mensagem do usuário.
+        """
+
+        now = time.monotonic()
+        group = self._group_key(session_id, chunk_ids, chat_history)
+        key = (group, normalize_question(question))
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._discard(key)
+            entry = None
+
+        if entry is None and self.similarity_threshold is not None:
+            key, entry = self._most_similar(group, question_embedding, now)
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+
+        CACHE_REQUESTS.inc(cache="answer", result="miss" if entry is None else "hit")
+        return entry
+
+    def _most_similar(
+        self,
+        group: Tuple[str, frozenset, str],
+        question_embedding: List[float],
+        now: float,
+    ) -> Tuple[Optional[tuple], Optional[CachedAnswer]]:
+        """
+        Busca a pergunta do grupo mais parecida com a mensagem, acima do limiar, num só produto de matrizes.
+
+        Args:
+            group (Tuple[str, frozenset, str]): Grupo retornado por `_group_key`.
+            question_embedding (List[float]): Embedding da mensagem do usuário.
+            now (float): Instante atual, para ignorar as entradas expiradas.
+        """
+
+        query = _normalize(question_embedding)
+        if query is None or group not in self._embeddings:
+            return None, None
+
+        if group not in self._matrices:
+            questions = list(self._embeddings[group])
+            self._matrices[group] = (
+                questions,
+                np.stack([self._embeddings[group][q] for q in questions]),
+            )
+        questions, matrix = self._matrices[group]
+
+        similarities = matrix @ query
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.similarity_threshold:
+                break
+            key = (group, questions[index])
+            entry = self._entries[key]
+            if entry.expires_at > now:
+                return key, entry
+
+        return None, None
+
+    def _discard(self, key: tuple):
+        """
+        Remove uma entrada do cache e o embedding da pergunta do seu grupo.
+        """
+
+        self._entries.pop(key, None)
+        group, question = key
+        embeddings = self._embeddings.get(group)
+        if embeddings is not None and embeddings.pop(question, None) is not None:
+            self._matrices.pop(group, None)
+            if not embeddings:
+                del self._embeddings[group]
+
+    def put(
+        self,
+        session_id: str,
+        chunk_ids: List[str],
+        chat_history: list,
+        question: str,
+        question_embedding: List[float],
+        answer: str,
+        context_chunks: List[Dict[str, Any]],
+    ):
+        """
+        Armazena uma resposta no cache, descartando a entrada usada há mais tempo se necessário.
+
+        Args:
+            session_id (str): ID da sessão.
+            chunk_ids (List[str]): IDs dos chunks recuperados para a pergunta.
+            chat_history (list): Histórico do chat enviado junto com a pergunta.
+            question (str): A mensagem do usuário.
+            question_embedding (List[float]): Embedding da mensagem do usuário.
+            answer (str): Resposta gerada pelo LLM.
+            context_chunks (List[Dict[str, Any]]): Chunks usados como contexto da resposta.
+        """
+
+        key = (
+            self._group_key(session_id, chunk_ids, chat_history),
+            normalize_question(question),
+        )
+        self._discard(key)
+        self._entries[key] = CachedAnswer(
+            answer=answer,
+            context_chunks=context_chunks,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        if self.similarity_threshold is not None:
+            embedding = _normalize(question_embedding)
+            if embedding is not None:
+                group, normalized_question = key
+                self._embeddings[group][normalized_question] = embedding
+                self._matrices.pop(group, None)
+
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate_session(self, session_id: str):
+        """
+        Remove todas as respostas de uma sessão, usado quando novos documentos são indexados nela.
+
+        Args:
+            session_id (str): ID da sessão.
+        """
+        for key in [key for key in self._entries if key[0][0] == session_id]:
+            self._discard(key)
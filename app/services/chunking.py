@@ -0,0 +1,223 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Separadores do splitter, do mais ao menos forte: parágrafo, linha, frase, palavra
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+
+class Chunk:
+    """
+    Trecho de um documento, com as páginas e a posição (em caracteres) no texto extraído.
+
+    Usa `__slots__` em vez de um dict por chunk, o que reduz a memória em documentos com milhares de chunks.
+    """
+
+    __slots__ = (
+        "id",
+        "text",
+        "source",
+        "page_start",
+        "page_end",
+        "char_start",
+        "char_end",
+        "embedding",
+    )
+
+    def __init__(
+        self,
+        text: str,
+        source: str,
+        page_start: int,
+        page_end: int,
+        char_start: int,
+        char_end: int,
+        id: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+    ):
+        self.id = id
+        self.text = text
+        self.source = source
+        self.page_start = page_start
+        self.page_end = page_end
+        self.char_start = char_start
+        self.char_end = char_end
+        self.embedding = embedding
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Representação do chunk sem o embedding, para as respostas da API.
+        """
+        return {
+            "id": self.id,
+            "text": self.text,
+            "source": self.source,
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+            "char_start": self.char_start,
+            "char_end": self.char_end,
+        }
+
+
+def create_text_splitter(
+    chunk_size: int,
+    chunk_overlap: int,
+    unit: str = "chars",
+    encoding_name: str = "cl100k_base",
+) -> RecursiveCharacterTextSplitter:
+    """
+    Cria o splitter com o tamanho dos chunks medido em caracteres ou em tokens.
+
+    Args:
+        chunk_size (int): Tamanho máximo de cada chunk.
+        chunk_overlap (int): Sobreposição entre chunks vizinhos.
+        unit (str): "chars" ou "tokens".
+        encoding_name (str): Codificação do tiktoken usada na contagem de tokens.
+    """
+
+    if unit == "tokens":
+        return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=encoding_name,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=SEPARATORS,
+            keep_separator="end",
+        )
+    if unit == "chars":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=SEPARATORS,
+            keep_separator="end",
+        )
+
+    raise ValueError(f"Unidade de chunk inválida: {unit}")
+
+
+class PageAwareChunker:
+    """
+    Divide as páginas em chunks conforme chegam, registrando em quais páginas e em que posição
+    do texto extraído cada chunk está. Um chunk pode atravessar a quebra de página.
+    """
+
+    def __init__(
+        self,
+        text_splitter: RecursiveCharacterTextSplitter,
+        source: str,
+        buffer_chars: int = 8000,
+        chunk_overlap: int = 0,
+    ):
+        self.text_splitter = text_splitter
+        self.source = source
+        self.buffer_chars = buffer_chars
+        # Sobreposição máxima do splitter, usada para localizar cada chunk logo após o anterior
+        self.chunk_overlap = chunk_overlap
+        self._buffer = ""
+        # Posição do início do buffer no texto do documento inteiro
+        self._buffer_start = 0
+        # Posição de início e número de cada página ainda presente no buffer
+        self._page_starts = []
+        self._page_numbers = []
+        self._pages = 0
+
+    def _page_at(self, position: int) -> int:
+        return self._page_numbers[max(bisect_right(self._page_starts, position) - 1, 0)]
+
+    def _split(self, keep_last: bool) -> List[Chunk]:
+        """
+        Divide o buffer em chunks, localizando cada um no texto do documento.
+
+        Args:
+            keep_last (bool): Mantém o último chunk no buffer, pois ele pode continuar na próxima página.
+        """
+
+        chunks = []
+        previous_start = -1
+        previous_end = 0
+        for text in self.text_splitter.split_text(self._buffer):
+            # O splitter remove espaços das pontas, então o texto é sempre um trecho do buffer.
+            # Procura primeiro logo após o chunk anterior, descontada a sobreposição, para não
+            # confundir com uma repetição anterior do mesmo texto
+            start = self._buffer.find(
+                text, max(previous_start + 1, previous_end - self.chunk_overlap)
+            )
+            if start < 0:
+                start = self._buffer.find(text, previous_start + 1)
+            if start < 0:
+                start = previous_start + 1
+            previous_start = start
+            previous_end = start + len(text)
+
+            char_start = self._buffer_start + start
+            char_end = char_start + len(text)
+            chunks.append(
+                Chunk(
+                    text,
+                    self.source,
+                    self._page_at(char_start),
+                    self._page_at(char_end - 1),
+                    char_start,
+                    char_end,
+                )
+            )
+
+        if keep_last and chunks:
+            last = chunks.pop()
+            cut = last.char_start - self._buffer_start
+            self._buffer = self._buffer[cut:]
+            self._buffer_start = last.char_start
+
+            # Descarta as páginas que terminaram antes do novo início do buffer
+            first_page = max(bisect_right(self._page_starts, last.char_start) - 1, 0)
+            self._page_starts = self._page_starts[first_page:]
+            self._page_numbers = self._page_numbers[first_page:]
+        elif not keep_last:
+            self._buffer_start += len(self._buffer)
+            self._buffer = ""
+            self._page_starts = []
+            self._page_numbers = []
+
+        return chunks
+
+    def add_page(self, page_text: str) -> List[Chunk]:
+        """
+        Acrescenta uma página e retorna os chunks que já estão completos.
+
+        Args:
+            page_text (str): Texto da próxima página do documento.
+        """
+
+        self._pages += 1
+        self._page_starts.append(self._buffer_start + len(self._buffer))
+        self._page_numbers.append(self._pages)
+        self._buffer += (page_text or "") + "\n\n"
+
+        if len(self._buffer) < self.buffer_chars:
+            return []
+        return self._split(keep_last=True)
+
+    def finish(self) -> List[Chunk]:
+        """
+        Retorna os chunks restantes no fim do documento.
+        """
+        if not self._buffer:
+            return []
+        return self._split(keep_last=False)
+
+
+def format_citation(chunk: Dict[str, Any]) -> str:
+    """
+    Nome do documento de um chunk retornado pela busca, com as páginas quando conhecidas.
+
+    Args:
+        chunk (Dict[str, Any]): Chunk com "source" e, opcionalmente, "page_start" e "page_end".
+    """
+
+    page_start = chunk.get("page_start")
+    page_end = chunk.get("page_end")
+    if not page_start:
+        return chunk["source"]
+    if page_end and page_end != page_start:
+        return f"{chunk['source']}, páginas {page_start}-{page_end}"
+    return f"{chunk['source']}, página {page_start}"
@@ -0,0 +1,225 @@
+import os
+import asyncio
+import logging
+import importlib.util
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from .metrics import REGISTRY, stats_collector
+
+logger = logging.getLogger(__name__)
+
+# Os serviços importam langchain, openai, pymilvus e as bibliotecas de PDF, que levam segundos
+# para carregar; por isso só são importados na inicialização em segundo plano
+if TYPE_CHECKING:
+    from .document_processor import DocumentProcessor
+    from .ingestion_jobs import IngestionJobQueue
+    from .llm_service import LangGraphLLMService
+    from .rag_pipeline import RAGPipeline
+
+
+class ServiceUnavailable(Exception):
+    """
+    Os serviços ainda não foram inicializados (ou a inicialização está falhando).
+    """
+
+
+class ServiceContainer:
+    """
+    Cria os serviços da API em segundo plano, depois que o servidor já está aceitando conexões.
+
+    Cada serviço é criado uma vez só; se um deles falhar (ex.: Milvus ainda fora do ar), a
+    inicialização é repetida com backoff exponencial, reaproveitando os que já foram criados.
+    """
+
+    def __init__(self):
+        self.vector_store_type = os.getenv("VECTOR_STORE", "milvus").lower()
+        self.backoff_seconds = float(os.getenv("SERVICE_INIT_BACKOFF_SECONDS", "1"))
+        self.max_backoff_seconds = float(
+            os.getenv("SERVICE_INIT_MAX_BACKOFF_SECONDS", "30")
+        )
+        self.readiness_timeout = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+
+        # Um pacote faltando não se resolve com novas tentativas: falha já na subida da API
+        if (
+            self.vector_store_type == "local"
+            and os.getenv("LOCAL_HNSW_MIN_ROWS")
+            and importlib.util.find_spec("hnswlib") is None
+        ):
+            raise ImportError(
+                "LOCAL_HNSW_MIN_ROWS precisa do pacote `hnswlib` instalado (extra `hnsw`)."
+            )
+
+        self.document_processor: Optional["DocumentProcessor"] = None
+        self.vector_store: Any = None
+        self.llm_service: Optional["LangGraphLLMService"] = None
+        self.rag_pipeline: Optional["RAGPipeline"] = None
+        self.ingestion_jobs: Optional["IngestionJobQueue"] = None
+
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self._ready = asyncio.Event()
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _build(self):
+        """
+        Cria os serviços que ainda não existem. Roda numa thread, pois importa módulos pesados
+        e conecta ao vector store de forma bloqueante.
+        """
+
+        from .document_processor import DocumentProcessor
+        from .vector_store import MilvusVectorStore
+        from .local_vector_store import LocalVectorStore
+        from .llm_service import LangGraphLLMService
+        from .rag_pipeline import RAGPipeline
+        from .ingestion_jobs import IngestionJobQueue
+
+        if self.document_processor is None:
+            self.document_processor = DocumentProcessor()
+
+        if self.vector_store is None:
+            # Milvus ou índice local em disco, conforme VECTOR_STORE. As coleções são criadas com a
+            # dimensão e o modelo do backend de embedding configurado
+            vector_store_classes = {
+                "milvus": MilvusVectorStore,
+                "local": LocalVectorStore,
+            }
+            # O Milvus lê os embeddings completos do cache para re-pontuar as buscas nos vetores compactos
+            options = (
+                {"embedding_cache": self.document_processor.embeddings.cache}
+                if self.vector_store_type == "milvus"
+                else {}
+            )
+            self.vector_store = vector_store_classes[self.vector_store_type](
+                dim=self.document_processor.embeddings.dim,
+                model_name=self.document_processor.embeddings.model_name,
+                **options,
+            )
+            # Uso do cache de coleções carregadas, exposto em `/metrics`
+            REGISTRY.add_collector(
+                stats_collector(
+                    "rag_vector_collections",
+                    "Cache de coleções carregadas do vector store",
+                    self.vector_store.collections.stats,
+                    counters=("hits", "misses", "evictions"),
+                )
+            )
+
+        if self.llm_service is None:
+            self.llm_service = LangGraphLLMService()
+
+        if self.rag_pipeline is None:
+            self.rag_pipeline = RAGPipeline(
+                self.document_processor, self.vector_store, self.llm_service
+            )
+
+        if self.ingestion_jobs is None:
+            # Fila de ingestão em segundo plano, persistida em SQLite
+            self.ingestion_jobs = IngestionJobQueue(
+                self.rag_pipeline,
+                os.getenv("INGEST_JOBS_PATH", "cache/jobs.sqlite3") or None,
+                workers=int(os.getenv("INGEST_WORKERS", "2")),
+                progress_flush_seconds=float(
+                    os.getenv("INGEST_PROGRESS_FLUSH_SECONDS", "1")
+                ),
+            )
+
+    async def _initialize(self):
+        """
+        Tenta criar os serviços até conseguir, com backoff exponencial entre as tentativas.
+        """
+
+        delay = self.backoff_seconds
+        while True:
+            self.attempts += 1
+            try:
+                await asyncio.to_thread(self._build)
+                # Sem efeito se a fila já foi iniciada numa tentativa anterior
+                await self.ingestion_jobs.start()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning(
+                    "Falha ao inicializar os serviços (tentativa %d), nova tentativa em %.1fs: %s",
+                    self.attempts,
+                    delay,
+                    self.last_error,
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff_seconds)
+                continue
+
+            self.last_error = None
+            self._ready.set()
+            return
+
+    async def start(self):
+        """
+        Inicia a criação dos serviços em segundo plano e retorna em seguida.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._initialize())
+
+    def _close(self):
+        """
+        Libera os recursos dos serviços já criados: conexões SQLite, coleções carregadas,
+        o pool de processos da extração e as threads do rerank. Roda numa thread.
+        """
+        if self.ingestion_jobs is not None:
+            self.ingestion_jobs.close()
+        if self.rag_pipeline is not None:
+            self.rag_pipeline.close()
+        if self.vector_store is not None:
+            self.vector_store.close()
+        if self.document_processor is not None:
+            self.document_processor.close()
+            self.document_processor.embeddings.close()
+
+    async def stop(self):
+        """
+        Interrompe a inicialização, se ainda em andamento, para a fila de ingestão e libera os recursos dos serviços.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.ingestion_jobs is not None:
+            await self.ingestion_jobs.stop()
+        await asyncio.to_thread(self._close)
+
+    def require(self) -> "ServiceContainer":
+        """
+        Retorna o container se os serviços já estão prontos; senão, lança `ServiceUnavailable`.
+        """
+        if not self.ready:
+            raise ServiceUnavailable(
+                self.last_error or "Os serviços ainda estão sendo inicializados."
+            )
+        return self
+
+    async def check(self) -> Dict[str, Any]:
+        """
+        Verifica se a API pode receber tráfego: serviços criados e vector store respondendo.
+        """
+
+        if not self.ready:
+            return {
+                "ready": False,
+                "status": "starting",
+                "attempts": self.attempts,
+                "error": self.last_error,
+            }
+
+        try:
+            await asyncio.wait_for(
+                asyncio.to_thread(self.vector_store.ping, self.readiness_timeout),
+                timeout=self.readiness_timeout,
+            )
+        except Exception as e:
+            return {
+                "ready": False,
+                "status": "unavailable",
+                "error": f"{type(e).__name__}: {e}",
+            }
+
+        return {"ready": True, "status": "ready"}
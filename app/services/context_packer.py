@@ -0,0 +1,149 @@
+import tiktoken
+from typing import Any, Dict, List, Optional
+
+# Tamanho mínimo de sobreposição, em caracteres, para considerar dois chunks emendados
+MIN_OVERLAP_CHARS = 20
+
+
+def _overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """
+    Retorna o tamanho do maior sufixo de `left` que também é prefixo de `right`.
+    """
+    for size in range(
+        min(len(left), len(right), max_overlap), MIN_OVERLAP_CHARS - 1, -1
+    ):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        model_name: str,
+        context_budget: int = 3000,
+        history_budget: int = 1000,
+        max_overlap_chars: int = 300,
+    ):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Modelos que o tiktoken ainda não conhece usam a codificação mais recente
+            self.encoding = tiktoken.get_encoding("o200k_base")
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.max_overlap_chars = max_overlap_chars
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Conta os tokens de um texto na codificação do modelo.
+
+        Args:
+            text (str): Texto a ser contado.
+        """
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _truncate(self, text: str, max_tokens: int, keep_end: bool = False) -> str:
+        """
+        Corta um texto para caber em `max_tokens`, mantendo o início (ou o fim, com `keep_end`).
+        """
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        return self.encoding.decode(tokens)
+
+    def _remove_overlap(
+        self, text: str, source: str, selected: List[Dict[str, Any]]
+    ) -> Optional[str]:
+        """
+        Remove do texto os trechos já presentes em chunks selecionados do mesmo documento.
+
+        Retorna None se o texto já estiver inteiro em outro chunk.
+        """
+        for chunk in selected:
+            if chunk["source"] != source:
+                continue
+            if text in chunk["text"]:
+                return None
+
+            # Chunk seguinte ao selecionado: começa com o fim dele
+            overlap = _overlap_length(chunk["text"], text, self.max_overlap_chars)
+            if overlap:
+                text = text[overlap:]
+                continue
+
+            # Chunk anterior ao selecionado: termina com o começo dele
+            overlap = _overlap_length(text, chunk["text"], self.max_overlap_chars)
+            if overlap:
+                text = text[:-overlap]
+
+        return text if text.strip() else None
+
+    def pack_context(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Seleciona os chunks de maior score que cabem no orçamento de tokens do contexto.
+
+        Sobreposições entre chunks vizinhos do mesmo documento são removidas antes da contagem,
+        e o último chunk que não cabe inteiro é cortado para aproveitar o orçamento restante.
+
+        Args:
+            chunks (List[Dict[str, Any]]): Chunks recuperados, com "text", "source" e "score".
+        """
+
+        ranked = sorted(
+            chunks, key=lambda chunk: chunk.get("score") or 0.0, reverse=True
+        )
+        selected = []
+        used = 0
+
+        for chunk in ranked:
+            text = self._remove_overlap(chunk["text"], chunk["source"], selected)
+            if text is None:
+                continue
+
+            remaining = self.context_budget - used
+            cost = self.count_tokens(text)
+            if cost > remaining:
+                # Só vale cortar se sobrar um trecho útil
+                if remaining < 50:
+                    break
+                text = self._truncate(text, remaining)
+                cost = remaining
+
+            selected.append({**chunk, "text": text})
+            used += cost
+
+        return selected
+
+    def pack_history(self, chat_history: list) -> list:
+        """
+        Mantém as mensagens mais recentes do histórico que cabem no orçamento de tokens.
+
+        A mensagem mais antiga que não cabe inteira é cortada (mantendo o final dela), e as anteriores são
+        substituídas por um aviso de quantas mensagens foram omitidas.
+
+        Args:
+            chat_history (list): Histórico do chat, da mensagem mais antiga para a mais recente.
+        """
+
+        kept = []
+        used = 0
+
+        for index in range(len(chat_history) - 1, -1, -1):
+            message = chat_history[index]
+            remaining = self.history_budget - used
+            cost = self.count_tokens(message)
+
+            if cost > remaining:
+                if remaining >= 50:
+                    kept.append(self._truncate(message, remaining, keep_end=True))
+                    index -= 1
+                if index >= 0:
+                    kept.append(f"[{index + 1} mensagens anteriores omitidas]")
+                break
+
+            kept.append(message)
+            used += cost
+
+        return list(reversed(kept))
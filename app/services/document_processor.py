@@ -1,96 +1,293 @@
-import pytesseract
-from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+import os
+import asyncio
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Union
 from dotenv import load_dotenv
+from .chunking import Chunk, PageAwareChunker, create_text_splitter
+from .embedding_service import EmbeddingService
+from .document_source import DocumentSource
+from .metrics import CHUNKS, PAGES, observe_stage, timed
+from .pdf_extraction import (
+    ExtractedPage,
+    OCREngine,
+    PageRange,
+    TextExtractor,
+    count_pages,
+    extract_page_range,
+)
 
 load_dotenv()
 
 
 class DocumentProcessor:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
+    def __init__(self, embeddings: Optional[EmbeddingService] = None):
+        self.embeddings = embeddings or EmbeddingService()
+        # Tamanho dos chunks em caracteres ou, com CHUNK_UNIT=tokens, em tokens do tiktoken
+        self.chunk_unit = os.getenv("CHUNK_UNIT", "chars").lower()
+        self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "200"))
+        self.text_splitter = create_text_splitter(
+            chunk_size=int(os.getenv("CHUNK_SIZE", "1000")),
+            chunk_overlap=self.chunk_overlap,
+            unit=self.chunk_unit,
+            encoding_name=os.getenv("CHUNK_TOKEN_ENCODING", "cl100k_base"),
+        )
+        # Sobreposição em caracteres; em tokens ela não tem tamanho fixo
+        self.chunk_overlap_chars = (
+            self.chunk_overlap if self.chunk_unit == "chars" else 0
+        )
+        # Tamanho do buffer de texto acumulado antes de cada divisão em chunks no modo streaming
+        self.stream_buffer_chars = int(os.getenv("CHUNK_STREAM_BUFFER_CHARS", "8000"))
+
+        # Paralelismo da extração: número de processos e páginas por tarefa
+        self.extraction_workers = int(
+            os.getenv("PDF_EXTRACTION_WORKERS", os.cpu_count() or 1)
+        )
+        self.pages_per_task = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+        self._extraction_pool = None
+
+        # Backend da extração de texto e critérios para mandar uma página ao OCR
+        self.text_extractor = TextExtractor(
+            backend=os.getenv("PDF_EXTRACTION_BACKEND", "auto").lower(),
+            ocr_min_chars=int(os.getenv("OCR_MIN_CHARS", "50")),
+            ocr_min_text_quality=float(os.getenv("OCR_MIN_TEXT_QUALITY", "0.6")),
+            ocr_min_image_coverage=float(os.getenv("OCR_MIN_IMAGE_COVERAGE", "0.5")),
+            table_min_rulings=int(os.getenv("PDF_TABLE_MIN_RULINGS", "8")),
+        )
+
+        # OCR das páginas digitalizadas
+        self.ocr_engine = OCREngine(
+            dpi=int(os.getenv("OCR_DPI", "200")),
+            grayscale=os.getenv("OCR_GRAYSCALE", "true").lower() == "true",
+            workers=int(os.getenv("OCR_WORKERS", "2")),
+            lang=os.getenv("OCR_LANG") or None,
         )
 
-    async def extract_text_from_pdf(self, file_path: str) -> str:
+    def _get_extraction_pool(self) -> ProcessPoolExecutor:
         """
-        Extrai o texto de um documento PDF, também usando OCR se necessário.
+        Retorna o pool de processos da extração, criando-o no primeiro uso.
+        """
+
+        if self._extraction_pool is None:
+            # "spawn" evita herdar threads e conexões do servidor nos processos filhos
+            self._extraction_pool = ProcessPoolExecutor(
+                max_workers=self.extraction_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._extraction_pool
+
+    def close(self):
+        """
+        Encerra o pool de processos da extração, cancelando os intervalos que ainda não começaram.
+        """
+        if self._extraction_pool is not None:
+            self._extraction_pool.shutdown(wait=True, cancel_futures=True)
+            self._extraction_pool = None
+
+    def _record_page_range(self, page_range: PageRange) -> List[ExtractedPage]:
+        """
+        Registra nas métricas o tempo e as páginas de um intervalo extraído e retorna as páginas.
 
         Args:
-            file_path (str): Caminho para o documento PDF.
+            page_range (PageRange): Resultado de `extract_page_range`.
         """
+        observe_stage("pdf_extract", page_range.extract_seconds)
+        if page_range.ocr_pages:
+            observe_stage("ocr", page_range.ocr_seconds)
+        backends = Counter(page.backend for page in page_range.pages)
+        for backend, count in backends.items():
+            PAGES.inc(count, method=backend)
+        return page_range.pages
 
-        pdf = PdfReader(file_path)
-        text = ""
+    async def count_pages(self, document: Union[str, DocumentSource]) -> int:
+        """
+        Retorna o número de páginas de um documento PDF.
+
+        Args:
+            document (Union[str, DocumentSource]): Caminho para o documento PDF ou o documento já carregado.
+        """
+        return await asyncio.to_thread(
+            count_pages, DocumentSource.of(document).document
+        )
+
+    async def iter_extracted_pages(
+        self, document: Union[str, DocumentSource]
+    ) -> AsyncIterator[ExtractedPage]:
+        """
+        Extrai cada página de um documento PDF, entregando as páginas em ordem conforme ficam prontas,
+        junto com o backend que produziu o texto.
+
+        Com mais de um worker configurado, os intervalos de páginas são distribuídos
+        entre os processos do pool e o OCR de cada página roda em paralelo. No máximo
+        2x workers intervalos ficam em andamento, para não acumular páginas em memória.
+        Documentos gravados em disco pelo spill vão para os workers só pelo caminho; os em
+        memória vão junto com cada intervalo, o que o limite do spill mantém pequeno.
+
+        Args:
+            document (Union[str, DocumentSource]): Caminho para o documento PDF ou o documento já carregado.
+        """
+
+        # Conteúdo em memória ou caminho do arquivo, que é o que vai para os workers
+        document = DocumentSource.of(document).document
+        total_pages = await asyncio.to_thread(count_pages, document)
+        page_ranges = [
+            (first_page, min(first_page + self.pages_per_task - 1, total_pages))
+            for first_page in range(1, total_pages + 1, self.pages_per_task)
+        ]
+
+        if self.extraction_workers <= 1 or total_pages <= self.pages_per_task:
+            for first_page, last_page in page_ranges:
+                page_range = await asyncio.to_thread(
+                    extract_page_range,
+                    document,
+                    first_page,
+                    last_page,
+                    self.text_extractor,
+                    self.ocr_engine,
+                )
+                for page in self._record_page_range(page_range):
+                    yield page
+            return
 
-        page_number = 1
-        for page in pdf.pages:
-            page_text = page.extract_text()
+        loop = asyncio.get_running_loop()
+        pool = self._get_extraction_pool()
+        pending = deque()
 
-            # Faz o OCR caso não tenha texto
-            if not page_text or len(page_text.strip()) < 50:
-                # Converte a página para imagem e aplica o OCR
-                images = convert_from_path(
-                    file_path,
-                    first_page=page_number,
-                    last_page=page_number,
+        for first_page, last_page in page_ranges:
+            pending.append(
+                loop.run_in_executor(
+                    pool,
+                    extract_page_range,
+                    document,
+                    first_page,
+                    last_page,
+                    self.text_extractor,
+                    self.ocr_engine,
                 )
-                for img in images:
-                    page_text = pytesseract.image_to_string(img)
+            )
 
-            text += page_text + "\n\n"
-            page_number += 1
+            # Entrega o intervalo mais antigo antes de enviar mais trabalho ao pool
+            if len(pending) >= self.extraction_workers * 2:
+                for page in self._record_page_range(await pending.popleft()):
+                    yield page
 
-        return text
+        while pending:
+            for page in self._record_page_range(await pending.popleft()):
+                yield page
 
-    async def chunk_text(
-        self, text: str, metadata: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
+    async def iter_pages(
+        self, document: Union[str, DocumentSource]
+    ) -> AsyncIterator[str]:
+        """
+        Extrai o texto de cada página de um documento PDF, entregando as páginas em ordem conforme ficam prontas.
+
+        Args:
+            document (Union[str, DocumentSource]): Caminho para o documento PDF ou o documento já carregado.
+        """
+        async for page in self.iter_extracted_pages(document):
+            yield page.text
+
+    async def extract_pages_from_pdf(
+        self, document: Union[str, DocumentSource]
+    ) -> List[str]:
+        """
+        Extrai o texto de cada página de um documento PDF, na ordem das páginas.
+
+        Args:
+            document (Union[str, DocumentSource]): Caminho para o documento PDF ou o documento já carregado.
+        """
+        return [page_text async for page_text in self.iter_pages(document)]
+
+    async def extract_text_from_pdf(self, document: Union[str, DocumentSource]) -> str:
+        """
+        Extrai o texto de um documento PDF, também usando OCR se necessário.
+
+        Args:
+            document (Union[str, DocumentSource]): Caminho para o documento PDF ou o documento já carregado.
+        """
+
+        pages = await self.extract_pages_from_pdf(document)
+        return "".join(page_text + "\n\n" for page_text in pages)
+
+    async def chunk_text(self, text: str, source: str) -> List[Chunk]:
         """
         Separa o texto em chunks.
 
         Args:
             text (str): Texto a ser chunkenizado.
-            metadata (Dict[str, Any]): Metadata do chunk.
+            source (str): Nome do documento de origem do chunk.
         """
-        chunks = self.text_splitter.create_documents([text], [metadata])
-        return [
-            {"text": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks
-        ]
+        chunker = PageAwareChunker(
+            self.text_splitter,
+            source,
+            buffer_chars=0,
+            chunk_overlap=self.chunk_overlap_chars,
+        )
+        return chunker.add_page(text) + chunker.finish()
+
+    async def iter_chunks(
+        self, pages: AsyncIterator[str], source: str
+    ) -> AsyncIterator[Chunk]:
+        """
+        Separa o texto em chunks conforme as páginas chegam, sem montar o texto inteiro do documento.
+
+        Cada chunk registra as páginas onde começa e termina e sua posição no texto extraído. O último
+        chunk de cada bloco pode continuar na página seguinte, então ele volta para o buffer e só é
+        emitido depois que o texto seguinte chegar.
 
-    async def embed_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        Args:
+            pages (AsyncIterator[str]): Texto das páginas, na ordem, como em `DocumentProcessor.iter_pages`.
+            source (str): Nome do documento de origem dos chunks.
+        """
+
+        chunker = PageAwareChunker(
+            self.text_splitter,
+            source,
+            buffer_chars=self.stream_buffer_chars,
+            chunk_overlap=self.chunk_overlap_chars,
+        )
+        async for page_text in pages:
+            with timed("chunk"):
+                chunks = chunker.add_page(page_text)
+            CHUNKS.inc(len(chunks))
+            for chunk in chunks:
+                yield chunk
+
+        with timed("chunk"):
+            chunks = chunker.finish()
+        CHUNKS.inc(len(chunks))
+        for chunk in chunks:
+            yield chunk
+
+    async def embed_chunks(self, chunks: List[Chunk]) -> List[Chunk]:
         """
         Gera os embeddings para os chunks.
 
         Args:
-            chunks (List[Dict[str, Any]]): Lista de chunks gerados com `DocumentProcessor.chunk_text`
+            chunks (List[Chunk]): Lista de chunks gerados com `DocumentProcessor.iter_chunks`
         """
-        texts = [chunk["text"] for chunk in chunks]
-        embeddings = self.embeddings.embed_documents(texts)
+        texts = [chunk.text for chunk in chunks]
+        embeddings = await self.embeddings.embed_documents(texts)
 
         for i, chunk in enumerate(chunks):
-            chunk["embedding"] = embeddings[i]
+            chunk.embedding = embeddings[i]
 
         return chunks
 
     async def process_document(
-        self, file_path: str, filename: str
-    ) -> List[Dict[str, Any]]:
+        self, document: Union[str, DocumentSource], filename: str
+    ) -> List[Chunk]:
         """
         Processa um documento PDF.
 
         Args:
-            file_path (str): Caminho para o documento.
+            document (Union[str, DocumentSource]): Caminho para o documento ou o documento já carregado.
             filename (str): Nome do documento para metadata do chunk
         """
-        text = await self.extract_text_from_pdf(file_path)
-        metadata = {"source": filename}
-        chunks = await self.chunk_text(text, metadata)
+        chunks = [
+            chunk
+            async for chunk in self.iter_chunks(self.iter_pages(document), filename)
+        ]
         embedded_chunks = await self.embed_chunks(chunks)
         return embedded_chunks
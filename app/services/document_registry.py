@@ -0,0 +1,215 @@
+import os
+import json
+import mmap
+import sqlite3
+import hashlib
+import threading
+from typing import List, NamedTuple, Optional, Set, Tuple, Union
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    session_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    chunk_ids TEXT NOT NULL,
+    chunk_pages TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (session_id, source)
+)
+"""
+
+FINGERPRINT_INDEX = """
+CREATE INDEX IF NOT EXISTS documents_fingerprint ON documents (session_id, fingerprint)
+"""
+
+
+class DocumentRecord(NamedTuple):
+    fingerprint: str
+    chunk_ids: List[str]
+    # Páginas (início, fim) de cada chunk, na ordem de `chunk_ids`
+    chunk_pages: List[Tuple[int, int]]
+
+
+def document_fingerprint(document: Union[str, bytes]) -> str:
+    """
+    Calcula o hash do conteúdo de um documento, em memória ou em disco (lido via mmap).
+
+    Args:
+        document (Union[str, bytes]): Caminho para o documento ou seu conteúdo.
+    """
+    if isinstance(document, (bytes, bytearray)):
+        return hashlib.sha256(document).hexdigest()
+
+    if os.path.getsize(document) == 0:
+        return hashlib.sha256(b"").hexdigest()
+
+    with (
+        open(document, "rb") as file,
+        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer,
+    ):
+        return hashlib.sha256(buffer).hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    """
+    Calcula o hash do conteúdo de um chunk. As páginas ficam de fora, para uma página inserida
+    no documento não mudar o ID dos chunks seguintes; elas são só metadados do chunk.
+
+    Args:
+        text (str): Texto do chunk.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, content_hash: str, occurrence: int) -> str:
+    """
+    Gera o ID determinístico de um chunk a partir do documento e do conteúdo do chunk.
+
+    Como o ID não depende da posição, um trecho inserido ou removido no documento não muda
+    o ID dos chunks seguintes. `occurrence` diferencia chunks repetidos no mesmo documento.
+    O ID tem 36 caracteres, o mesmo tamanho de um UUID, para caber no schema da coleção.
+
+    Args:
+        source (str): Nome do documento.
+        content_hash (str): Hash do conteúdo do chunk, de `chunk_hash`.
+        occurrence (int): Quantos chunks com o mesmo conteúdo vieram antes no documento.
+    """
+    return f"{document_id(source)}-{content_hash[:16]}-{occurrence:06d}"
+
+
+def document_id(source: str) -> str:
+    """
+    Prefixo dos IDs dos chunks de um documento, derivado do nome.
+
+    Args:
+        source (str): Nome do documento.
+    """
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+
+class DocumentRegistry:
+    def __init__(self, path: Optional[str] = None):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Sem caminho, o registro fica só em memória
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        # A pipeline usa o registro em threads, e os workers da fila de ingestão rodam em paralelo
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        # Bancos criados antes da coluna chunk_pages
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(documents)")}
+        if "chunk_pages" not in columns:
+            self._db.execute(
+                "ALTER TABLE documents ADD COLUMN chunk_pages TEXT NOT NULL DEFAULT '[]'"
+            )
+        self._db.execute(FINGERPRINT_INDEX)
+        self._db.commit()
+
+    def get(self, session_id: str, source: str) -> Optional[DocumentRecord]:
+        """
+        Retorna o registro de um documento já indexado na sessão, se existir.
+
+        Args:
+            session_id (str): ID da sessão (coleção do Milvus).
+            source (str): Nome do documento.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint, chunk_ids, chunk_pages FROM documents WHERE session_id = ? AND source = ?",
+                (session_id, source),
+            ).fetchone()
+        if row is None:
+            return None
+        return DocumentRecord(
+            fingerprint=row[0],
+            chunk_ids=json.loads(row[1]),
+            chunk_pages=[tuple(pages) for pages in json.loads(row[2])],
+        )
+
+    def find_source(self, session_id: str, fingerprint: str) -> Optional[str]:
+        """
+        Retorna o nome de um documento da sessão com o mesmo conteúdo, se existir.
+
+        Args:
+            session_id (str): ID da sessão (coleção do Milvus).
+            fingerprint (str): Hash do conteúdo do documento, de `document_fingerprint`.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT source FROM documents WHERE session_id = ? AND fingerprint = ? LIMIT 1",
+                (session_id, fingerprint),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def shared_chunk_ids(
+        self, session_id: str, source: str, chunk_ids: List[str]
+    ) -> Set[str]:
+        """
+        Retorna quais dos chunks ainda são usados por outros documentos da sessão, como um PDF
+        reenviado com outro nome que reaproveita os chunks do original.
+
+        Args:
+            session_id (str): ID da sessão (coleção do Milvus).
+            source (str): Nome do documento que está deixando de usar os chunks.
+            chunk_ids (List[str]): IDs dos chunks a verificar.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT ids.value FROM documents, json_each(documents.chunk_ids) AS ids WHERE documents.session_id = ? AND documents.source != ? AND ids.value IN (SELECT value FROM json_each(?))",
+                (session_id, source, json.dumps(chunk_ids)),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def borrowed_chunk_ids(self, session_id: str, source: str) -> Set[str]:
+        """
+        Retorna os chunks gerados com o nome do documento que estão registrados para outros documentos
+        da sessão, como os de um PDF reenviado com outro nome.
+
+        Args:
+            session_id (str): ID da sessão (coleção do Milvus).
+            source (str): Nome do documento.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT ids.value FROM documents, json_each(documents.chunk_ids) AS ids WHERE documents.session_id = ? AND documents.source != ? AND ids.value LIKE ?",
+                (session_id, source, f"{document_id(source)}-%"),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def put(
+        self,
+        session_id: str,
+        source: str,
+        fingerprint: str,
+        chunk_ids: List[str],
+        chunk_pages: List[Tuple[int, int]],
+    ):
+        """
+        Registra (ou atualiza) um documento indexado na sessão.
+
+        Args:
+            session_id (str): ID da sessão (coleção do Milvus).
+            source (str): Nome do documento.
+            fingerprint (str): Hash do conteúdo do documento, de `document_fingerprint`.
+            chunk_ids (List[str]): ID de cada chunk, na ordem dos chunks.
+            chunk_pages (List[Tuple[int, int]]): Páginas (início, fim) de cada chunk, na mesma ordem.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (session_id, source, fingerprint, chunk_ids, chunk_pages) VALUES (?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    source,
+                    fingerprint,
+                    json.dumps(chunk_ids),
+                    json.dumps(chunk_pages),
+                ),
+            )
+            self._db.commit()
+
+    def close(self):
+        """
+        Fecha a conexão com o SQLite.
+        """
+        with self._lock:
+            self._db.close()
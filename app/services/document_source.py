@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional, Union
+
+
+class DocumentSource:
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        path: Optional[str] = None,
+        owns_path: bool = False,
+    ):
+        if (data is None) == (path is None):
+            raise ValueError("Informe o conteúdo ou o caminho do documento.")
+
+        self.data = data
+        self.path = path
+        # Arquivos criados pelo spill são removidos no `close`; os do usuário, não
+        self.owns_path = owns_path
+
+    @classmethod
+    def of(cls, document: Union[str, "DocumentSource"]) -> "DocumentSource":
+        """
+        Aceita um caminho ou um `DocumentSource` já criado.
+
+        Args:
+            document (Union[str, DocumentSource]): Caminho para o documento ou o próprio `DocumentSource`.
+        """
+        if isinstance(document, DocumentSource):
+            return document
+        return cls(path=document)
+
+    @classmethod
+    def from_upload(
+        cls, fileobj: BinaryIO, spill_threshold: int, spill_dir: str
+    ) -> "DocumentSource":
+        """
+        Lê um upload para a memória, gravando em disco só se passar do limite de tamanho.
+
+        Args:
+            fileobj (BinaryIO): Arquivo enviado, como o `UploadFile.file` do FastAPI.
+            spill_threshold (int): Tamanho máximo, em bytes, mantido em memória.
+            spill_dir (str): Diretório onde os documentos grandes são gravados.
+        """
+
+        head = fileobj.read(spill_threshold + 1)
+        if len(head) <= spill_threshold:
+            return cls(data=head)
+
+        with tempfile.NamedTemporaryFile(
+            delete=False, suffix=".pdf", dir=spill_dir
+        ) as spill_file:
+            spill_file.write(head)
+            del head
+            shutil.copyfileobj(fileobj, spill_file)
+
+        return cls(path=spill_file.name, owns_path=True)
+
+    @property
+    def document(self) -> Union[str, bytes]:
+        """
+        Conteúdo em memória ou caminho do arquivo, no formato aceito pelas funções de `pdf_extraction`.
+        """
+        return self.data if self.data is not None else self.path
+
+    def close(self):
+        """
+        Libera o documento, removendo o arquivo do spill se houver.
+        """
+        self.data = None
+        if self.owns_path and self.path and os.path.exists(self.path):
+            os.unlink(self.path)
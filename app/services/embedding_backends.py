@@ -0,0 +1,211 @@
+import os
+import asyncio
+from abc import ABC, abstractmethod
+import openai
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Type
+from langchain_openai import OpenAIEmbeddings
+
+# Dimensão dos modelos de embedding da OpenAI
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Instruções do INSTRUCTOR para indexar trechos e para buscar por eles
+INSTRUCTOR_DOCUMENT_INSTRUCTION = "Represent the document for retrieval:"
+INSTRUCTOR_QUERY_INSTRUCTION = (
+    "Represent the question for retrieving supporting documents:"
+)
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface dos backends de embedding usados pelo `EmbeddingService`.
+
+    Cada backend informa o identificador do modelo (usado nas chaves do cache e no schema da coleção)
+    e a dimensão dos vetores que gera.
+    """
+
+    model_name: str
+    dim: int
+    # Embeddings de perguntas podem diferir dos de documentos (ex.: modelos com instrução),
+    # então têm um identificador próprio no cache
+    query_model_name: str
+    # Erros transitórios que valem uma nova tentativa
+    retryable_errors: Tuple[Type[BaseException], ...] = ()
+
+    @abstractmethod
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de um lote de textos.
+
+        Args:
+            texts (List[str]): Textos a serem embedados.
+        """
+
+    @abstractmethod
+    async def embed_query(self, text: str) -> List[float]:
+        """
+        Gera o embedding de uma pergunta.
+
+        Args:
+            text (str): Mensagem do usuário.
+        """
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de um lote de perguntas.
+
+        Args:
+            texts (List[str]): Mensagens dos usuários.
+        """
+        return list(await asyncio.gather(*[self.embed_query(text) for text in texts]))
+
+    def close(self):
+        """
+        Libera os recursos do backend, como threads e modelos carregados. Por padrão, não faz nada.
+        """
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    retryable_errors = (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+    def __init__(self, model_name: Optional[str] = None, dim: Optional[int] = None):
+        # As novas tentativas ficam por conta do serviço, com backoff próprio
+        options = {"max_retries": 0}
+        if model_name:
+            options["model"] = model_name
+        if dim:
+            # Os modelos text-embedding-3 aceitam vetores menores que o padrão
+            options["dimensions"] = dim
+        self.embeddings = OpenAIEmbeddings(**options)
+        self.dim = dim or OPENAI_DIMENSIONS.get(self.embeddings.model, 1536)
+        # Vetores reduzidos não são intercambiáveis com os completos, então a dimensão entra no identificador
+        self.model_name = (
+            f"{self.embeddings.model}:{dim}" if dim else self.embeddings.model
+        )
+        self.query_model_name = self.model_name
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def embed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Na OpenAI, perguntas e documentos usam o mesmo embedding, então vão numa só requisição
+        return await self.embeddings.aembed_documents(texts)
+
+
+class InstructorEmbeddingBackend(EmbeddingBackend):
+    def __init__(
+        self,
+        model_name: str = "hkunlp/instructor-base",
+        batch_size: int = 32,
+        threads: int = 2,
+        device: str = "cpu",
+    ):
+        try:
+            from InstructorEmbedding import INSTRUCTOR
+        except ImportError as e:
+            raise ImportError(
+                "O backend local de embeddings precisa do pacote `instructorembedding` "
+                "(e do `sentence-transformers`) instalado."
+            ) from e
+
+        self.model = INSTRUCTOR(model_name, device=device)
+        self.model_name = model_name
+        self.query_model_name = f"{model_name}#query"
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = max(1, batch_size)
+        # O PyTorch libera o GIL durante a inferência, então os lotes rodam em paralelo nas threads
+        self._executor = ThreadPoolExecutor(max(1, threads))
+
+    def _encode(self, instruction: str, texts: List[str]) -> np.ndarray:
+        """
+        Roda o modelo num lote de textos, devolvendo uma matriz float32 normalizada.
+
+        Args:
+            instruction (str): Instrução do INSTRUCTOR para o tipo de texto.
+            texts (List[str]): Textos do lote.
+        """
+        vectors = self.model.encode(
+            [[instruction, text] for text in texts],
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def _encode_batches(
+        self, instruction: str, texts: List[str]
+    ) -> List[List[float]]:
+        """
+        Divide os textos em lotes e roda os lotes em paralelo no pool de threads.
+
+        Args:
+            instruction (str): Instrução do INSTRUCTOR para o tipo de texto.
+            texts (List[str]): Textos a serem embedados.
+        """
+        loop = asyncio.get_running_loop()
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(self._executor, self._encode, instruction, batch)
+                for batch in batches
+            ]
+        )
+        return np.concatenate(results).tolist() if results else []
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._encode_batches(INSTRUCTOR_DOCUMENT_INSTRUCTION, texts)
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self._encode_batches(INSTRUCTOR_QUERY_INSTRUCTION, texts)
+
+    async def embed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(
+            self._executor, self._encode, INSTRUCTOR_QUERY_INSTRUCTION, [text]
+        )
+        return vectors[0].tolist()
+
+    def close(self):
+        """
+        Encerra o pool de threads da inferência, cancelando os lotes que ainda não começaram.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def create_embedding_backend() -> EmbeddingBackend:
+    """
+    Cria o backend de embedding configurado em EMBEDDING_BACKEND (`openai` ou `local`).
+    """
+
+    backend = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+    model_name = os.getenv("EMBEDDING_MODEL_NAME") or None
+
+    if backend == "openai":
+        dim = os.getenv("EMBEDDING_DIM")
+        return OpenAIEmbeddingBackend(model_name, dim=int(dim) if dim else None)
+
+    if backend == "local":
+        return InstructorEmbeddingBackend(
+            model_name or "hkunlp/instructor-base",
+            batch_size=int(os.getenv("EMBEDDING_LOCAL_BATCH_SIZE", "32")),
+            threads=int(os.getenv("EMBEDDING_LOCAL_THREADS", "2")),
+            device=os.getenv("EMBEDDING_LOCAL_DEVICE", "cpu"),
+        )
+
+    raise ValueError(f"EMBEDDING_BACKEND inválido: {backend}")
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def embedding_key(model: str, text: str) -> str:
+    """
+    Gera a chave do cache a partir do modelo e do texto embedado.
+
+    Args:
+        model (str): Identificador do modelo de embedding.
+        text (str): Texto embedado.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: Optional[str] = None, max_memory_items: int = 10000):
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        # O cache é usado em threads (pelo serviço de embedding e pelas buscas do vector store).
+        # A memória e o disco têm travas separadas, para um acerto em memória não esperar o SQLite
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        # Sem caminho, o cache fica só em memória
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def persistent(self) -> bool:
+        """
+        Indica se o cache grava os embeddings em disco, sobrevivendo a um restart.
+        """
+        return self._db is not None
+
+    def _remember(self, key: str, vector: List[float]):
+        """
+        Guarda um embedding no LRU em memória, descartando o menos usado se necessário.
+        """
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Busca embeddings no cache, primeiro na memória e depois no disco.
+
+        Args:
+            keys (List[str]): Chaves geradas com `embedding_key`.
+        """
+
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+        if self._db is None or not missing:
+            return found
+
+        loaded = {}
+        with self._db_lock:
+            # Consulta em blocos para respeitar o limite de parâmetros do SQLite
+            for i in range(0, len(missing), 500):
+                block = missing[i : i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(block))})",
+                    block,
+                ).fetchall()
+                for key, blob in rows:
+                    loaded[key] = array("f", blob).tolist()
+
+        with self._lock:
+            for key, vector in loaded.items():
+                self._remember(key, vector)
+        found.update(loaded)
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        Armazena embeddings no cache.
+
+        Args:
+            items (Dict[str, List[float]]): Embeddings indexados pela chave de `embedding_key`.
+        """
+
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+
+        if self._db is not None and items:
+            rows = [
+                (key, array("f", vector).tobytes()) for key, vector in items.items()
+            ]
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    rows,
+                )
+                self._db.commit()
+
+    def close(self):
+        """
+        Fecha a conexão com o SQLite; o cache continua funcionando só em memória.
+        """
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
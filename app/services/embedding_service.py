@@ -0,0 +1,188 @@
+import os
+import random
+import asyncio
+from typing import Awaitable, Callable, List, Optional, TypeVar
+from dotenv import load_dotenv
+from .embedding_backends import EmbeddingBackend, create_embedding_backend
+from .embedding_cache import EmbeddingCache, embedding_key
+from .metrics import CACHE_REQUESTS, EMBEDDED_TEXTS, IN_FLIGHT, timed
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+class EmbeddingService:
+    def __init__(self, backend: Optional[EmbeddingBackend] = None):
+        # OpenAI ou modelo local, conforme EMBEDDING_BACKEND
+        self.backend = backend or create_embedding_backend()
+        self.dim = self.backend.dim
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+        self.max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        self.max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+        self.backoff_seconds = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", "1.0"))
+        # Limita as requisições simultâneas ao backend de todos os uploads e perguntas juntos
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Cache de embeddings por (modelo, texto), em memória e em disco
+        self.model_name = self.backend.model_name
+        self.cache = EmbeddingCache(
+            path=os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3") or None,
+            max_memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000")),
+        )
+
+    def close(self):
+        """
+        Fecha o cache de embeddings em disco e libera os recursos do backend.
+        """
+        self.cache.close()
+        self.backend.close()
+
+    async def _call_with_retry(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Executa uma chamada ao backend, tentando novamente com backoff exponencial em erros transitórios.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Função que cria a coroutine da chamada.
+        """
+
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    return await call()
+            except self.backend.retryable_errors:
+                if attempt >= self.max_retries:
+                    raise
+
+                # Backoff exponencial com jitter para não sincronizar as tentativas
+                delay = self.backoff_seconds * (2**attempt)
+                await asyncio.sleep(delay + random.uniform(0, self.backoff_seconds))
+                attempt += 1
+
+    async def _call_backend(
+        self, kind: str, texts: List[str], call: Callable[[], Awaitable[T]]
+    ) -> T:
+        """
+        Chama o backend com novas tentativas, registrando a duração e o número de textos nas métricas.
+
+        Args:
+            kind (str): "document" ou "query".
+            texts (List[str]): Textos enviados na chamada.
+            call (Callable[[], Awaitable[T]]): Função que cria a coroutine da chamada.
+        """
+        EMBEDDED_TEXTS.inc(len(texts), kind=kind)
+        with IN_FLIGHT.track_in_progress(operation="embedding"), timed("embed"):
+            return await self._call_with_retry(call)
+
+    async def _embed_batches(
+        self,
+        texts: List[str],
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        kind: str,
+    ) -> List[List[float]]:
+        """
+        Envia os textos para o backend em lotes concorrentes.
+
+        Args:
+            texts (List[str]): Textos a serem embedados.
+            embed (Callable[[List[str]], Awaitable[List[List[float]]]]): Método do backend que embeda um lote.
+            kind (str): "document" ou "query", para as métricas.
+        """
+
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+
+        results = await asyncio.gather(
+            *[
+                self._call_backend(kind, batch, lambda batch=batch: embed(batch))
+                for batch in batches
+            ]
+        )
+
+        return [embedding for batch in results for embedding in batch]
+
+    async def _embed_cached(
+        self,
+        texts: List[str],
+        model_name: str,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        kind: str,
+    ) -> List[List[float]]:
+        """
+        Gera os embeddings de uma lista de textos, consultando o cache antes de chamar o backend.
+
+        Args:
+            texts (List[str]): Textos a serem embedados.
+            model_name (str): Identificador do modelo nas chaves do cache.
+            embed (Callable[[List[str]], Awaitable[List[List[float]]]]): Método do backend que embeda um lote.
+            kind (str): "document" ou "query", para as métricas.
+        """
+
+        keys = [embedding_key(model_name, text) for text in texts]
+        # Leituras e escritas do cache podem ir ao SQLite, então rodam fora do event loop
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+
+        # Só os textos inéditos vão para o backend, sem repetição
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing[key] = text
+
+        hits = sum(key in cached for key in keys)
+        CACHE_REQUESTS.inc(hits, cache="embedding", result="hit")
+        CACHE_REQUESTS.inc(len(keys) - hits, cache="embedding", result="miss")
+
+        if missing:
+            embeddings = await self._embed_batches(list(missing.values()), embed, kind)
+            computed = dict(zip(missing.keys(), embeddings))
+            await asyncio.to_thread(self.cache.put_many, computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de uma lista de textos, consultando o cache antes de chamar o backend.
+
+        Args:
+            texts (List[str]): Textos a serem embedados.
+        """
+        return await self._embed_cached(
+            texts, self.model_name, self.backend.embed_documents, "document"
+        )
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de várias mensagens de usuários em lotes, consultando o cache antes de chamar o backend.
+
+        Args:
+            texts (List[str]): Mensagens dos usuários.
+        """
+        return await self._embed_cached(
+            texts, self.backend.query_model_name, self.backend.embed_queries, "query"
+        )
+
+    async def embed_query(self, text: str) -> List[float]:
+        """
+        Gera o embedding da mensagem do usuário, consultando o cache antes de chamar o backend.
+
+        Args:
+            text (str): Mensagem do usuário.
+        """
+
+        key = embedding_key(self.backend.query_model_name, text)
+        cached = await asyncio.to_thread(self.cache.get_many, [key])
+        if key in cached:
+            CACHE_REQUESTS.inc(cache="embedding", result="hit")
+            return cached[key]
+        CACHE_REQUESTS.inc(cache="embedding", result="miss")
+
+        embedding = await self._call_backend(
+            "query", [text], lambda: self.backend.embed_query(text)
+        )
+        await asyncio.to_thread(self.cache.put_many, {key: embedding})
+
+        return embedding
@@ -0,0 +1,201 @@
+import math
+import numpy as np
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+
+class IndexProfile(NamedTuple):
+    index_type: str
+    # Parâmetro de busca que troca latência por recall (None se a busca é sempre exata)
+    search_param: Optional[str]
+    # Valores testados pelo ajuste automático, do mais rápido ao mais preciso
+    search_values: Sequence[int]
+    default_search_value: Optional[int]
+
+
+INDEX_PROFILES = {
+    "FLAT": IndexProfile("FLAT", None, (), None),
+    "HNSW": IndexProfile("HNSW", "ef", (16, 32, 64, 128, 256, 512), 64),
+    "IVF_FLAT": IndexProfile(
+        "IVF_FLAT", "nprobe", (1, 2, 4, 8, 16, 32, 64, 128, 256), 16
+    ),
+    "IVF_PQ": IndexProfile("IVF_PQ", "nprobe", (1, 2, 4, 8, 16, 32, 64, 128, 256), 32),
+    # Variantes com os vetores do índice quantizados em int8 (MILVUS_VECTOR_TYPE=sq8)
+    "HNSW_SQ": IndexProfile("HNSW_SQ", "ef", (16, 32, 64, 128, 256, 512), 64),
+    "IVF_SQ8": IndexProfile(
+        "IVF_SQ8", "nprobe", (1, 2, 4, 8, 16, 32, 64, 128, 256), 16
+    ),
+    "DISKANN": IndexProfile("DISKANN", "search_list", (16, 32, 64, 128, 256, 512), 100),
+}
+
+# Índice quantizado em int8 equivalente a cada índice; os demais já são exatos ou comprimidos
+SQ8_INDEX_TYPES = {"HNSW": "HNSW_SQ", "IVF_FLAT": "IVF_SQ8"}
+
+
+def choose_index_type(
+    num_rows: int,
+    flat_max_rows: int,
+    hnsw_max_rows: int,
+    large_index_type: str = "DISKANN",
+) -> str:
+    """
+    Escolhe o tipo de índice pelo tamanho da coleção: busca exata nas pequenas, HNSW nas médias
+    e um índice mais econômico em memória nas grandes.
+
+    Args:
+        num_rows (int): Número de vetores da coleção.
+        flat_max_rows (int): Abaixo desse tamanho, a busca exata (FLAT) é rápida o bastante.
+        hnsw_max_rows (int): Abaixo desse tamanho, usa HNSW.
+        large_index_type (str): Índice das coleções maiores (DISKANN, IVF_PQ ou IVF_FLAT).
+    """
+    if num_rows < flat_max_rows:
+        return "FLAT"
+    if num_rows < hnsw_max_rows:
+        return "HNSW"
+    return large_index_type
+
+
+def build_index_params(
+    index_type: str,
+    num_rows: int,
+    dim: int,
+    hnsw_m: int,
+    hnsw_ef_construction: int,
+    scalar_quantization: bool = False,
+) -> Dict[str, Any]:
+    """
+    Monta os parâmetros de criação do índice no Milvus.
+
+    Args:
+        index_type (str): Tipo do índice, uma das chaves de `INDEX_PROFILES`.
+        num_rows (int): Número de vetores da coleção, usado para dimensionar as listas do IVF.
+        dim (int): Dimensão dos vetores, usada para escolher o número de subvetores do PQ.
+        hnsw_m (int): Número de conexões por nó do HNSW.
+        hnsw_ef_construction (int): Tamanho da lista de candidatos na construção do HNSW.
+        scalar_quantization (bool): Troca o HNSW e o IVF_FLAT pelas variantes quantizadas em int8.
+    """
+
+    if scalar_quantization:
+        index_type = SQ8_INDEX_TYPES.get(index_type, index_type)
+
+    params = {}
+    if index_type in ("HNSW", "HNSW_SQ"):
+        params = {"M": hnsw_m, "efConstruction": hnsw_ef_construction}
+        if index_type == "HNSW_SQ":
+            params["sq_type"] = "SQ8"
+    elif index_type in ("IVF_FLAT", "IVF_PQ", "IVF_SQ8"):
+        # Regra usual: em torno de 4 * sqrt(n) listas
+        params = {"nlist": min(65536, max(64, int(4 * math.sqrt(max(num_rows, 1)))))}
+        if index_type == "IVF_PQ":
+            # O número de subvetores precisa dividir a dimensão
+            params["m"] = max(m for m in range(1, 65) if dim % m == 0)
+            params["nbits"] = 8
+
+    return {"metric_type": "COSINE", "index_type": index_type, "params": params}
+
+
+def build_search_params(
+    index_type: str, limit: int, value: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Monta os parâmetros de busca, respeitando os mínimos de cada índice para o `limit` pedido.
+
+    Args:
+        index_type (str): Tipo do índice da coleção.
+        limit (int): Quantos vetores a busca retorna.
+        value (int, opcional): Valor ajustado do parâmetro de busca; sem ele, usa o padrão do perfil.
+    """
+
+    profile = INDEX_PROFILES.get(index_type, INDEX_PROFILES["FLAT"])
+    if profile.search_param is None:
+        return {"metric_type": "COSINE", "params": {}}
+
+    value = value or profile.default_search_value
+    # ef e search_list não podem ser menores que o número de resultados
+    if profile.search_param in ("ef", "search_list"):
+        value = max(value, limit)
+
+    return {"metric_type": "COSINE", "params": {profile.search_param: value}}
+
+
+def truncate_vectors(vectors: np.ndarray, dim: int) -> np.ndarray:
+    """
+    Mantém só as `dim` primeiras dimensões de cada vetor e renormaliza, como nos embeddings
+    treinados com Matryoshka (ex.: text-embedding-3). Vetores já na dimensão pedida voltam sem alteração.
+
+    Args:
+        vectors (np.ndarray): Matriz (vetores x dimensão) de embeddings.
+        dim (int): Número de dimensões mantidas.
+    """
+    if vectors.shape[1] <= dim:
+        return vectors
+    vectors = vectors[:, :dim]
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def as_float32(vector: Any) -> np.ndarray:
+    """
+    Converte um vetor lido do Milvus para float32. Vetores FLOAT16_VECTOR voltam como bytes
+    (ou uma lista com um único bytes, conforme a versão do pymilvus).
+
+    Args:
+        vector (Any): Valor do campo de embedding de uma linha.
+    """
+    if isinstance(vector, list) and len(vector) == 1:
+        vector = vector[0]
+    if isinstance(vector, (bytes, bytearray)):
+        return np.frombuffer(vector, dtype=np.float16).astype(np.float32)
+    return np.asarray(vector, dtype=np.float32)
+
+
+def exact_top_k(
+    queries: np.ndarray, batches: Iterable[Sequence[Dict[str, Any]]], k: int
+) -> List[List[str]]:
+    """
+    Calcula os k vizinhos exatos (cosseno) de cada consulta, percorrendo os vetores em lotes.
+
+    Args:
+        queries (np.ndarray): Matriz (consultas x dimensão) de embeddings.
+        batches (Iterable[Sequence[Dict[str, Any]]]): Lotes de linhas com "id" e "embedding".
+        k (int): Quantos vizinhos retornar por consulta.
+    """
+
+    queries = queries / np.maximum(
+        np.linalg.norm(queries, axis=1, keepdims=True), 1e-12
+    )
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=object)
+
+    for batch in batches:
+        if not batch:
+            continue
+        vectors = np.stack([as_float32(row["embedding"]) for row in batch])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        ids = np.asarray([row["id"] for row in batch], dtype=object)
+
+        # Junta os melhores até agora com o lote e mantém só os k maiores por consulta
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        candidates = np.concatenate(
+            [best_ids, np.broadcast_to(ids, (len(queries), len(ids)))], axis=1
+        )
+        keep = min(k, scores.shape[1])
+        top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(candidates, top, axis=1)
+
+    return [list(row) for row in best_ids]
+
+
+def recall_at_k(approximate: List[List[str]], exact: List[List[str]]) -> float:
+    """
+    Fração média dos vizinhos exatos encontrados pela busca aproximada.
+
+    Args:
+        approximate (List[List[str]]): IDs retornados pela busca aproximada, por consulta.
+        exact (List[List[str]]): IDs dos vizinhos exatos, por consulta.
+    """
+    recalls = [
+        len(set(found) & set(expected)) / len(expected)
+        for found, expected in zip(approximate, exact)
+        if expected
+    ]
+    return sum(recalls) / len(recalls) if recalls else 1.0
@@ -0,0 +1,350 @@
+import os
+import time
+import uuid
+import asyncio
+import json
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from .rag_pipeline import RAGPipeline
+from .document_source import DocumentSource
+
+# Campos de progresso por arquivo, incrementados pela pipeline durante a ingestão
+PROGRESS_FIELDS = ("total_pages", "pages", "chunks", "embedded", "inserted")
+# Campos "pages_<backend>", somados por backend de extração na coluna JSON page_backends
+BACKEND_FIELD_PREFIX = "pages_"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    total_pages INTEGER NOT NULL DEFAULT 0,
+    pages INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    embedded INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    page_backends TEXT NOT NULL DEFAULT '{}',
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS files_job_id ON files (job_id);
+"""
+
+
+class IngestionJobQueue:
+    def __init__(
+        self,
+        pipeline: RAGPipeline,
+        path: Optional[str],
+        workers: int = 2,
+        progress_flush_seconds: float = 1.0,
+    ):
+        self.pipeline = pipeline
+        self.workers = max(1, workers)
+        # O progresso é acumulado em memória e gravado no banco a cada intervalo, numa thread
+        self.progress_flush_seconds = progress_flush_seconds
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        # Documentos em memória aguardando a fila. Só os gravados em disco pelo spill sobrevivem a
+        # um restart
+        self._sources = {}
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Sem caminho, a fila fica só em memória e não sobrevive a um restart
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        # A conexão é usada no event loop e nas threads que gravam o progresso
+        self._db_lock = threading.Lock()
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Bancos criados antes da coluna page_backends
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(files)")}
+        if "page_backends" not in columns:
+            self._db.execute(
+                "ALTER TABLE files ADD COLUMN page_backends TEXT NOT NULL DEFAULT '{}'"
+            )
+        self._db.commit()
+
+    async def start(self):
+        """
+        Inicia os workers e recoloca na fila os arquivos que não terminaram antes do último desligamento.
+        Não faz nada se a fila já foi iniciada.
+        """
+
+        if self._tasks:
+            return
+
+        in_memory = set(self._sources)
+
+        def recover() -> List[int]:
+            requeued = []
+            with self._db_lock:
+                unfinished = self._db.execute(
+                    "SELECT id, path FROM files WHERE status IN ('pending', 'running') ORDER BY id"
+                ).fetchall()
+                for row in unfinished:
+                    if row["id"] not in in_memory and (
+                        not row["path"] or not os.path.exists(row["path"])
+                    ):
+                        self._write_status(
+                            row["id"],
+                            "failed",
+                            "Arquivo perdido antes do processamento; envie o PDF novamente.",
+                        )
+                        continue
+                    # O processamento recomeça do zero, então o progresso parcial é descartado
+                    self._db.execute(
+                        f"UPDATE files SET status = 'pending', {', '.join(f'{field} = 0' for field in PROGRESS_FIELDS)} WHERE id = ?",
+                        (row["id"],),
+                    )
+                    requeued.append(row["id"])
+                self._db.commit()
+            return requeued
+
+        for file_id in await asyncio.to_thread(recover):
+            self._queue.put_nowait(file_id)
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Para os workers. Arquivos em andamento voltam para a fila no próximo `start`.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def close(self):
+        """
+        Fecha a conexão com o SQLite. Chamado depois do `stop`, no desligamento da API.
+        """
+        with self._db_lock:
+            self._db.close()
+
+    async def submit(
+        self, session_id: str, files: List[Tuple[str, DocumentSource]]
+    ) -> str:
+        """
+        Cria um job de ingestão e coloca seus arquivos na fila. Só o caminho dos documentos gravados
+        em disco vai para o banco; os documentos em memória se perdem num restart.
+
+        Args:
+            session_id (str): Define o ID da coleção do Milvus onde os documentos serão indexados.
+            files (List[Tuple[str, DocumentSource]]): Pares (nome do documento, documento carregado).
+                Os documentos são liberados (e os arquivos do spill removidos) depois de processados.
+        """
+
+        job_id = str(uuid.uuid4())
+
+        def save() -> List[int]:
+            file_ids = []
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT INTO jobs (id, session_id, created_at) VALUES (?, ?, ?)",
+                    (job_id, session_id, time.time()),
+                )
+                for filename, source in files:
+                    file_id = self._db.execute(
+                        "INSERT INTO files (job_id, filename, path) VALUES (?, ?, ?)",
+                        (job_id, filename, source.path or ""),
+                    ).lastrowid
+                    file_ids.append(file_id)
+                self._db.commit()
+            return file_ids
+
+        file_ids = await asyncio.to_thread(save)
+        for file_id, (_, source) in zip(file_ids, files):
+            self._sources[file_id] = source
+
+        for file_id in file_ids:
+            self._queue.put_nowait(file_id)
+
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna o status de um job e o progresso de cada arquivo. A consulta roda numa thread.
+
+        Args:
+            job_id (str): ID retornado por `IngestionJobQueue.submit`.
+        """
+        return await asyncio.to_thread(self._read_job, job_id)
+
+    def _read_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock:
+            job = self._db.execute(
+                "SELECT id, session_id, created_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+
+            files = [
+                {
+                    "filename": row["filename"],
+                    "status": row["status"],
+                    "error": row["error"],
+                    **{field: row[field] for field in PROGRESS_FIELDS},
+                    "page_backends": json.loads(row["page_backends"]),
+                }
+                for row in self._db.execute(
+                    "SELECT * FROM files WHERE job_id = ? ORDER BY id", (job_id,)
+                )
+            ]
+        statuses = {file["status"] for file in files}
+
+        if statuses <= {"done", "failed"}:
+            status = "failed" if statuses == {"failed"} else "done"
+        elif statuses == {"pending"}:
+            status = "pending"
+        else:
+            status = "running"
+
+        done_files = [file for file in files if file["status"] == "done"]
+        return {
+            "job_id": job["id"],
+            "session_id": job["session_id"],
+            "status": status,
+            "documents_indexed": len(done_files),
+            "total_chunks": sum(file["chunks"] for file in done_files),
+            "files": files,
+        }
+
+    async def _set_status(self, file_id: int, status: str, error: Optional[str] = None):
+        """
+        Atualiza o status de um arquivo numa thread.
+
+        Args:
+            file_id (int): ID do arquivo na tabela de arquivos.
+            status (str): Novo status ("running", "done" ou "failed").
+            error (str, opcional): Mensagem de erro, quando o arquivo falha.
+        """
+
+        def update():
+            with self._db_lock:
+                self._write_status(file_id, status, error)
+                self._db.commit()
+
+        await asyncio.to_thread(update)
+
+    def _write_status(self, file_id: int, status: str, error: Optional[str] = None):
+        # Quem chama segura o `_db_lock` e faz o commit
+        self._db.execute(
+            "UPDATE files SET status = ?, error = ? WHERE id = ?",
+            (status, error, file_id),
+        )
+
+    def _apply_progress(self, file_id: int, increments: Dict[str, int]):
+        """
+        Grava no banco, numa só transação, os incrementos de progresso acumulados de um arquivo.
+
+        Args:
+            file_id (int): ID do arquivo na tabela de arquivos.
+            increments (Dict[str, int]): Incrementos por campo, como recebidos da pipeline.
+        """
+
+        with self._db_lock:
+            for field, amount in increments.items():
+                if field in PROGRESS_FIELDS:
+                    self._db.execute(
+                        f"UPDATE files SET {field} = {field} + ? WHERE id = ?",
+                        (amount, file_id),
+                    )
+                else:
+                    path = "$." + field[len(BACKEND_FIELD_PREFIX) :]
+                    self._db.execute(
+                        "UPDATE files SET page_backends = json_set(page_backends, ?, coalesce(json_extract(page_backends, ?), 0) + ?) WHERE id = ?",
+                        (path, path, amount, file_id),
+                    )
+            self._db.commit()
+
+    async def _worker(self):
+        """
+        Processa arquivos da fila, um de cada vez.
+        """
+        while True:
+            file_id = await self._queue.get()
+            try:
+                await self._process(file_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, file_id: int):
+        """
+        Processa um arquivo da fila pela pipeline, registrando o progresso.
+
+        Args:
+            file_id (int): ID do arquivo na tabela de arquivos.
+        """
+
+        def begin() -> sqlite3.Row:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT files.filename, files.path, jobs.session_id FROM files JOIN jobs ON jobs.id = files.job_id WHERE files.id = ?",
+                    (file_id,),
+                ).fetchone()
+                self._write_status(file_id, "running")
+                self._db.commit()
+            return row
+
+        row = await asyncio.to_thread(begin)
+
+        # Arquivos retomados após um restart só existem em disco
+        source = self._sources.pop(file_id, None) or DocumentSource(
+            path=row["path"], owns_path=True
+        )
+
+        pending = Counter()
+
+        def progress(field: str, amount: int):
+            if field in PROGRESS_FIELDS or field.startswith(BACKEND_FIELD_PREFIX):
+                pending[field] += amount
+
+        async def flush():
+            if pending:
+                increments = dict(pending)
+                pending.clear()
+                await asyncio.to_thread(self._apply_progress, file_id, increments)
+
+        async def flush_periodically():
+            while True:
+                await asyncio.sleep(self.progress_flush_seconds)
+                await flush()
+
+        flusher = asyncio.create_task(flush_periodically())
+        try:
+            chunks = await self.pipeline.process_document(
+                source, row["filename"], row["session_id"], progress=progress
+            )
+        except asyncio.CancelledError:
+            # Desligamento: o arquivo continua pendente para o próximo `start`
+            self._sources[file_id] = source
+            raise
+        except Exception as e:
+            await flush()
+            await self._set_status(file_id, "failed", str(e))
+        else:
+            await flush()
+
+            def finish():
+                with self._db_lock:
+                    self._db.execute(
+                        "UPDATE files SET chunks = ? WHERE id = ?", (chunks, file_id)
+                    )
+                    self._write_status(file_id, "done")
+                    self._db.commit()
+
+            await asyncio.to_thread(finish)
+        finally:
+            flusher.cancel()
+
+        source.close()
@@ -0,0 +1,137 @@
+import re
+import math
+import heapq
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+# Mantém códigos como "A-123", "4.2.1" ou "CNPJ/MF" como um único token
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Separa o texto em tokens normalizados para a busca por palavras-chave.
+
+    Args:
+        text (str): Texto a ser tokenizado.
+    """
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower())
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], weights: Sequence[float], k: int = 60
+) -> Dict[str, float]:
+    """
+    Combina rankings de IDs pela reciprocal rank fusion.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): IDs de cada busca, do mais ao menos relevante.
+        weights (Sequence[float]): Peso de cada busca na fusão.
+        k (int): Constante que suaviza a diferença entre as primeiras posições.
+    """
+
+    fused_scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            fused_scores[doc_id] += weight / (k + rank + 1)
+
+    return fused_scores
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # Buscas e atualizações rodam em threads diferentes, fora do event loop
+        self._lock = threading.RLock()
+        # Índice invertido: termo -> {id do chunk: frequência do termo no chunk}
+        self._postings = {}
+        # Termos e tamanho (em tokens) de cada chunk, para remoção e normalização
+        self._doc_terms = {}
+        self._lengths = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str):
+        """
+        Indexa (ou reindexa) um chunk.
+
+        Args:
+            doc_id (str): ID do chunk.
+            text (str): Texto do chunk.
+        """
+
+        tokens = tokenize(text)
+        frequencies = Counter(tokens)
+
+        with self._lock:
+            if doc_id in self._lengths:
+                self.remove(doc_id)
+
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+
+            self._doc_terms[doc_id] = tuple(frequencies)
+            self._lengths[doc_id] = len(tokens)
+            self._total_length += len(tokens)
+
+    def remove(self, doc_id: str):
+        """
+        Remove um chunk do índice.
+
+        Args:
+            doc_id (str): ID do chunk.
+        """
+
+        with self._lock:
+            if doc_id not in self._lengths:
+                return
+
+            for term in self._doc_terms.pop(doc_id):
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+            self._total_length -= self._lengths.pop(doc_id)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """
+        Busca os chunks mais relevantes para a consulta pelo score BM25.
+
+        Args:
+            query (str): Texto da consulta.
+            top_k (int): Quantos chunks retornar.
+        """
+
+        terms = set(tokenize(query))
+        scores: Dict[str, float] = {}
+
+        with self._lock:
+            if not self._lengths:
+                return []
+
+            total_docs = len(self._lengths)
+            average_length = self._total_length / total_docs
+
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(
+                    1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for doc_id, frequency in postings.items():
+                    length_norm = (
+                        1 - self.b + self.b * self._lengths[doc_id] / average_length
+                    )
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * (
+                        frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                    )
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
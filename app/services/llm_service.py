@@ -1,9 +1,13 @@
 import os
+import asyncio
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from typing import TypedDict, List, Dict, Any
+from typing import AsyncIterator, TypedDict, List, Dict, Any
 from dotenv import load_dotenv
+from .chunking import format_citation
+from .context_packer import ContextPacker
+from .metrics import IN_FLIGHT, LLM_TOKENS, timed
 
 load_dotenv()
 
@@ -19,37 +23,41 @@ class LangGraphLLMService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.model_name = os.getenv("OPENAI_MODEL_NAME", "gpt-4o")
-        self.llm = ChatOpenAI(model=self.model_name, temperature=0)
+        # stream_usage faz o streaming também informar os tokens usados, para as métricas
+        self.llm = ChatOpenAI(model=self.model_name, temperature=0, stream_usage=True)
+        # Limite de chamadas simultâneas ao LLM e tempo máximo de cada chamada
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Orçamento de tokens do prompt para os chunks recuperados e para o histórico do chat
+        self.context_packer = ContextPacker(
+            self.model_name,
+            context_budget=int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "3000")),
+            history_budget=int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "1000")),
+        )
         self.graph = self._build_graph()
 
-    def _build_graph(self):
-        """
-        Constrói um graph do LangGraph para a pipeline de RAG.
+    def _build_messages(
+        self, question: str, chat_history: list, context: List[Dict[str, Any]]
+    ) -> list:
         """
+        Monta as mensagens do prompt com o contexto e o histórico do chat, dentro do orçamento de tokens.
 
-        # Define o esquema do graph
-        workflow = StateGraph(state_schema=RAGState)
-
-        def generate_answer(state):
-            """
-            Gera uma resposta com base no contexto e a mensagem.
+        Args:
+            question (str): A mensagem do usuário.
+            chat_history (list): Histórico de conversa para contexto conversacional.
+            context (List[Dict[str, Any]]): Contexto para RAG do(s) documento(s) PDF.
+        """
 
-            Args:
-                state: State no formato de `RAGState` para geração da resposta.
-            """
-            context = state["context"]
-            chat_history = state["chat_history"]
-            question = state["question"]
-
-            context_text = "\n\n".join(
-                [
-                    f"Fonte para o texto abaixo: {chunk['source']}\n---\n{chunk['text']}"
-                    for chunk in context
-                ]
-            )
-            chat_history_text = "\n".join(chat_history)
-            system_message = SystemMessage(
-                content=f"""Você é um assistente útil chamado 'Mestre dos PDFs' que responde às perguntas com base no contexto.
+        context_text = "\n\n".join(
+            [
+                f"Fonte para o texto abaixo: {format_citation(chunk)}\n---\n{chunk['text']}"
+                for chunk in self.context_packer.pack_context(context)
+            ]
+        )
+        chat_history_text = "\n".join(self.context_packer.pack_history(chat_history))
+        system_message = SystemMessage(
+            content=f"""Você é um assistente útil chamado 'Mestre dos PDFs' que responde às perguntas com base no contexto.
             
 Chat History:
 {chat_history_text}
@@ -61,11 +69,41 @@ Responda à mensagem, caso seja uma pergunta, com base SOMENTE no contexto forne
 Seja conciso e direto.
 Ao fim da mensagem, inclua uma seção de 'Referências', citando as fontes que você usou para responder, se possível.
 """
+        )
+
+        human_message = HumanMessage(content=question)
+
+        return [system_message, human_message]
+
+    def _build_graph(self):
+        """
+        Constrói um graph do LangGraph para a pipeline de RAG.
+        """
+
+        # Define o esquema do graph
+        workflow = StateGraph(state_schema=RAGState)
+
+        async def generate_answer(state):
+            """
+            Gera uma resposta com base no contexto e a mensagem.
+
+            Args:
+                state: State no formato de `RAGState` para geração da resposta.
+            """
+            messages = self._build_messages(
+                state["question"], state["chat_history"], state["context"]
             )
 
-            human_message = HumanMessage(content=question)
+            async with self._semaphore:
+                with IN_FLIGHT.track_in_progress(operation="llm"), timed("llm"):
+                    response = await asyncio.wait_for(
+                        self.llm.ainvoke(messages), timeout=self.timeout_seconds
+                    )
 
-            response = self.llm.invoke([system_message, human_message])
+            usage = response.usage_metadata
+            if usage:
+                LLM_TOKENS.inc(usage["input_tokens"], type="input")
+                LLM_TOKENS.inc(usage["output_tokens"], type="output")
 
             return {"answer": response.content}
 
@@ -96,6 +134,32 @@ Ao fim da mensagem, inclua uma seção de 'Referências', citando as fontes que
             "answer": "",
         }
 
-        result = self.graph.invoke(input_state)
+        result = await self.graph.ainvoke(input_state)
 
         return result["answer"]
+
+    async def stream_answer(
+        self, question: str, chat_history: list, context_chunks: List[Dict[str, Any]]
+    ) -> AsyncIterator[str]:
+        """
+        Gera uma resposta com base no contexto e a mensagem, devolvendo os tokens conforme chegam do LLM.
+
+        Args:
+            question (str): A mensagem do usuário.
+            chat_history (list, opcional): Uma lista de mensagens como histórico de conversa para contexto conversacional.
+            context_chunks (List[Dict[str, Any]]): Contexto para RAG do(s) documento(s) PDF.
+        """
+
+        input_state = {
+            "question": question,
+            "chat_history": chat_history,
+            "context": context_chunks,
+            "answer": "",
+        }
+
+        # O modo "messages" do LangGraph repassa os tokens do ChatOpenAI durante a execução do node
+        async for message_chunk, _ in self.graph.astream(
+            input_state, stream_mode="messages"
+        ):
+            if message_chunk.content:
+                yield message_chunk.content
@@ -0,0 +1,689 @@
+import os
+import re
+import json
+import asyncio
+import importlib.util
+import threading
+import numpy as np
+from array import array
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from .chunking import Chunk
+from .keyword_index import BM25Index, reciprocal_rank_fusion
+from .metrics import timed
+from .vector_store import CollectionManager
+
+load_dotenv()
+
+# Mesmas regras de nome das coleções do Milvus, o que também impede caminhos fora do diretório
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Consultas por bloco na busca exata, limitando a matriz de scores em memória
+QUERY_BLOCK_SIZE = 256
+
+
+class StringColumn:
+    """
+    Coluna de strings só de acréscimo: os bytes UTF-8 concatenados num arquivo e o offset final
+    de cada valor (int64) em outro, lidos via memmap sem carregar os textos na memória.
+    """
+
+    def __init__(self, path: str):
+        self.data_path = f"{path}.data"
+        self.offsets_path = f"{path}.offsets"
+        for file_path in (self.data_path, self.offsets_path):
+            open(file_path, "ab").close()
+        self._ends = np.fromfile(self.offsets_path, dtype=np.int64).tolist()
+        self._data = None
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def truncate(self, rows: int):
+        """
+        Descarta os valores depois da linha `rows` (escritas interrompidas).
+
+        Args:
+            rows (int): Quantidade de linhas mantidas.
+        """
+        self._ends = self._ends[:rows]
+        with open(self.offsets_path, "r+b") as file:
+            file.truncate(rows * 8)
+        with open(self.data_path, "r+b") as file:
+            file.truncate(self._ends[-1] if self._ends else 0)
+        self._data = None
+
+    def append(self, values: List[str]):
+        """
+        Acrescenta valores ao fim da coluna.
+
+        Args:
+            values (List[str]): Valores a serem gravados.
+        """
+        encoded = [value.encode("utf-8") for value in values]
+        end = self._ends[-1] if self._ends else 0
+        ends = []
+        for value in encoded:
+            end += len(value)
+            ends.append(end)
+
+        with open(self.data_path, "ab") as file:
+            file.write(b"".join(encoded))
+        with open(self.offsets_path, "ab") as file:
+            file.write(np.asarray(ends, dtype=np.int64).tobytes())
+
+        self._ends.extend(ends)
+        self._data = None
+
+    def get(self, row: int) -> str:
+        """
+        Lê o valor de uma linha.
+
+        Args:
+            row (int): Linha da coluna.
+        """
+        start = self._ends[row - 1] if row else 0
+        end = self._ends[row]
+        # Referência local: um `append` em outra thread pode descartar o mapeamento atual
+        data = self._data
+        if data is None or len(data) < end:
+            data = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+            self._data = data
+        return data[start:end].tobytes().decode("utf-8")
+
+    def values(self) -> List[str]:
+        """
+        Lê todos os valores da coluna.
+        """
+        return [self.get(row) for row in range(len(self))]
+
+
+class LocalCollection:
+    """
+    Coleção de uma sessão gravada em disco: embeddings float32 normalizados numa matriz via memmap,
+    e IDs, textos, fontes, páginas e linhas removidas em colunas separadas.
+
+    Linhas substituídas ou removidas só são marcadas como inativas; o espaço é recuperado
+    na próxima vez que a coleção é carregada com mais da metade das linhas inativas.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int,
+        model_name: str,
+        use_keyword_index: bool = True,
+        hnsw_min_rows: Optional[int] = None,
+    ):
+        self.path = path
+        self.dim = dim
+        self.model_name = model_name
+        self.use_keyword_index = use_keyword_index
+        self.hnsw_min_rows = hnsw_min_rows
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._hnsw = None
+        self.keyword_index = None
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as file:
+                meta = json.load(file)
+            if meta["dim"] != dim or (
+                meta["model_name"] and model_name and meta["model_name"] != model_name
+            ):
+                raise ValueError(
+                    f"A coleção {os.path.basename(path)} foi criada com o modelo {meta['model_name'] or 'desconhecido'} "
+                    f"(dimensão {meta['dim']}), mas o modelo configurado é {model_name} (dimensão {dim})."
+                )
+        else:
+            with open(meta_path, "w") as file:
+                json.dump({"dim": dim, "model_name": model_name}, file)
+
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.alive_path = os.path.join(path, "alive.u8")
+        # Página inicial e final de cada linha (0 em coleções criadas antes da coluna)
+        self.pages_path = os.path.join(path, "pages.i32")
+
+    def load(self):
+        """
+        Abre os arquivos da coleção e monta os índices em memória.
+        """
+
+        with self._lock:
+            for file_path in (self.vectors_path, self.alive_path, self.pages_path):
+                open(file_path, "ab").close()
+
+            self.ids = StringColumn(os.path.join(self.path, "ids"))
+            self.texts = StringColumn(os.path.join(self.path, "texts"))
+            self.sources = StringColumn(os.path.join(self.path, "sources"))
+            with open(self.alive_path, "rb") as file:
+                self.alive = bytearray(file.read())
+            self.pages = array("i")
+            with open(self.pages_path, "rb") as file:
+                self.pages.frombytes(file.read())
+
+            # A coluna `alive` é gravada por último; linhas além dela são de uma escrita interrompida
+            rows = min(
+                len(self.alive),
+                len(self.ids),
+                len(self.texts),
+                len(self.sources),
+                os.path.getsize(self.vectors_path) // (self.dim * 4),
+            )
+            self._truncate(rows)
+            if len(self.pages) < rows * 2:
+                missing = array("i", bytes(4 * (rows * 2 - len(self.pages))))
+                with open(self.pages_path, "ab") as file:
+                    missing.tofile(file)
+                self.pages.extend(missing)
+
+            if rows and self.alive.count(0) > rows // 2:
+                self._compact()
+
+            self.rows_by_id = {
+                chunk_id: row
+                for row, chunk_id in enumerate(self.ids.values())
+                if self.alive[row]
+            }
+            self._remap()
+
+            if self.use_keyword_index:
+                self.keyword_index = BM25Index()
+                for row in self.rows_by_id.values():
+                    self.keyword_index.add(self.ids.get(row), self.texts.get(row))
+
+    def release(self):
+        """
+        Libera a matriz mapeada e os índices em memória.
+        """
+        with self._lock:
+            self._matrix = None
+            self._hnsw = None
+            self.keyword_index = None
+
+    def _truncate(self, rows: int):
+        for column in (self.ids, self.texts, self.sources):
+            column.truncate(rows)
+        with open(self.vectors_path, "r+b") as file:
+            file.truncate(rows * self.dim * 4)
+        with open(self.alive_path, "r+b") as file:
+            file.truncate(rows)
+        del self.alive[rows:]
+        if len(self.pages) > rows * 2:
+            with open(self.pages_path, "r+b") as file:
+                file.truncate(rows * 8)
+            del self.pages[rows * 2 :]
+
+    def _compact(self):
+        """
+        Regrava a coleção só com as linhas ativas.
+        """
+
+        keep = [row for row in range(len(self.alive)) if self.alive[row]]
+        vectors = np.fromfile(self.vectors_path, dtype=np.float32).reshape(-1, self.dim)
+        ids = [self.ids.get(row) for row in keep]
+        texts = [self.texts.get(row) for row in keep]
+        sources = [self.sources.get(row) for row in keep]
+        pages = array(
+            "i", [page for row in keep for page in self.pages[row * 2 : row * 2 + 2]]
+        )
+        kept_vectors = vectors[keep]
+        del vectors
+
+        self._truncate(0)
+        self._append(ids, texts, sources, pages, kept_vectors)
+
+    def _remap(self):
+        """
+        Mapeia a matriz de embeddings com todas as linhas gravadas.
+        """
+        rows = len(self.alive)
+        self._matrix = (
+            np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+            if rows
+            else np.zeros((0, self.dim), dtype=np.float32)
+        )
+
+    def _append(
+        self,
+        ids: List[str],
+        texts: List[str],
+        sources: List[str],
+        pages: array,
+        vectors: np.ndarray,
+    ):
+        with open(self.vectors_path, "ab") as file:
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.ids.append(ids)
+        self.texts.append(texts)
+        self.sources.append(sources)
+        with open(self.pages_path, "ab") as file:
+            pages.tofile(file)
+        self.pages.extend(pages)
+        with open(self.alive_path, "ab") as file:
+            file.write(b"\x01" * len(ids))
+        self.alive.extend(b"\x01" * len(ids))
+
+    def _mark_deleted(self, rows: List[int]):
+        with open(self.alive_path, "r+b") as file:
+            for row in rows:
+                self.alive[row] = 0
+                file.seek(row)
+                file.write(b"\x00")
+        if self._hnsw is not None:
+            for row in rows:
+                self._hnsw.mark_deleted(row)
+
+    def upsert(self, chunks: List[Chunk]):
+        """
+        Insere chunks, substituindo os que já existem com o mesmo ID.
+
+        Args:
+            chunks (List[Chunk]): Chunks com ID e embedding.
+        """
+
+        vectors = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+        # Normalizados na inserção, o cosseno vira um produto escalar na busca
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            replaced = [
+                self.rows_by_id[chunk.id]
+                for chunk in chunks
+                if chunk.id in self.rows_by_id
+            ]
+            if replaced:
+                self._mark_deleted(replaced)
+
+            first_row = len(self.alive)
+            self._append(
+                [chunk.id for chunk in chunks],
+                [chunk.text for chunk in chunks],
+                [chunk.source for chunk in chunks],
+                array(
+                    "i",
+                    [
+                        page
+                        for chunk in chunks
+                        for page in (chunk.page_start, chunk.page_end)
+                    ],
+                ),
+                vectors,
+            )
+            for offset, chunk in enumerate(chunks):
+                self.rows_by_id[chunk.id] = first_row + offset
+            self._remap()
+
+            if self._hnsw is not None:
+                self._hnsw.resize_index(len(self.alive))
+                self._hnsw.add_items(vectors, np.arange(first_row, len(self.alive)))
+
+            if self.keyword_index is not None:
+                for chunk in chunks:
+                    self.keyword_index.add(chunk.id, chunk.text)
+
+    def delete(self, ids: List[str]):
+        """
+        Remove chunks pelos seus IDs.
+
+        Args:
+            ids (List[str]): IDs dos chunks a serem removidos.
+        """
+
+        with self._lock:
+            rows = [
+                self.rows_by_id.pop(chunk_id)
+                for chunk_id in ids
+                if chunk_id in self.rows_by_id
+            ]
+            self._mark_deleted(rows)
+            if self.keyword_index is not None:
+                for chunk_id in ids:
+                    self.keyword_index.remove(chunk_id)
+
+    def _build_hnsw(self):
+        """
+        Constrói o índice HNSW (hnswlib) com as linhas ativas.
+        """
+
+        import hnswlib
+
+        rows = np.asarray(sorted(self.rows_by_id.values()), dtype=np.int64)
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_max_elements(max(len(self.alive), 1), ef_construction=200, M=16)
+        if len(rows):
+            index.add_items(self._matrix[rows], rows)
+        self._hnsw = index
+
+    def _row(self, row: int) -> Dict[str, Any]:
+        """
+        Lê os campos de uma linha no formato retornado pelas buscas.
+
+        Args:
+            row (int): Linha da coleção.
+        """
+        return {
+            "id": self.ids.get(row),
+            "text": self.texts.get(row),
+            "source": self.sources.get(row),
+            "page_start": self.pages[row * 2] or None,
+            "page_end": self.pages[row * 2 + 1] or None,
+        }
+
+    def search(
+        self, query_embeddings: List[List[float]], limit: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca os chunks mais próximos (cosseno) dos embeddings das mensagens.
+
+        A busca é exata, vetorizada sobre a matriz inteira para várias consultas de uma vez; com
+        `hnsw_min_rows` configurado e a coleção maior que esse limite, passa a usar o índice aproximado HNSW.
+
+        Args:
+            query_embeddings (List[List[float]]): Embeddings das mensagens dos usuários.
+            limit (int): Quantos chunks retornar por consulta.
+        """
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            alive_rows = len(self.rows_by_id)
+            limit = min(limit, alive_rows)
+            if not limit:
+                return [[] for _ in range(len(queries))]
+
+            if self.hnsw_min_rows is not None and alive_rows >= self.hnsw_min_rows:
+                if self._hnsw is None:
+                    self._build_hnsw()
+                self._hnsw.set_ef(max(64, limit * 2))
+                rows, distances = self._hnsw.knn_query(queries, k=limit)
+                # No espaço "ip" do hnswlib, distância = 1 - produto escalar
+                scores = 1.0 - distances
+            else:
+                # Cópia do estado atual; o produto com a matriz roda fora do lock
+                matrix = self._matrix
+                dead = np.frombuffer(bytes(self.alive), dtype=np.uint8) == 0
+                rows = None
+
+        if rows is None:
+            rows = np.empty((len(queries), limit), dtype=np.int64)
+            scores = np.empty((len(queries), limit), dtype=np.float32)
+            # Em blocos, para a matriz de scores (consultas x chunks) não crescer sem limite
+            for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+                block = np.asarray(queries[start : start + QUERY_BLOCK_SIZE] @ matrix.T)
+                block[:, dead] = -np.inf
+                top = np.argpartition(-block, limit - 1, axis=1)[:, :limit]
+                top_scores = np.take_along_axis(block, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                rows[start : start + len(block)] = np.take_along_axis(
+                    top, order, axis=1
+                )
+                scores[start : start + len(block)] = np.take_along_axis(
+                    top_scores, order, axis=1
+                )
+
+        return [
+            [
+                {**self._row(row), "score": float(score)}
+                for row, score in zip(query_rows, query_scores)
+            ]
+            for query_rows, query_scores in zip(rows.tolist(), scores.tolist())
+        ]
+
+    def keyword_search(self, query_texts: List[str], limit: int) -> List[List[str]]:
+        """
+        Busca BM25 na coleção, retornando os IDs dos chunks mais relevantes de cada consulta.
+
+        Args:
+            query_texts (List[str]): Textos das mensagens dos usuários.
+            limit (int): Quantos chunks retornar por consulta.
+        """
+        with self._lock:
+            return [
+                [
+                    chunk_id
+                    for chunk_id, _ in self.keyword_index.search(query_text, limit)
+                ]
+                for query_text in query_texts
+            ]
+
+    def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Lê texto e fonte dos chunks pelos seus IDs.
+
+        Args:
+            ids (List[str]): IDs dos chunks.
+        """
+        with self._lock:
+            return [
+                self._row(self.rows_by_id[chunk_id])
+                for chunk_id in ids
+                if chunk_id in self.rows_by_id
+            ]
+
+
+class LocalVectorStore:
+    def __init__(self, dim: int = 1536, model_name: str = ""):
+        self.path = os.getenv("LOCAL_VECTOR_STORE_PATH", "cache/vectors")
+        os.makedirs(self.path, exist_ok=True)
+        # Dimensão e modelo dos embeddings, gravados junto de cada coleção criada
+        self.dim = dim
+        self.model_name = model_name
+        # Acima desse número de chunks a sessão usa o índice HNSW; vazio mantém sempre a busca exata
+        hnsw_min_rows = os.getenv("LOCAL_HNSW_MIN_ROWS")
+        self.hnsw_min_rows = int(hnsw_min_rows) if hnsw_min_rows else None
+        if self.hnsw_min_rows is not None:
+            # Falha na inicialização, e não na primeira busca de uma sessão grande
+            if importlib.util.find_spec("hnswlib") is None:
+                raise ImportError(
+                    "LOCAL_HNSW_MIN_ROWS precisa do pacote `hnswlib` instalado (extra `hnsw`)."
+                )
+
+        # Mesmas opções da busca híbrida do Milvus
+        self.hybrid_search = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+        self.dense_weight = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+        self.keyword_weight = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        self.candidate_multiplier = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+
+        # Coleções carregadas na memória, no máximo LOCAL_MAX_LOADED_COLLECTIONS
+        self.collections = CollectionManager(
+            self._open_collection,
+            max_loaded=int(os.getenv("LOCAL_MAX_LOADED_COLLECTIONS", "32")),
+        )
+
+    def ping(self, timeout: float = 2.0):
+        """
+        Verifica se o diretório das coleções está acessível para escrita, lançando exceção se não estiver.
+
+        Args:
+            timeout (float): Sem efeito no índice local; existe para manter a interface do `MilvusVectorStore`.
+        """
+        if not os.access(self.path, os.W_OK):
+            raise OSError(
+                f"Diretório do índice local sem permissão de escrita: {self.path}"
+            )
+
+    def close(self):
+        """
+        Libera as coleções carregadas.
+        """
+        self.collections.release_all()
+
+    def _open_collection(self, session_id: str) -> LocalCollection:
+        """
+        Abre a coleção da sessão, criando-a caso não exista.
+
+        Args:
+            session_id (str): ID da sessão, usado como nome do diretório da coleção.
+        """
+
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"ID de sessão inválido: {session_id}")
+
+        return LocalCollection(
+            os.path.join(self.path, session_id),
+            self.dim,
+            self.model_name,
+            use_keyword_index=self.hybrid_search,
+            hnsw_min_rows=self.hnsw_min_rows,
+        )
+
+    async def insert_chunks(
+        self, chunks: List[Chunk], session_id: str = "default"
+    ) -> int:
+        """
+        Insere chunks de um documento na coleção local.
+
+        Os chunks já existentes com o mesmo ID são substituídos, então reenviar um documento não duplica a coleção.
+
+        Args:
+            chunks (List[Chunk]): Chunks do documento PDF, com o ID determinístico em `chunk.id` e o embedding.
+            session_id (str, opcional): ID da sessão, para poder começar uma conversa limpa na UI do Streamlit.
+        """
+
+        if not chunks:
+            return 0
+
+        async with self.collections.use(session_id) as collection:
+            with timed("vector_insert"):
+                await asyncio.to_thread(collection.upsert, chunks)
+
+        return len(chunks)
+
+    async def delete_chunks(self, ids: List[str], session_id: str = "default") -> int:
+        """
+        Remove chunks da coleção local pelos seus IDs.
+
+        Args:
+            ids (List[str]): IDs dos chunks a serem removidos.
+            session_id (str, opcional): ID da sessão, para poder começar uma conversa limpa na UI do Streamlit.
+        """
+
+        if not ids:
+            return 0
+
+        async with self.collections.use(session_id) as collection:
+            with timed("vector_delete"):
+                await asyncio.to_thread(collection.delete, ids)
+
+        return len(ids)
+
+    async def ensure_index(self, session_id: str):
+        """
+        Sem efeito no índice local: a troca para o HNSW acontece na própria busca, pelo LOCAL_HNSW_MIN_ROWS.
+
+        Args:
+            session_id (str): ID da sessão.
+        """
+
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        session_id: str = "default",
+        query_texts: Optional[List[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca os chunks mais relevantes para várias mensagens de uma vez, num único produto de matrizes.
+
+        Com a busca híbrida habilitada e `query_texts` informado, os rankings vetorial e BM25
+        são combinados por reciprocal rank fusion, como no `MilvusVectorStore`.
+
+        Args:
+            query_embeddings (List[List[float]]): Embeddings das mensagens dos usuários.
+            top_k (int): Define quantos chunks serão retornados por mensagem.
+            session_id (str, opcional): ID da sessão, para poder começar uma conversa limpa na UI do Streamlit.
+            query_texts (List[str], opcional): Textos das mensagens, na mesma ordem, usados na busca por palavras-chave.
+        """
+
+        if not query_embeddings:
+            return []
+
+        async with self.collections.use(session_id) as collection:
+            if not self.hybrid_search or not query_texts:
+                with timed("vector_search"):
+                    return await asyncio.to_thread(
+                        collection.search, query_embeddings, top_k
+                    )
+
+            candidates = top_k * self.candidate_multiplier
+            # Busca vetorial e BM25 em paralelo, medidas juntas
+            with timed("vector_search"):
+                dense_results, keyword_results = await asyncio.gather(
+                    asyncio.to_thread(collection.search, query_embeddings, candidates),
+                    asyncio.to_thread(
+                        collection.keyword_search, query_texts, candidates
+                    ),
+                )
+
+            chunks_by_id = {}
+            rankings = []
+            for dense_chunks, keyword_ids in zip(dense_results, keyword_results):
+                for chunk in dense_chunks:
+                    chunks_by_id[chunk["id"]] = chunk
+                fused_scores = reciprocal_rank_fusion(
+                    [[chunk["id"] for chunk in dense_chunks], keyword_ids],
+                    [self.dense_weight, self.keyword_weight],
+                    self.rrf_k,
+                )
+                best_ids = sorted(fused_scores, key=fused_scores.get, reverse=True)[
+                    :top_k
+                ]
+                rankings.append(
+                    [(chunk_id, fused_scores[chunk_id]) for chunk_id in best_ids]
+                )
+
+            # Chunks encontrados só pelo BM25 ainda precisam do texto e da fonte, lidos numa thread
+            missing_ids = list(
+                {
+                    chunk_id
+                    for ranking in rankings
+                    for chunk_id, _ in ranking
+                    if chunk_id not in chunks_by_id
+                }
+            )
+            if missing_ids:
+                for chunk in await asyncio.to_thread(collection.get, missing_ids):
+                    chunks_by_id[chunk["id"]] = chunk
+
+            results = [
+                [
+                    {**chunks_by_id[chunk_id], "score": score}
+                    for chunk_id, score in ranking
+                    if chunk_id in chunks_by_id
+                ]
+                for ranking in rankings
+            ]
+
+            return results
+
+    async def search_similar_chunks(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        session_id: str = "default",
+        query_text: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca por chunks mais relevantes de acordo com o embedding da mensagem do usuário.
+
+        Args:
+            query_embedding (List[float]): Vetor com o embedding da mensagem do usuário.
+            top_k (int): Define quantos chunks serão retornados para contexto do RAG.
+            session_id (str, opcional): ID da sessão, para poder começar uma conversa limpa na UI do Streamlit.
+            query_text (str, opcional): Texto da mensagem do usuário, usado na busca por palavras-chave.
+        """
+
+        results = await self.search_many(
+            [query_embedding],
+            top_k,
+            session_id,
+            [query_text] if query_text else None,
+        )
+        return results[0]
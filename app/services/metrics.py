@@ -0,0 +1,365 @@
+import math
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+class Metric:
+    """
+    Base das métricas: guarda um valor por combinação de labels, protegido por lock, pois as
+    métricas são atualizadas tanto no event loop quanto nas threads do `asyncio.to_thread`.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"A métrica {self.name} espera os labels {self.labelnames}, recebeu {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """
+        Retorna as amostras da métrica como (nome, labels, valor).
+        """
+        with self._lock:
+            return [
+                (self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ]
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        Incrementa o contador.
+
+        Args:
+            amount (float): Valor a somar; não pode ser negativo.
+            **labels (str): Valores dos labels da métrica.
+        """
+        if amount < 0:
+            raise ValueError("Contadores só podem aumentar.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels: str) -> Iterator[None]:
+        """
+        Soma 1 ao gauge enquanto o bloco executa, para contar operações em andamento.
+
+        Args:
+            **labels (str): Valores dos labels da métrica.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        """
+        Registra uma observação.
+
+        Args:
+            value (float): Valor observado (ex.: duração em segundos).
+            **labels (str): Valores dos labels da métrica.
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Contagem por bucket (o último é o +Inf), soma e total de observações
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, bucket_count in zip(
+                    (*self.buckets, math.inf), bucket_counts
+                ):
+                    cumulative += bucket_count
+                    samples.append(
+                        (
+                            f"{self.name}_bucket",
+                            {**labels, "le": _format_value(bound)},
+                            cumulative,
+                        )
+                    )
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        # Funções chamadas a cada coleta, que geram métricas a partir do estado de outros objetos
+        self._collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica já registrada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]):
+        """
+        Registra uma função que gera métricas na hora da coleta.
+
+        Args:
+            collector (Callable[[], Iterable[Metric]]): Função sem argumentos que retorna as métricas atuais.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Gera o texto de todas as métricas no formato de exposição do Prometheus.
+        """
+
+        metrics = list(self._metrics.values())
+        for collector in self._collectors:
+            metrics.extend(collector())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def stats_collector(
+    prefix: str,
+    documentation: str,
+    stats: Callable[[], Dict[str, float]],
+    counters: Iterable[str] = (),
+) -> Callable[[], List[Metric]]:
+    """
+    Cria um coletor que expõe um dict de estatísticas (ex.: `CollectionManager.stats()`) como métricas.
+
+    Args:
+        prefix (str): Prefixo dos nomes das métricas.
+        documentation (str): Descrição do que as estatísticas medem.
+        stats (Callable[[], Dict[str, float]]): Função que retorna as estatísticas atuais.
+        counters (Iterable[str]): Chaves que só aumentam, expostas como counters; as demais viram gauges.
+    """
+
+    counters = set(counters)
+
+    def collect() -> List[Metric]:
+        metrics = []
+        for key, value in stats().items():
+            if key in counters:
+                metric = Counter(f"{prefix}_{key}_total", f"{documentation}: {key}")
+                metric.inc(value)
+            else:
+                metric = Gauge(f"{prefix}_{key}", f"{documentation}: {key}")
+                metric.set(value)
+            metrics.append(metric)
+        return metrics
+
+    return collect
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds",
+    "Duração de cada estágio da ingestão e das perguntas",
+    ["stage"],
+)
+PAGES = REGISTRY.counter(
+    "rag_pages_total",
+    "Páginas extraídas, por método (pymupdf, pdfplumber, pypdf2 ou ocr)",
+    ["method"],
+)
+CHUNKS = REGISTRY.counter("rag_chunks_total", "Chunks gerados na ingestão")
+EMBEDDED_TEXTS = REGISTRY.counter(
+    "rag_embedded_texts_total",
+    "Textos enviados ao backend de embedding, por tipo (document ou query)",
+    ["kind"],
+)
+LLM_TOKENS = REGISTRY.counter(
+    "rag_llm_tokens_total",
+    "Tokens usados nas chamadas ao LLM (input ou output)",
+    ["type"],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "rag_cache_requests_total",
+    "Consultas aos caches de embeddings (também no re-score das buscas) e de respostas, por resultado (hit ou miss)",
+    ["cache", "result"],
+)
+RESCORED_QUERIES = REGISTRY.counter(
+    "rag_rescored_queries_total",
+    "Consultas às coleções com vetores compactos, por resultado: rescored ou skipped (candidato fora do cache)",
+    ["result"],
+)
+RERANK_FALLBACKS = REGISTRY.counter(
+    "rag_rerank_fallbacks_total",
+    "Perguntas que seguiram na ordem da busca sem o rerank, por motivo (estimate, busy ou timeout)",
+    ["reason"],
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "rag_in_flight", "Operações em andamento, por tipo", ["operation"]
+)
+
+# Tempos do request atual, quando o cliente pediu o detalhamento
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+# As threads do `asyncio.to_thread` herdam o dict do request e o atualizam em paralelo
+_timings_lock = threading.Lock()
+
+
+def observe_stage(stage: str, seconds: float):
+    """
+    Registra a duração de um estágio no histograma e, se ativo, no detalhamento do request atual.
+
+    Args:
+        stage (str): Nome do estágio.
+        seconds (float): Duração em segundos.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Mede a duração do bloco como um estágio, mesmo se ele terminar com exceção.
+
+    Args:
+        stage (str): Nome do estágio.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def record_timings() -> Iterator[Dict[str, float]]:
+    """
+    Coleta os tempos de cada estágio executado dentro do bloco, inclusive em tasks e threads criadas nele.
+    Estágios repetidos (ex.: várias buscas num lote) têm os tempos somados.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
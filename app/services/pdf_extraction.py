@@ -0,0 +1,412 @@
+import io
+import re
+import mmap
+import time
+import pymupdf
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from importlib.util import find_spec
+from PIL import Image
+from PyPDF2 import PdfReader
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+# Sequências que o pdfminer (pdfplumber) gera para glifos sem mapeamento unicode
+CID_PATTERN = re.compile(r"\(cid:\d+\)")
+
+
+class ExtractedPage(NamedTuple):
+    text: str
+    # Backend que produziu o texto: "pymupdf", "pdfplumber", "pypdf2" ou "ocr"
+    backend: str
+
+
+class PageRange(NamedTuple):
+    pages: List[ExtractedPage]
+    # Tempo da extração do texto e do OCR, medidos no processo que extraiu
+    extract_seconds: float
+    ocr_seconds: float
+
+    @property
+    def ocr_pages(self) -> int:
+        return sum(page.backend == "ocr" for page in self.pages)
+
+
+@contextmanager
+def open_pdf_stream(document: Union[str, bytes]) -> Iterator[BinaryIO]:
+    """
+    Abre o documento como stream binário: conteúdo em memória sem cópia, ou arquivo em disco via mmap.
+
+    Args:
+        document (Union[str, bytes]): Caminho para o documento PDF ou seu conteúdo.
+    """
+    if isinstance(document, (bytes, bytearray)):
+        yield io.BytesIO(document)
+        return
+
+    with (
+        open(document, "rb") as file,
+        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer,
+    ):
+        yield buffer
+
+
+def open_pymupdf(document: Union[str, bytes]) -> pymupdf.Document:
+    """
+    Abre o documento no PyMuPDF, a partir do caminho ou do conteúdo em memória.
+
+    Args:
+        document (Union[str, bytes]): Caminho para o documento PDF ou seu conteúdo.
+    """
+    if isinstance(document, (bytes, bytearray)):
+        return pymupdf.open(stream=document, filetype="pdf")
+    return pymupdf.open(document)
+
+
+class OCREngine:
+    def __init__(
+        self,
+        dpi: int = 200,
+        grayscale: bool = True,
+        workers: int = 2,
+        lang: Optional[str] = None,
+    ):
+        self.dpi = dpi
+        self.grayscale = grayscale
+        self.workers = max(1, workers)
+        self.lang = lang
+        # Máximo de imagens renderizadas esperando pelo tesseract ao mesmo tempo
+        self.max_in_flight = self.workers * 2
+
+    def _render_page(self, page: pymupdf.Page) -> Image.Image:
+        """
+        Rasteriza uma página em memória, sem arquivos temporários.
+
+        Args:
+            page (pymupdf.Page): Página já aberta do documento.
+        """
+        colorspace = pymupdf.csGRAY if self.grayscale else pymupdf.csRGB
+        pix = page.get_pixmap(dpi=self.dpi, colorspace=colorspace, alpha=False)
+        mode = "L" if self.grayscale else "RGB"
+        return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+    def ocr_pages(
+        self, document: Union[str, bytes], page_numbers: Iterable[int]
+    ) -> Dict[int, str]:
+        """
+        Aplica OCR nas páginas informadas, abrindo o documento uma única vez.
+
+        As páginas são renderizadas uma a uma e enviadas para os workers do tesseract,
+        com no máximo `max_in_flight` imagens em memória, independente do número de páginas.
+
+        Args:
+            document (Union[str, bytes]): Caminho para o documento PDF ou seu conteúdo.
+            page_numbers (Iterable[int]): Páginas (começando em 1) que precisam de OCR.
+        """
+
+        # Importado só quando há OCR, para não atrasar o início dos workers de extração
+        import pytesseract
+
+        results = {}
+        pending = deque()
+
+        with open_pymupdf(document) as doc, ThreadPoolExecutor(self.workers) as pool:
+            for page_number in page_numbers:
+                image = self._render_page(doc[page_number - 1])
+                future = pool.submit(pytesseract.image_to_string, image, lang=self.lang)
+                pending.append((page_number, future))
+
+                # Espera o OCR mais antigo terminar antes de renderizar mais páginas
+                while len(pending) >= self.max_in_flight:
+                    done_page, done_future = pending.popleft()
+                    results[done_page] = done_future.result()
+
+            for done_page, done_future in pending:
+                results[done_page] = done_future.result()
+
+        return results
+
+
+class PyMuPDFBackend:
+    """
+    Extração pelo PyMuPDF: a mais rápida e a que melhor lida com fontes sem mapeamento unicode.
+    """
+
+    name = "pymupdf"
+
+    @contextmanager
+    def open(self, document: Union[str, bytes]) -> Iterator[pymupdf.Document]:
+        with open_pymupdf(document) as doc:
+            yield doc
+
+    def extract(self, doc: pymupdf.Document, page_number: int) -> str:
+        return doc[page_number - 1].get_text()
+
+
+class PdfPlumberBackend:
+    """
+    Extração pelo pdfplumber, mais lenta, mas que reconhece tabelas: o texto fora das tabelas
+    vem primeiro e cada tabela vem depois, uma linha por linha da tabela, com as células
+    separadas por " | ".
+    """
+
+    name = "pdfplumber"
+
+    @contextmanager
+    def open(self, document: Union[str, bytes]) -> Iterator[Any]:
+        import pdfplumber
+
+        with open_pdf_stream(document) as stream, pdfplumber.open(stream) as pdf:
+            yield pdf
+
+    def extract(self, pdf: Any, page_number: int) -> str:
+        page = pdf.pages[page_number - 1]
+        try:
+            tables = page.find_tables()
+            outside = page
+            for table in tables:
+                outside = outside.outside_bbox(table.bbox)
+
+            parts = [outside.extract_text() or ""]
+            for table in tables:
+                parts.append(
+                    "\n".join(
+                        " | ".join(cell or "" for cell in row)
+                        for row in table.extract()
+                    )
+                )
+            return "\n\n".join(part for part in parts if part)
+        finally:
+            # Libera os objetos de layout da página, que o pdfplumber mantém em cache
+            page.close()
+
+
+class PyPDF2Backend:
+    """
+    Extração pelo PyPDF2, o parser antigo, mantido como alternativa.
+    """
+
+    name = "pypdf2"
+
+    @contextmanager
+    def open(self, document: Union[str, bytes]) -> Iterator[PdfReader]:
+        with open_pdf_stream(document) as stream:
+            yield PdfReader(stream)
+
+    def extract(self, pdf: PdfReader, page_number: int) -> str:
+        return pdf.pages[page_number - 1].extract_text() or ""
+
+
+EXTRACTION_BACKENDS = {
+    backend.name: backend
+    for backend in (PyMuPDFBackend(), PdfPlumberBackend(), PyPDF2Backend())
+}
+
+
+def text_quality(text: str) -> float:
+    """
+    Retorna a fração dos caracteres visíveis do texto que são legíveis (letras, números, pontuação
+    e símbolos). Fontes sem mapeamento unicode geram U+FFFD, caracteres de uso privado ou "(cid:N)".
+
+    Args:
+        text (str): Texto extraído da página.
+    """
+
+    text = CID_PATTERN.sub("\ufffd", text)
+    visible = [char for char in text if not char.isspace()]
+    if not visible:
+        return 0.0
+
+    readable = sum(
+        char != "\ufffd" and unicodedata.category(char)[0] in "LNPS" for char in visible
+    )
+    return readable / len(visible)
+
+
+def image_coverage(page: pymupdf.Page) -> float:
+    """
+    Retorna a fração da área da página coberta por imagens.
+
+    Args:
+        page (pymupdf.Page): Página já aberta do documento.
+    """
+
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+
+    covered = sum(
+        abs(pymupdf.Rect(image["bbox"]) & page.rect) for image in page.get_image_info()
+    )
+    return min(covered / page_area, 1.0)
+
+
+def count_rulings(page: pymupdf.Page) -> int:
+    """
+    Conta as linhas horizontais/verticais e retângulos desenhados na página, que indicam tabelas.
+
+    Args:
+        page (pymupdf.Page): Página já aberta do documento.
+    """
+
+    rulings = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "re":
+                rulings += 1
+            elif item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.x - end.x) < 1 or abs(start.y - end.y) < 1:
+                    rulings += 1
+    return rulings
+
+
+class TextExtractor:
+    def __init__(
+        self,
+        backend: str = "auto",
+        ocr_min_chars: int = 50,
+        ocr_min_text_quality: float = 0.6,
+        ocr_min_image_coverage: float = 0.5,
+        table_min_rulings: int = 8,
+    ):
+        if backend != "auto" and backend not in EXTRACTION_BACKENDS:
+            raise ValueError(f"PDF_EXTRACTION_BACKEND inválido: {backend}")
+
+        self.backend = backend
+        self.ocr_min_chars = ocr_min_chars
+        self.ocr_min_text_quality = ocr_min_text_quality
+        self.ocr_min_image_coverage = ocr_min_image_coverage
+        self.table_min_rulings = table_min_rulings
+        # No modo automático, páginas com tabelas só vão para o pdfplumber se ele estiver instalado
+        self.tables_backend = (
+            "pdfplumber" if backend == "auto" and find_spec("pdfplumber") else None
+        )
+
+    def choose_backend(self, page: pymupdf.Page) -> str:
+        """
+        Escolhe o backend de uma página: o configurado ou, no modo automático, o PyMuPDF,
+        trocando pelo pdfplumber em páginas com muitas linhas de tabela.
+
+        Args:
+            page (pymupdf.Page): Página já aberta do documento.
+        """
+        if self.backend != "auto":
+            return self.backend
+        if self.tables_backend and count_rulings(page) >= self.table_min_rulings:
+            return self.tables_backend
+        return "pymupdf"
+
+    def needs_ocr(self, text: str, page: pymupdf.Page) -> bool:
+        """
+        Decide se a página precisa de OCR.
+
+        Com texto suficiente, o OCR só é usado se o texto for ilegível (fonte sem mapeamento unicode).
+        Com pouco ou nenhum texto, só se a página for basicamente uma imagem; páginas em branco
+        ou com pouco texto e sem imagens (ex.: títulos de capítulo) ficam com o texto extraído.
+
+        Args:
+            text (str): Texto extraído da página.
+            page (pymupdf.Page): Página já aberta do documento.
+        """
+
+        text = text.strip()
+        if len(text) >= self.ocr_min_chars:
+            return text_quality(text) < self.ocr_min_text_quality
+        return image_coverage(page) >= self.ocr_min_image_coverage
+
+    def extract(
+        self, document: Union[str, bytes], first_page: int, last_page: int
+    ) -> Dict[int, ExtractedPage]:
+        """
+        Extrai o texto de um intervalo de páginas, abrindo cada backend no máximo uma vez.
+        Páginas que precisam de OCR ficam com o backend "ocr" e o texto vazio.
+
+        Args:
+            document (Union[str, bytes]): Caminho para o documento PDF ou seu conteúdo.
+            first_page (int): Primeira página do intervalo (começando em 1).
+            last_page (int): Última página do intervalo (inclusiva).
+        """
+
+        pages = {}
+        with ExitStack() as stack:
+            # O PyMuPDF sempre é aberto, pois também é usado para classificar as páginas
+            doc = stack.enter_context(open_pymupdf(document))
+            handles = {"pymupdf": doc}
+
+            for page_number in range(first_page, last_page + 1):
+                page = doc[page_number - 1]
+                name = self.choose_backend(page)
+                if name not in handles:
+                    handles[name] = stack.enter_context(
+                        EXTRACTION_BACKENDS[name].open(document)
+                    )
+                text = EXTRACTION_BACKENDS[name].extract(handles[name], page_number)
+
+                if self.needs_ocr(text, page):
+                    pages[page_number] = ExtractedPage("", "ocr")
+                else:
+                    pages[page_number] = ExtractedPage(text, name)
+
+        return pages
+
+
+def count_pages(document: Union[str, bytes]) -> int:
+    """
+    Retorna o número de páginas de um documento PDF.
+
+    Args:
+        document (Union[str, bytes]): Caminho para o documento PDF ou seu conteúdo.
+    """
+    with open_pymupdf(document) as doc:
+        return doc.page_count
+
+
+def extract_page_range(
+    document: Union[str, bytes],
+    first_page: int,
+    last_page: int,
+    text_extractor: TextExtractor,
+    ocr_engine: OCREngine,
+) -> PageRange:
+    """
+    Extrai o texto de um intervalo de páginas de um PDF, também usando OCR se necessário.
+
+    Fica num módulo leve, sem langchain, porque é executada nos processos do pool de extração.
+
+    Args:
+        document (Union[str, bytes]): Caminho para o documento PDF ou seu conteúdo.
+        first_page (int): Primeira página do intervalo (começando em 1).
+        last_page (int): Última página do intervalo (inclusiva).
+        text_extractor (TextExtractor): Extrai o texto e decide quais páginas precisam de OCR.
+        ocr_engine (OCREngine): Engine de OCR usada nas páginas digitalizadas.
+    """
+
+    started = time.perf_counter()
+    pages = text_extractor.extract(document, first_page, last_page)
+    extracted = time.perf_counter()
+
+    # Todas as páginas digitalizadas do intervalo são rasterizadas de uma vez
+    ocr_needed = [
+        page_number for page_number, page in pages.items() if page.backend == "ocr"
+    ]
+    if ocr_needed:
+        for page_number, text in ocr_engine.ocr_pages(document, ocr_needed).items():
+            pages[page_number] = ExtractedPage(text, "ocr")
+
+    return PageRange(
+        [pages[page_number] for page_number in range(first_page, last_page + 1)],
+        extracted - started,
+        time.perf_counter() - extracted,
+    )
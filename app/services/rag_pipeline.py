@@ -1,7 +1,20 @@
-from typing import List, Dict, Any, Tuple
+import os
+import asyncio
+from collections import Counter
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple, Union
 from .document_processor import DocumentProcessor
+from .document_source import DocumentSource
 from .vector_store import MilvusVectorStore
 from .llm_service import LangGraphLLMService
+from .answer_cache import AnswerCache
+from .reranker import create_reranker
+from .metrics import IN_FLIGHT, timed
+from .document_registry import (
+    DocumentRegistry,
+    chunk_hash,
+    chunk_id,
+    document_fingerprint,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,24 +30,212 @@ class RAGPipeline:
         self.document_processor = document_processor
         self.vector_store = vector_store
         self.llm_service = llm_service
+        self.document_registry = DocumentRegistry(
+            os.getenv("DOCUMENT_REGISTRY_PATH", "cache/documents.sqlite3") or None
+        )
+        similarity_threshold = os.getenv("ANSWER_CACHE_SIMILARITY")
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+            similarity_threshold=(
+                float(similarity_threshold) if similarity_threshold else None
+            ),
+        )
+        # Ingestão em streaming: chunks por lote de embedding e lotes em espera por estágio
+        self.ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        self.ingest_queue_size = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+        # Rerank opcional: busca mais candidatos e passa só os melhores ao LLM
+        self.reranker = create_reranker()
+        self.top_k = self.reranker.top_k if self.reranker else 5
+
+    def close(self):
+        """
+        Fecha o registro de documentos e encerra as threads do rerank.
+        """
+        self.document_registry.close()
+        if self.reranker is not None:
+            self.reranker.close()
 
     async def process_document(
-        self, file_path: str, filename: str, session_id: str = "default"
-    ) -> List[Dict[str, Any]]:
+        self,
+        document: Union[str, DocumentSource],
+        filename: str,
+        session_id: str = "default",
+        progress: Optional[Callable[[str, int], None]] = None,
+    ) -> int:
         """
         Processa um documento e armazena os embeddings e metadatas no Milvus DB
 
+        Extração, chunkenização, embedding e inserção rodam ao mesmo tempo, ligados por filas
+        limitadas: os primeiros chunks já ficam pesquisáveis antes do fim do documento e a
+        memória não cresce com o tamanho do documento.
+
+        Documentos sem alteração são ignorados, assim como o mesmo documento enviado com outro nome.
+        Numa nova versão de um documento, só os chunks com texto ou páginas diferentes são embedados
+        e atualizados, mesmo que mudem de posição, e os chunks que deixaram de existir são removidos.
+
         Args:
-            file_path (str): Caminho para o documento.
+            document (Union[str, DocumentSource]): Caminho para o documento ou o documento já carregado (em memória ou em disco).
             filename (str): Nome do documento para metadata.
             session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+            progress (Callable[[str, int], None], opcional): Recebe incrementos de progresso nos campos
+                "total_pages", "pages", "chunks", "embedded" e "inserted", e por backend de extração
+                em "pages_<backend>" (ex.: "pages_pymupdf", "pages_ocr").
+
+        Returns:
+            int: Número de chunks do documento (0 se o documento não mudou ou já foi indexado com outro nome).
         """
 
-        chunks = await self.document_processor.process_document(file_path, filename)
+        with IN_FLIGHT.track_in_progress(operation="ingest"), timed("ingest_document"):
+            return await self._process_document(
+                document, filename, session_id, progress
+            )
+
+    async def _process_document(
+        self,
+        document: Union[str, DocumentSource],
+        filename: str,
+        session_id: str,
+        progress: Optional[Callable[[str, int], None]],
+    ) -> int:
+        def report(field: str, amount: int):
+            if progress is not None:
+                progress(field, amount)
+
+        source = DocumentSource.of(document)
+        fingerprint = await asyncio.to_thread(document_fingerprint, source.document)
+        # O registro é SQLite, consultado numa thread para não bloquear o event loop
+        previous = await asyncio.to_thread(
+            self.document_registry.get, session_id, filename
+        )
+        if previous is not None and previous.fingerprint == fingerprint:
+            return 0
+        # O mesmo conteúdo já indexado com outro nome não é duplicado na coleção: o novo nome
+        # é registrado com os chunks do original, que ficam na coleção enquanto um dos dois os usar
+        if previous is None:
+            original = await asyncio.to_thread(
+                self.document_registry.find_source, session_id, fingerprint
+            )
+            if original is not None:
+                record = await asyncio.to_thread(
+                    self.document_registry.get, session_id, original
+                )
+                await asyncio.to_thread(
+                    self.document_registry.put,
+                    session_id,
+                    filename,
+                    fingerprint,
+                    record.chunk_ids,
+                    record.chunk_pages,
+                )
+                return 0
+
+        report("total_pages", await self.document_processor.count_pages(source))
+
+        # Páginas de cada chunk da versão anterior, para regravar só os que mudaram de página.
+        # Registros antigos não têm as páginas, então todos os seus chunks são regravados
+        previous_pages = {}
+        shared_ids = set()
+        if previous is not None:
+            previous_pages = dict.fromkeys(previous.chunk_ids)
+            previous_pages.update(zip(previous.chunk_ids, previous.chunk_pages))
+            # Chunks deste documento também registrados para outro com o mesmo conteúdo e outro nome
+            shared_ids = await asyncio.to_thread(
+                self.document_registry.borrowed_chunk_ids, session_id, filename
+            )
+        ids = []
+        pages = []
+        occurrences = Counter()
+
+        # Filas limitadas: um estágio lento segura os anteriores (backpressure)
+        embed_queue = asyncio.Queue(maxsize=self.ingest_queue_size)
+        insert_queue = asyncio.Queue(maxsize=self.ingest_queue_size)
+
+        async def counted_pages():
+            async for page in self.document_processor.iter_extracted_pages(source):
+                report("pages", 1)
+                # Páginas por backend de extração ("pages_pymupdf", "pages_ocr"...)
+                report(f"pages_{page.backend}", 1)
+                yield page.text
+
+        async def produce_batches():
+            batch = []
+            async for chunk in self.document_processor.iter_chunks(
+                counted_pages(), filename
+            ):
+                report("chunks", 1)
+                content_hash = chunk_hash(chunk.text)
+                occurrence = occurrences[content_hash]
+                occurrences[content_hash] += 1
+                chunk.id = chunk_id(filename, content_hash, occurrence)
+                if chunk.id in shared_ids and previous_pages.get(chunk.id) != (
+                    chunk.page_start,
+                    chunk.page_end,
+                ):
+                    # O outro documento continua nas páginas antigas, então o chunk que mudou
+                    # de página ganha um ID próprio em vez de sobrescrever o compartilhado
+                    chunk.id = chunk_id(
+                        f"{filename}#{chunk.page_start}-{chunk.page_end}",
+                        content_hash,
+                        occurrence,
+                    )
+                ids.append(chunk.id)
+                pages.append((chunk.page_start, chunk.page_end))
+
+                # Chunks da versão anterior com o mesmo conteúdo e as mesmas páginas já estão na
+                # coleção. Os que só mudaram de página são regravados; o embedding vem do cache
+                if previous_pages.get(chunk.id) == pages[-1]:
+                    continue
 
-        await self.vector_store.insert_chunks(chunks, session_id)
+                batch.append(chunk)
+                if len(batch) >= self.ingest_batch_size:
+                    await embed_queue.put(batch)
+                    batch = []
 
-        return chunks
+            if batch:
+                await embed_queue.put(batch)
+            await embed_queue.put(None)
+
+        async def embed_batches():
+            while (batch := await embed_queue.get()) is not None:
+                await insert_queue.put(
+                    await self.document_processor.embed_chunks(batch)
+                )
+                report("embedded", len(batch))
+            await insert_queue.put(None)
+
+        async def insert_batches():
+            while (batch := await insert_queue.get()) is not None:
+                await self.vector_store.insert_chunks(batch, session_id)
+                report("inserted", len(batch))
+                # Respostas em cache da sessão podem ter ficado desatualizadas
+                self.answer_cache.invalidate_session(session_id)
+
+        async with asyncio.TaskGroup() as stages:
+            stages.create_task(produce_batches())
+            stages.create_task(embed_batches())
+            stages.create_task(insert_batches())
+
+        stale_ids = sorted(set(previous_pages).difference(ids))
+        if stale_ids:
+            # Chunks ainda usados por um documento com outro nome e o mesmo conteúdo ficam
+            # (consultados de novo: o outro documento pode ter sido registrado durante a ingestão)
+            kept_ids = await asyncio.to_thread(
+                self.document_registry.shared_chunk_ids, session_id, filename, stale_ids
+            )
+            stale_ids = [stale_id for stale_id in stale_ids if stale_id not in kept_ids]
+        if stale_ids:
+            await self.vector_store.delete_chunks(stale_ids, session_id)
+            self.answer_cache.invalidate_session(session_id)
+
+        await asyncio.to_thread(
+            self.document_registry.put, session_id, filename, fingerprint, ids, pages
+        )
+
+        # Coleções que cresceram podem precisar de outro perfil de índice
+        await self.vector_store.ensure_index(session_id)
+
+        return len(ids)
 
     async def answer_question(
         self, question: str, chat_history: list, session_id: str
@@ -48,15 +249,185 @@ class RAGPipeline:
             session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
         """
 
-        question_embedding = self.document_processor.embeddings.embed_query(question)
+        with IN_FLIGHT.track_in_progress(operation="question"):
+            question_embedding = await self.document_processor.embeddings.embed_query(
+                question
+            )
+
+            # Retrieval dos chunks mais relevantes
+            [context_chunks] = await self._retrieve(
+                [question_embedding], [question], session_id
+            )
+
+            return await self._generate(
+                question, chat_history, session_id, question_embedding, context_chunks
+            )
+
+    async def _retrieve(
+        self,
+        question_embeddings: List[List[float]],
+        questions: List[str],
+        session_id: str,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca os chunks de cada mensagem. Com o reranker ativo, busca RERANK_CANDIDATES candidatos
+        e mantém só os RERANK_TOP_K melhores segundo ele.
+
+        Args:
+            question_embeddings (List[List[float]]): Embeddings das mensagens.
+            questions (List[str]): As mensagens do usuário.
+            session_id (str): Define o ID da coleção do Milvus.
+        """
+
+        if self.reranker is None:
+            with timed("retrieve"):
+                return await self.vector_store.search_many(
+                    question_embeddings,
+                    top_k=self.top_k,
+                    session_id=session_id,
+                    query_texts=questions,
+                )
+
+        with timed("retrieve"):
+            candidates = await self.vector_store.search_many(
+                question_embeddings,
+                top_k=max(self.reranker.candidates, self.top_k),
+                session_id=session_id,
+                query_texts=questions,
+            )
+        with timed("rerank"):
+            return await self.reranker.rerank_many(questions, candidates)
 
-        # Retrieval dos chunks mais relevantes
-        context_chunks = await self.vector_store.search_similar_chunks(
-            question_embedding, top_k=5, session_id=session_id
+    async def _generate(
+        self,
+        question: str,
+        chat_history: list,
+        session_id: str,
+        question_embedding: List[float],
+        context_chunks: List[Dict[str, Any]],
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Gera a resposta para os chunks já recuperados, consultando antes o cache de respostas.
+
+        Args:
+            question (str): A mensagem do usuário.
+            chat_history (list): Histórico de conversa para contexto conversacional.
+            session_id (str): Define o ID da coleção do Milvus.
+            question_embedding (List[float]): Embedding da mensagem do usuário.
+            context_chunks (List[Dict[str, Any]]): Chunks recuperados para a mensagem.
+        """
+
+        chunk_ids = [chunk["id"] for chunk in context_chunks]
+
+        cached = self.answer_cache.get(
+            session_id, chunk_ids, chat_history, question, question_embedding
         )
+        if cached is not None:
+            return cached.answer, cached.context_chunks
 
         answer = await self.llm_service.generate_answer(
             question, chat_history, context_chunks
         )
 
+        self.answer_cache.put(
+            session_id,
+            chunk_ids,
+            chat_history,
+            question,
+            question_embedding,
+            answer,
+            context_chunks,
+        )
+
         return answer, context_chunks
+
+    async def answer_questions(
+        self, questions: List[str], chat_history: list, session_id: str
+    ) -> List[Union[Tuple[str, List[Dict[str, Any]]], Exception]]:
+        """
+        Responde várias mensagens de uma vez: um lote de embeddings, uma única busca e as chamadas
+        ao LLM em paralelo (limitadas pelo LLM_MAX_CONCURRENCY).
+
+        Args:
+            questions (List[str]): As mensagens do usuário.
+            chat_history (list, opcional): Histórico de conversa compartilhado por todas as mensagens.
+            session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+
+        Returns:
+            List[Union[Tuple[str, List[Dict[str, Any]]], Exception]]: Para cada mensagem, na mesma ordem,
+                a resposta e os chunks usados, ou a exceção da sua chamada ao LLM.
+        """
+
+        with IN_FLIGHT.track_in_progress(operation="question"):
+            question_embeddings = (
+                await self.document_processor.embeddings.embed_queries(questions)
+            )
+            context_chunks = await self._retrieve(
+                question_embeddings, questions, session_id
+            )
+
+            # Uma falha (ex.: timeout do LLM) não derruba as outras respostas do lote
+            return await asyncio.gather(
+                *[
+                    self._generate(
+                        question, chat_history, session_id, embedding, chunks
+                    )
+                    for question, embedding, chunks in zip(
+                        questions, question_embeddings, context_chunks
+                    )
+                ],
+                return_exceptions=True,
+            )
+
+    async def stream_answer(
+        self, question: str, chat_history: list, session_id: str
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Responde a mensagem do usuário usando a pipeline do RAG, em eventos incrementais.
+
+        Primeiro é emitido o evento "context" com os chunks recuperados, depois um evento "token"
+        para cada trecho da resposta gerado pelo LLM.
+
+        Args:
+            question (str): A mensagem do usuário.
+            chat_history (list, opcional): Uma lista de mensagens como histórico de conversa para contexto conversacional.
+            session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+        """
+
+        # O gauge só desce quando o stream termina, inclusive se o cliente desconectar no meio
+        with IN_FLIGHT.track_in_progress(operation="question"):
+            question_embedding = await self.document_processor.embeddings.embed_query(
+                question
+            )
+
+            [context_chunks] = await self._retrieve(
+                [question_embedding], [question], session_id
+            )
+            chunk_ids = [chunk["id"] for chunk in context_chunks]
+
+            cached = self.answer_cache.get(
+                session_id, chunk_ids, chat_history, question, question_embedding
+            )
+            if cached is not None:
+                yield "context", cached.context_chunks
+                yield "token", cached.answer
+                return
+
+            yield "context", context_chunks
+
+            tokens = []
+            async for token in self.llm_service.stream_answer(
+                question, chat_history, context_chunks
+            ):
+                tokens.append(token)
+                yield "token", token
+
+            self.answer_cache.put(
+                session_id,
+                chunk_ids,
+                chat_history,
+                question,
+                question_embedding,
+                "".join(tokens),
+                context_chunks,
+            )
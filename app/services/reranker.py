@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from .keyword_index import tokenize
+from .metrics import RERANK_FALLBACKS
+
+# Intervalo entre as tentativas de pegar uma thread livre do rerank
+SLOT_POLL_SECONDS = 0.005
+
+
+class LexicalScorer:
+    """
+    Score lexical barato: BM25 dos termos da pergunta calculado só sobre os candidatos, mais um bônus
+    pela fração dos termos da pergunta que aparecem no chunk. Vetorizado com NumPy por pergunta.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, coverage_weight: float = 1.0):
+        self.k1 = k1
+        self.b = b
+        self.coverage_weight = coverage_weight
+
+    def _score(self, query: str, texts: List[str]) -> np.ndarray:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not texts:
+            return np.zeros(len(texts), dtype=np.float32)
+
+        term_positions = {term: i for i, term in enumerate(terms)}
+        # Frequência de cada termo da pergunta em cada candidato (candidatos x termos)
+        frequencies = np.zeros((len(texts), len(terms)), dtype=np.float32)
+        lengths = np.empty(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token in tokens:
+                column = term_positions.get(token)
+                if column is not None:
+                    frequencies[row, column] += 1
+
+        document_frequency = (frequencies > 0).sum(axis=0)
+        idf = np.log1p(
+            (len(texts) - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+        length_norm = 1 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0)
+        bm25 = (
+            idf
+            * frequencies
+            * (self.k1 + 1)
+            / (frequencies + self.k1 * length_norm[:, None])
+        ).sum(axis=1)
+        coverage = (frequencies > 0).mean(axis=1)
+
+        return bm25 + self.coverage_weight * coverage
+
+    def score_many(
+        self, queries: List[str], candidate_texts: List[List[str]]
+    ) -> List[np.ndarray]:
+        """
+        Pontua os candidatos de cada pergunta.
+
+        Args:
+            queries (List[str]): Perguntas.
+            candidate_texts (List[List[str]]): Textos dos candidatos de cada pergunta.
+        """
+        return [
+            self._score(query, texts) for query, texts in zip(queries, candidate_texts)
+        ]
+
+
+class CrossEncoderScorer:
+    """
+    Cross-encoder local (sentence-transformers) rodando na CPU. Os pares de todas as perguntas
+    vão num só `predict`, em lotes.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        batch_size: int = 32,
+        device: str = "cpu",
+    ):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "O reranker cross-encoder precisa do pacote `sentence-transformers` instalado."
+            ) from e
+
+        self.model = CrossEncoder(model_name, device=device)
+        self.batch_size = batch_size
+
+    def score_many(
+        self, queries: List[str], candidate_texts: List[List[str]]
+    ) -> List[np.ndarray]:
+        """
+        Pontua os candidatos de cada pergunta.
+
+        Args:
+            queries (List[str]): Perguntas.
+            candidate_texts (List[List[str]]): Textos dos candidatos de cada pergunta.
+        """
+
+        pairs = [
+            (query, text)
+            for query, texts in zip(queries, candidate_texts)
+            for text in texts
+        ]
+        if not pairs:
+            return [np.zeros(0, dtype=np.float32) for _ in queries]
+
+        scores = np.asarray(
+            self.model.predict(
+                pairs, batch_size=self.batch_size, convert_to_numpy=True
+            ),
+            dtype=np.float32,
+        )
+        boundaries = np.cumsum([len(texts) for texts in candidate_texts])[:-1]
+        return np.split(scores, boundaries)
+
+
+class Reranker:
+    def __init__(
+        self,
+        scorer,
+        candidates: int = 50,
+        top_k: int = 5,
+        budget_ms: Optional[float] = None,
+        workers: Optional[int] = None,
+    ):
+        self.scorer = scorer
+        self.candidates = candidates
+        self.top_k = top_k
+        self.budget_seconds = budget_ms / 1000 if budget_ms else None
+        # Média móvel do tempo por par (pergunta, chunk), para prever se o rerank cabe no orçamento
+        self._seconds_per_pair = None
+        # Threads próprias do rerank: um rerank que estourou o orçamento continua rodando até o fim,
+        # e no executor padrão ocuparia as threads do resto da aplicação
+        workers = max(1, workers or os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="rerank"
+        )
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def _within_budget(self, pairs: int, seconds: Optional[float]) -> bool:
+        if seconds is None or self._seconds_per_pair is None:
+            return True
+        return self._seconds_per_pair * pairs <= seconds
+
+    async def _acquire_slot(self, deadline: Optional[float]) -> bool:
+        """
+        Espera uma thread livre do rerank até `deadline` (em `time.perf_counter`), ou sem limite.
+
+        A vaga é tentada sem bloquear, em intervalos curtos, para a espera não ocupar uma thread
+        e poder ser cancelada sem perder a vaga.
+
+        Args:
+            deadline (float, opcional): Momento limite para conseguir a vaga.
+        """
+        while not self._slots.acquire(blocking=False):
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+        return True
+
+    async def rerank_many(
+        self, queries: List[str], candidates: List[List[Dict[str, Any]]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Reordena os candidatos de cada pergunta pelo scorer e mantém os `top_k` melhores.
+
+        Com todas as threads do rerank ocupadas, espera uma delas dentro do orçamento
+        (RERANK_BUDGET_MS por pergunta). Se a vaga não vier a tempo, a previsão de tempo passar
+        do que resta do orçamento ou o rerank demorar mais que ele, os candidatos seguem na ordem
+        da busca, contados em `rag_rerank_fallbacks_total`. O "score" passa a ser o do rerank, e o
+        da busca fica em "retrieval_score".
+
+        Args:
+            queries (List[str]): Perguntas.
+            candidates (List[List[Dict[str, Any]]]): Chunks recuperados para cada pergunta, na ordem da busca.
+        """
+
+        def fallback(reason: Optional[str] = None):
+            if reason is not None:
+                RERANK_FALLBACKS.inc(reason=reason)
+            return [chunks[: self.top_k] for chunks in candidates]
+
+        pairs = sum(len(chunks) for chunks in candidates)
+        if not pairs:
+            return fallback()
+
+        started = time.perf_counter()
+        budget = (
+            self.budget_seconds * len(queries)
+            if self.budget_seconds is not None
+            else None
+        )
+        if not self._within_budget(pairs, budget):
+            # Reduz a estimativa a cada rerank pulado, para voltar a tentar quando a carga baixar
+            self._seconds_per_pair *= 0.9
+            return fallback("estimate")
+
+        # Threads ocupadas, inclusive por reranks que já estouraram o orçamento: espera dentro dele
+        if not await self._acquire_slot(None if budget is None else started + budget):
+            return fallback("busy")
+
+        remaining = None if budget is None else budget - (time.perf_counter() - started)
+        if not self._within_budget(pairs, remaining):
+            self._slots.release()
+            return fallback("estimate")
+
+        scoring_started = time.perf_counter()
+        future = self._executor.submit(
+            self.scorer.score_many,
+            queries,
+            [[chunk["text"] for chunk in chunks] for chunks in candidates],
+        )
+        # A vaga só é devolvida quando o scorer termina de fato, não quando a espera é cancelada
+        future.add_done_callback(lambda _: self._slots.release())
+        task = asyncio.wrap_future(future)
+        try:
+            if remaining is None:
+                scores = await task
+            else:
+                scores = await asyncio.wait_for(task, timeout=remaining)
+        except asyncio.TimeoutError:
+            # A thread termina sozinha e segura a vaga até lá; o custo real é desconhecido, mas passou do orçamento
+            self._seconds_per_pair = 2 * (time.perf_counter() - scoring_started) / pairs
+            return fallback("timeout")
+
+        elapsed = (time.perf_counter() - scoring_started) / pairs
+        self._seconds_per_pair = (
+            elapsed
+            if self._seconds_per_pair is None
+            else 0.8 * self._seconds_per_pair + 0.2 * elapsed
+        )
+
+        results = []
+        for chunks, chunk_scores in zip(candidates, scores):
+            best = np.argsort(-chunk_scores, kind="stable")[: self.top_k]
+            results.append(
+                [
+                    {
+                        **chunks[i],
+                        "retrieval_score": chunks[i].get("score"),
+                        "score": float(chunk_scores[i]),
+                    }
+                    for i in best.tolist()
+                ]
+            )
+
+        return results
+
+    def close(self):
+        """
+        Encerra as threads do rerank, sem esperar reranks em andamento.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_reranker() -> Optional[Reranker]:
+    """
+    Cria o reranker configurado em RERANKER (`none`, `lexical` ou `cross-encoder`).
+    """
+
+    kind = os.getenv("RERANKER", "none").lower()
+    if kind == "none":
+        return None
+
+    if kind == "lexical":
+        scorer = LexicalScorer()
+    elif kind == "cross-encoder":
+        scorer = CrossEncoderScorer(
+            os.getenv(
+                "RERANK_MODEL_NAME", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+            ),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", "32")),
+            device=os.getenv("RERANK_DEVICE", "cpu"),
+        )
+    else:
+        raise ValueError(f"RERANKER inválido: {kind}")
+
+    budget_ms = os.getenv("RERANK_BUDGET_MS", "200")
+    workers = os.getenv("RERANK_WORKERS", "")
+    return Reranker(
+        scorer,
+        candidates=int(os.getenv("RERANK_CANDIDATES", "50")),
+        top_k=int(os.getenv("RERANK_TOP_K", "5")),
+        budget_ms=float(budget_ms) if budget_ms else None,
+        workers=int(workers) if workers else None,
+    )
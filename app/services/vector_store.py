@@ -1,4 +1,10 @@
 import os
+import json
+import random
+import time
+import asyncio
+import logging
+import numpy as np
 from pymilvus import (
     connections,
     utility,
@@ -7,15 +13,173 @@ from pymilvus import (
     DataType,
     Collection,
 )
-from typing import List, Dict, Any
-import uuid
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Any, Optional
 from dotenv import load_dotenv
+from .chunking import Chunk
+from .embedding_cache import EmbeddingCache, embedding_key
+from .keyword_index import BM25Index, reciprocal_rank_fusion
+from .metrics import CACHE_REQUESTS, RESCORED_QUERIES, timed
+from .index_profiles import (
+    INDEX_PROFILES,
+    SQ8_INDEX_TYPES,
+    as_float32,
+    build_index_params,
+    build_search_params,
+    choose_index_type,
+    exact_top_k,
+    recall_at_k,
+    truncate_vectors,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Máximo de consultas enviadas ao Milvus numa mesma requisição de busca
+SEARCH_BATCH_SIZE = 1024
+
+# Tipo do campo de embedding para cada MILVUS_VECTOR_TYPE; no sq8 a quantização fica no índice
+VECTOR_DATA_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "sq8": DataType.FLOAT_VECTOR,
+}
+
+
+class CollectionManager:
+    def __init__(
+        self,
+        open_collection: Callable[[str], Collection],
+        max_loaded: int,
+        on_release: Optional[Callable[[str], None]] = None,
+    ):
+        self.open_collection = open_collection
+        self.max_loaded = max(1, max_loaded)
+        self.on_release = on_release
+        self._collections = OrderedDict()
+        # Operações em andamento por sessão; coleções em uso não são liberadas
+        self._in_use = Counter()
+        self._load_locks = defaultdict(asyncio.Lock)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @asynccontextmanager
+    async def use(self, session_id: str) -> AsyncIterator[Collection]:
+        """
+        Entrega a coleção carregada da sessão durante uma operação, carregando-a só no primeiro uso.
+
+        Quando o limite de coleções carregadas é atingido, a coleção sem uso há mais tempo é liberada.
+        Coleções em uso por outra operação só são liberadas quando a última operação termina, então o
+        limite pode ser ultrapassado enquanto isso. A abertura, o carregamento e a liberação rodam numa
+        thread, fora do event loop.
+
+        Args:
+            session_id (str): ID da sessão (nome da coleção no Milvus).
+        """
+
+        collection = await self._acquire(session_id)
+        try:
+            yield collection
+        finally:
+            self._in_use[session_id] -= 1
+            if not self._in_use[session_id]:
+                del self._in_use[session_id]
+            await self._evict()
+
+    async def _acquire(self, session_id: str) -> Collection:
+        """
+        Retorna a coleção da sessão já marcada como em uso; chamado pelo `use`.
+
+        Args:
+            session_id (str): ID da sessão (nome da coleção no Milvus).
+        """
+
+        if session_id in self._collections:
+            self.hits += 1
+        else:
+            # Requisições simultâneas da mesma sessão esperam um único carregamento
+            async with self._load_locks[session_id]:
+                if session_id in self._collections:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    with timed("vector_load"):
+                        collection = await asyncio.to_thread(self._load, session_id)
+                    self._collections[session_id] = collection
+
+        self._collections.move_to_end(session_id)
+        self._in_use[session_id] += 1
+        return self._collections[session_id]
+
+    async def _evict(self):
+        """
+        Libera as coleções sem uso há mais tempo até voltar ao limite de coleções carregadas.
+        """
+
+        while len(self._collections) > self.max_loaded:
+            session_id = next(
+                (
+                    session_id
+                    for session_id in self._collections
+                    if not self._in_use[session_id]
+                ),
+                None,
+            )
+            if session_id is None:
+                # Todas em uso: a próxima operação que terminar tenta de novo
+                return
+
+            collection = self._collections.pop(session_id)
+            # Um novo carregamento da sessão espera a liberação terminar
+            async with self._load_locks[session_id]:
+                await asyncio.to_thread(collection.release)
+            self.evictions += 1
+            if self.on_release is not None:
+                self.on_release(session_id)
+
+    def _load(self, session_id: str) -> Collection:
+        """
+        Abre e carrega a coleção da sessão; chamado numa thread pelo `use`.
+
+        Args:
+            session_id (str): ID da sessão (nome da coleção no Milvus).
+        """
+        collection = self.open_collection(session_id)
+        collection.load()
+        return collection
+
+    def release_all(self):
+        """
+        Libera todas as coleções carregadas.
+        """
+        while self._collections:
+            session_id, collection = self._collections.popitem(last=False)
+            collection.release()
+            if self.on_release is not None:
+                self.on_release(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retorna as métricas de uso do cache de coleções.
+        """
+        return {
+            "loaded": len(self._collections),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
 
 class MilvusVectorStore:
-    def __init__(self):
+    def __init__(
+        self,
+        dim: int = 1536,
+        model_name: str = "",
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
         self.host = os.getenv("MILVUS_HOST", "localhost")
         self.port = os.getenv("MILVUS_PORT", "19530")
         connections.connect(
@@ -23,114 +187,881 @@ class MilvusVectorStore:
             host=self.host,
             port=self.port,
         )
-        self.dim = 1536  # A OpenAI faz o uso de vetores de embedding com dimensão 1536
-        self.collection = None
+        # Dimensão e modelo dos embeddings, gravados no schema de cada coleção criada
+        self.dim = dim
+        self.model_name = model_name
+
+        # Representação compacta dos vetores: float16 (metade da memória), sq8 (índice em int8) e/ou
+        # só as MILVUS_VECTOR_DIM primeiras dimensões dos embeddings (modelos treinados com Matryoshka)
+        self.vector_type = os.getenv("MILVUS_VECTOR_TYPE", "float32").lower()
+        if self.vector_type not in VECTOR_DATA_TYPES:
+            raise ValueError(f"MILVUS_VECTOR_TYPE inválido: {self.vector_type}")
+        stored_dim = os.getenv("MILVUS_VECTOR_DIM")
+        self.stored_dim = min(int(stored_dim), dim) if stored_dim else dim
+        # Busca em dois estágios nas coleções compactas: MILVUS_RESCORE_MULTIPLIER vezes mais candidatos,
+        # re-pontuados com os embeddings completos guardados no cache de embeddings
+        self.rescore_multiplier = int(os.getenv("MILVUS_RESCORE_MULTIPLIER", "4"))
+        self.embedding_cache = embedding_cache
+        compact = self.vector_type != "float32" or self.stored_dim < dim
+        if compact and self.rescore_multiplier > 1:
+            if embedding_cache is None:
+                raise ValueError(
+                    "Vetores compactos com MILVUS_RESCORE_MULTIPLIER > 1 precisam do cache de embeddings."
+                )
+            if not embedding_cache.persistent:
+                logger.warning(
+                    "Cache de embeddings só em memória (EMBEDDING_CACHE_PATH vazio): depois de um restart, "
+                    "as buscas nos vetores compactos ficam sem re-score até os chunks serem reindexados."
+                )
+        # Coleções carregadas na memória do Milvus, no máximo MILVUS_MAX_LOADED_COLLECTIONS
+        self.collections = CollectionManager(
+            self._open_collection,
+            max_loaded=int(os.getenv("MILVUS_MAX_LOADED_COLLECTIONS", "32")),
+            on_release=self._drop_keyword_index,
+        )
+
+        # Busca híbrida: índice BM25 local por sessão, combinado à busca vetorial por RRF
+        self.hybrid_search = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+        self.dense_weight = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+        self.keyword_weight = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        self.candidate_multiplier = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
 
-    def _create_collection_if_not_exists(self, session_id: str = "default"):
+        # Índice de cada coleção: AUTO escolhe pelo tamanho (FLAT, HNSW e, nas grandes, MILVUS_LARGE_INDEX_TYPE)
+        self.index_type = os.getenv("MILVUS_INDEX_TYPE", "AUTO").upper()
+        self.flat_max_rows = int(os.getenv("MILVUS_FLAT_MAX_ROWS", "20000"))
+        self.hnsw_max_rows = int(os.getenv("MILVUS_HNSW_MAX_ROWS", "2000000"))
+        self.large_index_type = os.getenv("MILVUS_LARGE_INDEX_TYPE", "DISKANN").upper()
+        self.hnsw_m = int(os.getenv("MILVUS_HNSW_M", "16"))
+        self.hnsw_ef_construction = int(os.getenv("MILVUS_HNSW_EF_CONSTRUCTION", "200"))
+
+        # Ajuste automático do ef/nprobe pelo recall@k medido contra a busca exata. Desligado por padrão,
+        # pois percorre a coleção inteira; `POST /index/tune` faz o ajuste sob demanda
+        recall_target = os.getenv("MILVUS_RECALL_TARGET", "")
+        self.recall_target = float(recall_target) if recall_target else None
+        self.tuning_sample_size = int(os.getenv("MILVUS_TUNING_SAMPLE_SIZE", "100"))
+        self.tuning_k = int(os.getenv("MILVUS_TUNING_K", "10"))
+        # Por sessão: tipo do índice, valor ajustado do parâmetro de busca e tamanho da coleção no ajuste
+        self._index_types = {}
+        self._search_values = {}
+        self._tuned_sizes = {}
+        # Linhas de cada coleção: contadas no Milvus ao abrir e mantidas pelos resultados de upsert/delete
+        self._row_counts = {}
+        self._keyword_indexes = {}
+        self._keyword_locks = defaultdict(asyncio.Lock)
+        # Inserções e remoções de uma sessão esperam a troca de índice, que copia a coleção
+        self._write_locks = defaultdict(asyncio.Lock)
+
+    def ping(self, timeout: float = 2.0):
         """
-        Cria a coleção do Milvus DB caso não exista.
+        Verifica se o servidor do Milvus responde, lançando exceção se não responder.
 
         Args:
-            session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+            timeout (float): Tempo máximo de espera, em segundos.
+        """
+        utility.get_server_version(timeout=timeout)
+
+    def close(self):
+        """
+        Libera as coleções carregadas e desconecta do Milvus.
+        """
+        self.collections.release_all()
+        connections.disconnect("default")
+
+    def _drop_keyword_index(self, session_id: str):
+        """
+        Descarta o índice BM25 de uma sessão liberada; ele é reconstruído no próximo uso.
+        """
+        self._keyword_indexes.pop(session_id, None)
+        self._keyword_locks.pop(session_id, None)
+        self._index_types.pop(session_id, None)
+        self._row_counts.pop(session_id, None)
+
+    async def _get_keyword_index(self, session_id: str) -> BM25Index:
+        """
+        Retorna o índice BM25 da sessão, construindo-o a partir da coleção no primeiro uso.
+
+        Args:
+            session_id (str): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+        """
+
+        async with self._keyword_locks[session_id]:
+            if session_id not in self._keyword_indexes:
+
+                def build_index(collection: Collection) -> BM25Index:
+                    iterator = collection.query_iterator(
+                        batch_size=1000, output_fields=["id", "text"]
+                    )
+                    index = BM25Index()
+                    while batch := iterator.next():
+                        for row in batch:
+                            index.add(row["id"], row["text"])
+                    iterator.close()
+                    return index
+
+                # Leitura da coleção e tokenização numa thread, fora do event loop
+                async with self.collections.use(session_id) as collection:
+                    self._keyword_indexes[session_id] = await asyncio.to_thread(
+                        build_index, collection
+                    )
+
+            return self._keyword_indexes[session_id]
+
+    def _embedding_field(self, collection: Collection) -> FieldSchema:
+        return next(
+            field for field in collection.schema.fields if field.name == "embedding"
+        )
+
+    def _check_schema(self, collection: Collection):
+        """
+        Garante que uma coleção existente foi criada com o mesmo modelo de embedding configurado.
+
+        Args:
+            collection (Collection): Coleção já existente no Milvus.
         """
 
-        if not self.collection:
-            if utility.has_collection(session_id):
-                self.collection = Collection(session_id)
-            else:
-                # Schema da coleção
-                fields = [
-                    FieldSchema(
-                        name="id",
-                        dtype=DataType.VARCHAR,
-                        is_primary=True,
-                        max_length=36,
-                    ),
-                    FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-                    FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=255),
-                    FieldSchema(
-                        name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dim
-                    ),
+        dim = self._embedding_field(collection).params.get("dim")
+        model_name = collection.schema.description
+
+        if int(dim) != self.stored_dim or (
+            model_name and self.model_name and model_name != self.model_name
+        ):
+            raise ValueError(
+                f"A coleção {collection.name} foi criada com o modelo {model_name or 'desconhecido'} "
+                f"(dimensão {dim}), mas o modelo configurado é {self.model_name} (dimensão {self.stored_dim})."
+            )
+
+    def _index_params(self, num_rows: int) -> Dict[str, Any]:
+        """
+        Parâmetros do índice para uma coleção com `num_rows` vetores.
+
+        Args:
+            num_rows (int): Número de vetores da coleção.
+        """
+        index_type = self.index_type
+        if index_type == "AUTO":
+            index_type = choose_index_type(
+                num_rows, self.flat_max_rows, self.hnsw_max_rows, self.large_index_type
+            )
+        return build_index_params(
+            index_type,
+            num_rows,
+            self.stored_dim,
+            self.hnsw_m,
+            self.hnsw_ef_construction,
+            scalar_quantization=self.vector_type == "sq8",
+        )
+
+    def _current_index_type(self, collection: Collection) -> str:
+        """
+        Tipo do índice vetorial da coleção, consultado no Milvus só na primeira vez.
+
+        Args:
+            collection (Collection): Coleção da sessão.
+        """
+        if collection.name not in self._index_types:
+            index = next(
+                index for index in collection.indexes if index.field_name == "embedding"
+            )
+            self._index_types[collection.name] = index.params["index_type"]
+        return self._index_types[collection.name]
+
+    def _row_count(self, collection: Collection) -> int:
+        """
+        Número de linhas da coleção, incluindo as ainda não persistidas, sem forçar um flush.
+
+        O count(*) roda só na primeira vez; depois o número é atualizado pelos resultados das
+        inserções e remoções. Um upsert que substitui um chunk existente conta como linha nova,
+        então o número pode ficar acima do real até a coleção ser reaberta ou o índice trocado.
+
+        Args:
+            collection (Collection): Coleção carregada da sessão.
+        """
+        if collection.name not in self._row_counts:
+            rows = collection.query(expr="", output_fields=["count(*)"])
+            self._row_counts[collection.name] = int(rows[0]["count(*)"])
+        return self._row_counts[collection.name]
+
+    def _count_rows(self, session_id: str, delta: int):
+        """
+        Atualiza o número de linhas da sessão, se ele já foi contado.
+
+        Args:
+            session_id (str): ID da sessão (coleção do Milvus).
+            delta (int): Linhas inseridas (positivo) ou removidas (negativo).
+        """
+        if session_id in self._row_counts:
+            self._row_counts[session_id] = max(0, self._row_counts[session_id] + delta)
+
+    def _rebuild_index(self, collection: Collection):
+        """
+        Troca o índice da coleção se o perfil adequado ao tamanho atual mudou.
+
+        O novo índice é construído numa coleção sombra com uma cópia dos dados, enquanto a coleção
+        atual continua carregada e respondendo às buscas. No fim, o nome da sessão passa a ser um
+        alias da coleção sombra e só então a coleção antiga é removida. Coleções criadas antes dos
+        aliases são renomeadas para liberar o nome do alias e ficam indisponíveis só entre a troca
+        de nome e a criação do alias, na primeira troca.
+
+        Args:
+            collection (Collection): Coleção carregada da sessão.
+        """
+
+        index_params = self._index_params(self._row_count(collection))
+        if index_params["index_type"] == self._current_index_type(collection):
+            return
+
+        session_id = collection.name
+        shadow_name = (
+            f"{session_id}_{index_params['index_type'].lower()}_{int(time.time())}"
+        )
+        shadow = Collection(name=shadow_name, schema=collection.schema)
+
+        field_names = [field.name for field in collection.schema.fields]
+        num_rows = 0
+        for batch in self._iterate(collection, field_names):
+            num_rows += len(batch)
+            shadow.insert(
+                [
+                    (
+                        self._stored_vectors(
+                            collection, [as_float32(row["embedding"]) for row in batch]
+                        )
+                        if name == "embedding"
+                        else [row[name] for row in batch]
+                    )
+                    for name in field_names
                 ]
-                schema = CollectionSchema(fields=fields)
+            )
+        shadow.flush()
+        shadow.create_index(field_name="embedding", index_params=index_params)
+        utility.wait_for_index_building_complete(shadow_name)
+        shadow.load()
 
-                # Instancia e cria a coleção
-                self.collection = Collection(name=session_id, schema=schema)
+        # Nome físico da coleção atual: o próprio session_id ou o alvo do alias
+        current_name = collection.describe()["collection_name"]
+        if current_name == session_id:
+            current_name = f"{session_id}_old_{int(time.time())}"
+            utility.rename_collection(session_id, current_name)
+            utility.create_alias(shadow_name, session_id)
+        else:
+            utility.alter_alias(shadow_name, session_id)
+        # A coleção antiga só é removida depois que o alias aponta para a sombra
+        utility.drop_collection(current_name)
 
-                # Cria o index para buscas
-                index_params = {
-                    "metric_type": "COSINE",
-                    "index_type": "HNSW",
-                    "params": {"M": 8, "efConstruction": 64},
-                }
-                self.collection.create_index(
-                    field_name="embedding", index_params=index_params
-                )
+        self._index_types[session_id] = index_params["index_type"]
+        self._row_counts[session_id] = num_rows
+        self._search_values.pop(session_id, None)
+        self._tuned_sizes.pop(session_id, None)
+
+    def _iterate(
+        self, collection: Collection, output_fields: List[str]
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Percorre todas as linhas da coleção em lotes.
+
+        Args:
+            collection (Collection): Coleção carregada da sessão.
+            output_fields (List[str]): Campos retornados de cada linha.
+        """
+        iterator = collection.query_iterator(
+            batch_size=1000, output_fields=output_fields
+        )
+        while batch := iterator.next():
+            yield batch
+        iterator.close()
+
+    def _measure_full_precision_recall(
+        self, collection: Collection, sample_ids: List[str]
+    ) -> Dict[str, Optional[float]]:
+        """
+        Mede o recall@k contra a busca exata nos embeddings completos do cache: da busca só nos
+        vetores compactos ("compact_recall") e da busca em dois estágios ("rescored_recall").
+        Linhas fora do cache de embeddings ficam de fora da busca exata.
+
+        Args:
+            collection (Collection): Coleção carregada da sessão, com vetores compactos.
+            sample_ids (List[str]): IDs dos chunks usados como consultas.
+        """
+
+        def full_vectors(rows):
+            keys = [embedding_key(self.model_name, row["text"]) for row in rows]
+            vectors = self.embedding_cache.get_many(keys)
+            return [
+                {"id": row["id"], "embedding": vectors[key]}
+                for row, key in zip(rows, keys)
+                if key in vectors
+            ]
+
+        queries = full_vectors(
+            collection.query(
+                expr=f"id in {json.dumps(sample_ids)}", output_fields=["id", "text"]
+            )
+        )
+        if not queries:
+            return {"compact_recall": None, "rescored_recall": None}
+
+        query_embeddings = [row["embedding"] for row in queries]
+        exact = exact_top_k(
+            np.asarray(query_embeddings, dtype=np.float32),
+            (
+                full_vectors(batch)
+                for batch in self._iterate(collection, ["id", "text"])
+            ),
+            self.tuning_k,
+        )
+
+        compact = collection.search(
+            data=self._stored_vectors(collection, query_embeddings),
+            anns_field="embedding",
+            param=build_search_params(
+                self._current_index_type(collection),
+                self.tuning_k,
+                self._search_values.get(collection.name),
+            ),
+            limit=self.tuning_k,
+        )
+        rescored = self._dense_search(collection, query_embeddings, self.tuning_k)
+
+        return {
+            "compact_recall": recall_at_k(
+                [[hit.id for hit in hits] for hits in compact], exact
+            ),
+            "rescored_recall": recall_at_k(
+                [[chunk["id"] for chunk in chunks] for chunks in rescored], exact
+            ),
+        }
+
+    def _tune_search(
+        self, collection: Collection, target_recall: float
+    ) -> Dict[str, Any]:
+        """
+        Mede o recall@k do índice contra a busca exata numa amostra de vetores da coleção
+        e escolhe o menor ef/nprobe que atinge `target_recall`.
+
+        Args:
+            collection (Collection): Coleção carregada da sessão.
+            target_recall (float): Recall@k mínimo desejado, entre 0 e 1.
+        """
+
+        index_type = self._current_index_type(collection)
+        profile = INDEX_PROFILES.get(index_type, INDEX_PROFILES["FLAT"])
+        report = {
+            "index_type": index_type,
+            "search_param": profile.search_param,
+            "value": None,
+            "recall": 1.0,
+            "measurements": [],
+        }
+        if profile.search_param is None:
+            return report
+
+        # Amostra uniforme dos IDs; os próprios vetores da coleção servem de consultas
+        ids = [
+            row["id"] for batch in self._iterate(collection, ["id"]) for row in batch
+        ]
+        if len(ids) <= self.tuning_k:
+            return report
+        sample_ids = random.sample(ids, min(self.tuning_sample_size, len(ids)))
+        rows = collection.query(
+            expr=f"id in {json.dumps(sample_ids)}", output_fields=["embedding"]
+        )
+        queries = np.stack([as_float32(row["embedding"]) for row in rows])
+        exact = exact_top_k(
+            queries, self._iterate(collection, ["id", "embedding"]), self.tuning_k
+        )
+
+        search_values = profile.search_values
+        if profile.search_param == "nprobe":
+            # O nprobe não pode passar do número de listas do índice
+            index = next(
+                index for index in collection.indexes if index.field_name == "embedding"
+            )
+            nlist = int(index.params.get("params", index.params)["nlist"])
+            search_values = [value for value in search_values if value <= nlist]
+
+        for value in search_values:
+            results = collection.search(
+                data=self._stored_vectors(collection, queries),
+                anns_field="embedding",
+                param=build_search_params(index_type, self.tuning_k, value),
+                limit=self.tuning_k,
+            )
+            recall = recall_at_k([[hit.id for hit in hits] for hits in results], exact)
+            report["measurements"].append({"value": value, "recall": recall})
+            report["value"], report["recall"] = value, recall
+            if recall >= target_recall:
+                break
+
+        self._search_values[collection.name] = report["value"]
+        self._tuned_sizes[collection.name] = len(ids)
+
+        if self._rescoring(collection):
+            report.update(self._measure_full_precision_recall(collection, sample_ids))
+
+        return report
+
+    async def ensure_index(self, session_id: str):
+        """
+        Ajusta o índice da sessão ao tamanho atual da coleção, depois de uma ingestão.
+
+        Troca o perfil do índice quando a coleção cruza os limites de tamanho e, só com MILVUS_RECALL_TARGET
+        definido, reajusta o parâmetro de busca quando o índice muda ou a coleção dobra de tamanho.
+
+        Args:
+            session_id (str): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+        """
+
+        def ensure(collection: Collection):
+            self._rebuild_index(collection)
+            if self.recall_target is None:
+                return
+            tuned_size = self._tuned_sizes.get(session_id)
+            if tuned_size is None or self._row_count(collection) >= 2 * tuned_size:
+                self._tune_search(collection, self.recall_target)
+
+        async with self.collections.use(session_id) as collection:
+            async with self._write_locks[session_id]:
+                await asyncio.to_thread(ensure, collection)
+
+    async def tune_search(
+        self, session_id: str, target_recall: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Ajusta o parâmetro de busca da sessão para um recall@k alvo, retornando as medições.
+
+        Args:
+            session_id (str): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+            target_recall (float, opcional): Recall@k mínimo; sem ele, usa MILVUS_RECALL_TARGET (ou 0.95).
+        """
+        async with self.collections.use(session_id) as collection:
+            return await asyncio.to_thread(
+                self._tune_search,
+                collection,
+                target_recall or self.recall_target or 0.95,
+            )
+
+    def _open_collection(self, session_id: str) -> Collection:
+        """
+        Abre a coleção do Milvus DB da sessão, criando-a caso não exista.
+
+        Args:
+            session_id (str): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+        """
+
+        if utility.has_collection(session_id):
+            collection = Collection(session_id)
+            self._check_schema(collection)
+            return collection
+
+        # Schema da coleção
+        fields = [
+            FieldSchema(
+                name="id",
+                dtype=DataType.VARCHAR,
+                is_primary=True,
+                max_length=36,
+            ),
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+            FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=255),
+            # Páginas do documento onde o chunk começa e termina, para citações e filtros
+            FieldSchema(name="page_start", dtype=DataType.INT32),
+            FieldSchema(name="page_end", dtype=DataType.INT32),
+            FieldSchema(
+                name="embedding",
+                dtype=VECTOR_DATA_TYPES[self.vector_type],
+                dim=self.stored_dim,
+            ),
+        ]
+        schema = CollectionSchema(fields=fields, description=self.model_name)
+
+        # Instancia e cria a coleção
+        collection = Collection(name=session_id, schema=schema)
+
+        # Cria o index para buscas; coleções novas estão vazias e começam com o menor perfil
+        collection.create_index(
+            field_name="embedding", index_params=self._index_params(0)
+        )
+
+        return collection
+
+    def _stored_vectors(
+        self, collection: Collection, vectors: List[List[float]]
+    ) -> List[Any]:
+        """
+        Converte embeddings completos para a representação da coleção: só as primeiras dimensões
+        e, nas coleções FLOAT16_VECTOR, em float16.
+
+        Args:
+            collection (Collection): Coleção da sessão.
+            vectors (List[List[float]]): Embeddings gerados pelo backend.
+        """
+
+        field = self._embedding_field(collection)
+        stored = truncate_vectors(
+            np.asarray(vectors, dtype=np.float32), int(field.params["dim"])
+        )
+        if field.dtype == DataType.FLOAT16_VECTOR:
+            return list(stored.astype(np.float16))
+        return stored.tolist()
+
+    def _rescoring(self, collection: Collection) -> bool:
+        """
+        Indica se as buscas na coleção re-pontuam os candidatos com os embeddings completos:
+        só nas coleções com vetores compactos, e com o cache de embeddings disponível.
+
+        Args:
+            collection (Collection): Coleção da sessão.
+        """
+
+        if self.embedding_cache is None or self.rescore_multiplier <= 1:
+            return False
+        field = self._embedding_field(collection)
+        return (
+            field.dtype == DataType.FLOAT16_VECTOR
+            or int(field.params["dim"]) < self.dim
+            or self._current_index_type(collection) in SQ8_INDEX_TYPES.values()
+        )
+
+    def _rescore(
+        self,
+        query_embeddings: List[List[float]],
+        results: List[List[Dict[str, Any]]],
+        limit: int,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Recalcula o score (cosseno) dos candidatos com os embeddings completos do cache e mantém os
+        `limit` melhores. Se faltar no cache o embedding de algum candidato de uma mensagem, os
+        candidatos dela ficam na ordem da busca nos vetores compactos, sem misturar os dois scores.
+
+        Args:
+            query_embeddings (List[List[float]]): Embeddings completos das mensagens.
+            results (List[List[Dict[str, Any]]]): Candidatos de cada mensagem, com o "text".
+            limit (int): Quantos chunks manter por mensagem.
+        """
+
+        keys = {
+            chunk["id"]: embedding_key(self.model_name, chunk["text"])
+            for hits in results
+            for chunk in hits
+        }
+        vectors = self.embedding_cache.get_many(list(set(keys.values())))
+        CACHE_REQUESTS.inc(
+            sum(key in vectors for key in keys.values()), cache="rescore", result="hit"
+        )
+        CACHE_REQUESTS.inc(
+            sum(key not in vectors for key in keys.values()),
+            cache="rescore",
+            result="miss",
+        )
+        if not vectors:
+            RESCORED_QUERIES.inc(len(results), result="skipped")
+            return [hits[:limit] for hits in results]
+
+        rows = {key: row for row, key in enumerate(vectors)}
+        matrix = np.asarray(list(vectors.values()), dtype=np.float32).reshape(
+            len(vectors), -1
+        )
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        rescored = []
+        for query, hits in zip(queries, results):
+            if not all(keys[chunk["id"]] in rows for chunk in hits):
+                RESCORED_QUERIES.inc(result="skipped")
+                rescored.append(hits[:limit])
+                continue
+
+            RESCORED_QUERIES.inc(result="rescored")
+            scores = matrix[[rows[keys[chunk["id"]]] for chunk in hits]] @ query
+            hits = [
+                {**chunk, "score": score} for chunk, score in zip(hits, scores.tolist())
+            ]
+            rescored.append(
+                sorted(hits, key=lambda chunk: chunk["score"], reverse=True)[:limit]
+            )
+
+        return rescored
+
+    def _output_fields(self, collection: Collection) -> List[str]:
+        """
+        Campos retornados nas buscas. Coleções criadas antes dos campos de página não os têm.
+
+        Args:
+            collection (Collection): Coleção da sessão.
+        """
+        return [
+            field.name
+            for field in collection.schema.fields
+            if field.name not in ("id", "embedding")
+        ]
 
     async def insert_chunks(
-        self, chunks: List[Dict[str, Any]], session_id: str = "default"
+        self, chunks: List[Chunk], session_id: str = "default"
     ) -> int:
         """
         Insere chunks de um documento no Milvus DB.
 
+        Os chunks já existentes com o mesmo ID são substituídos, então reenviar um documento não duplica a coleção.
+
         Args:
-            chunks (List[Dict[str, Any]]): Chunks do documento PDF.
+            chunks (List[Chunk]): Chunks do documento PDF, com o ID determinístico em `chunk.id` e o embedding.
             session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
         """
 
-        self._create_collection_if_not_exists(session_id)
+        keyword_index = (
+            await self._get_keyword_index(session_id) if self.hybrid_search else None
+        )
+
+        def upsert(collection: Collection):
+            # Prepara os dados no schema da coleção, na ordem dos campos
+            entities = [
+                (
+                    self._stored_vectors(
+                        collection, [chunk.embedding for chunk in chunks]
+                    )
+                    if field.name == "embedding"
+                    else [getattr(chunk, field.name) for chunk in chunks]
+                )
+                for field in collection.schema.fields
+            ]
+            # Inserção (upsert, pois os IDs são determinísticos)
+            result = collection.upsert(entities)
+            self._count_rows(collection.name, result.upsert_count)
+
+        async with self.collections.use(session_id) as collection:
+            async with self._write_locks[session_id]:
+                with timed("vector_insert"):
+                    await asyncio.to_thread(upsert, collection)
 
-        # Prepara os dados no schema definido
-        ids = [str(uuid.uuid4()) for _ in range(len(chunks))]
-        texts = [chunk["text"] for chunk in chunks]
-        sources = [chunk["metadata"]["source"] for chunk in chunks]
-        embeddings = [chunk["embedding"] for chunk in chunks]
+        if keyword_index is not None:
 
-        # Inserção
-        entities = [ids, texts, sources, embeddings]
-        self.collection.insert(entities)
+            def index_chunks():
+                for chunk in chunks:
+                    keyword_index.add(chunk.id, chunk.text)
 
-        self.collection.load()
+            await asyncio.to_thread(index_chunks)
 
         return len(chunks)
 
-    async def search_similar_chunks(
-        self,
-        query_embedding: List[float],
-        top_k: int = 5,
-        session_id: str = "default",
-    ) -> List[Dict[str, Any]]:
+    async def delete_chunks(self, ids: List[str], session_id: str = "default") -> int:
         """
-        Busca por chunks mais relevantes de acordo com o embedding da mensagem do usuário.
+        Remove chunks do Milvus DB pelos seus IDs.
 
         Args:
-            query_embedding (List[float]): Vetor com o embedding da mensagem do usuário.
-            top_k (int): Define quantos chunks serão retornados para contexto do RAG.
+            ids (List[str]): IDs dos chunks a serem removidos.
             session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
         """
 
-        self._create_collection_if_not_exists(session_id)
-        self.collection.load()
+        if not ids:
+            return 0
 
-        search_params = {"metric_type": "COSINE", "params": {"ef": 32}}
-        results = self.collection.search(
-            data=[query_embedding],
-            anns_field="embedding",
-            param=search_params,
-            limit=top_k,
-            output_fields=["text", "source"],
+        async with self.collections.use(session_id) as collection:
+            async with self._write_locks[session_id]:
+                with timed("vector_delete"):
+                    result = await asyncio.to_thread(
+                        collection.delete, expr=f"id in {json.dumps(ids)}"
+                    )
+                self._count_rows(session_id, -result.delete_count)
+
+        if self.hybrid_search:
+            keyword_index = await self._get_keyword_index(session_id)
+
+            def unindex_chunks():
+                for chunk_id in ids:
+                    keyword_index.remove(chunk_id)
+
+            await asyncio.to_thread(unindex_chunks)
+
+        return len(ids)
+
+    def _dense_search(
+        self, collection: Collection, query_embeddings: List[List[float]], limit: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca vetorial (COSINE) na coleção, com várias consultas por requisição ao Milvus.
+
+        Nas coleções com vetores compactos, busca MILVUS_RESCORE_MULTIPLIER vezes mais candidatos e
+        re-pontua os candidatos com os embeddings completos (ver `MilvusVectorStore._rescore`).
+
+        Args:
+            collection (Collection): Coleção carregada da sessão.
+            query_embeddings (List[List[float]]): Embeddings das mensagens dos usuários.
+            limit (int): Quantos chunks retornar por consulta.
+        """
+
+        rescoring = self._rescoring(collection)
+        candidates = limit * self.rescore_multiplier if rescoring else limit
+        search_params = build_search_params(
+            self._current_index_type(collection),
+            candidates,
+            self._search_values.get(collection.name),
         )
 
+        output_fields = self._output_fields(collection)
+
         # Formata os resultados para melhor uso futuro
         chunks = []
-        for hits in results:
-            for hit in hits:
-                chunks.append(
+        for start in range(0, len(query_embeddings), SEARCH_BATCH_SIZE):
+            batch = query_embeddings[start : start + SEARCH_BATCH_SIZE]
+            with timed("vector_search"):
+                results = collection.search(
+                    data=self._stored_vectors(collection, batch),
+                    anns_field="embedding",
+                    param=search_params,
+                    limit=candidates,
+                    output_fields=output_fields,
+                )
+            batch_chunks = [
+                [
                     {
-                        "text": hit.entity.get("text"),
-                        "source": hit.entity.get("source"),
+                        "id": hit.id,
+                        **{field: hit.entity.get(field) for field in output_fields},
                         "score": hit.score,
                     }
-                )
+                    for hit in hits
+                ]
+                for hits in results
+            ]
+            if rescoring:
+                with timed("vector_rescore"):
+                    batch_chunks = self._rescore(batch, batch_chunks, limit)
+            chunks.extend(batch_chunks)
 
         return chunks
+
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        session_id: str = "default",
+        query_texts: Optional[List[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca os chunks mais relevantes para várias mensagens de uma vez.
+
+        Todas as consultas vão ao Milvus numa única busca. Com a busca híbrida habilitada e `query_texts`
+        informado, cada consulta também passa pelo BM25 e os rankings são combinados por reciprocal
+        rank fusion; o "score" passa a ser o score fundido.
+
+        Args:
+            query_embeddings (List[List[float]]): Embeddings das mensagens dos usuários.
+            top_k (int): Define quantos chunks serão retornados por mensagem.
+            session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+            query_texts (List[str], opcional): Textos das mensagens, na mesma ordem, usados na busca por palavras-chave.
+        """
+
+        if not query_embeddings:
+            return []
+
+        async with self.collections.use(session_id) as collection:
+            if not self.hybrid_search or not query_texts:
+                return await asyncio.to_thread(
+                    self._dense_search, collection, query_embeddings, top_k
+                )
+
+            # A busca vetorial e o BM25 rodam em threads separadas, em paralelo. O índice BM25 é
+            # obtido antes, para uma falha ao construí-lo não deixar a busca vetorial órfã
+            candidates = top_k * self.candidate_multiplier
+            keyword_index = await self._get_keyword_index(session_id)
+            dense_task = asyncio.create_task(
+                asyncio.to_thread(
+                    self._dense_search, collection, query_embeddings, candidates
+                )
+            )
+
+            def keyword_search():
+                return [
+                    keyword_index.search(query_text, candidates) if query_text else []
+                    for query_text in query_texts
+                ]
+
+            try:
+                with timed("keyword_search"):
+                    keyword_hits = await asyncio.to_thread(keyword_search)
+            finally:
+                # Se o BM25 falhar ou a requisição for cancelada, a busca vetorial é aguardada
+                # (e seu erro descartado) em vez de ficar pendente
+                if not dense_task.done():
+                    await asyncio.wait([dense_task])
+            dense_results = dense_task.result()
+
+            chunks_by_id = {}
+            rankings = []
+            for dense_chunks, hits in zip(dense_results, keyword_hits):
+                for chunk in dense_chunks:
+                    chunks_by_id[chunk["id"]] = chunk
+                fused_scores = reciprocal_rank_fusion(
+                    [
+                        [chunk["id"] for chunk in dense_chunks],
+                        [chunk_id for chunk_id, _ in hits],
+                    ],
+                    [self.dense_weight, self.keyword_weight],
+                    self.rrf_k,
+                )
+                best_ids = sorted(fused_scores, key=fused_scores.get, reverse=True)[
+                    :top_k
+                ]
+                rankings.append(
+                    [(chunk_id, fused_scores[chunk_id]) for chunk_id in best_ids]
+                )
+
+            # Chunks encontrados só pelo BM25 ainda precisam do texto e da fonte, numa só consulta
+            missing_ids = list(
+                {
+                    chunk_id
+                    for ranking in rankings
+                    for chunk_id, _ in ranking
+                    if chunk_id not in chunks_by_id
+                }
+            )
+            if missing_ids:
+                output_fields = ["id", *self._output_fields(collection)]
+                with timed("vector_query"):
+                    rows = await asyncio.to_thread(
+                        collection.query,
+                        expr=f"id in {json.dumps(missing_ids)}",
+                        output_fields=output_fields,
+                    )
+                for row in rows:
+                    chunks_by_id[row["id"]] = {
+                        field: row[field] for field in output_fields
+                    }
+
+            return [
+                [
+                    {**chunks_by_id[chunk_id], "score": score}
+                    for chunk_id, score in ranking
+                    if chunk_id in chunks_by_id
+                ]
+                for ranking in rankings
+            ]
+
+    async def search_similar_chunks(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        session_id: str = "default",
+        query_text: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca por chunks mais relevantes de acordo com o embedding da mensagem do usuário.
+
+        Com a busca híbrida habilitada e `query_text` informado, a busca vetorial e a busca BM25 rodam
+        em paralelo e os rankings são combinados por reciprocal rank fusion; o "score" passa a ser o score fundido.
+
+        Args:
+            query_embedding (List[float]): Vetor com o embedding da mensagem do usuário.
+            top_k (int): Define quantos chunks serão retornados para contexto do RAG.
+            session_id (str, opcional): Define o ID da coleção do Milvus, para poder começar uma conversa limpa na UI do Streamlit.
+            query_text (str, opcional): Texto da mensagem do usuário, usado na busca por palavras-chave.
+        """
+
+        results = await self.search_many(
+            [query_embedding],
+            top_k,
+            session_id,
+            [query_text] if query_text else None,
+        )
+        return results[0]
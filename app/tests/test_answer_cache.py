@@ -0,0 +1,75 @@
+from services.answer_cache import AnswerCache, normalize_question
+
+
+def put(cache, question, embedding=(1.0, 0.0), session_id="s", chunk_ids=("c1", "c2")):
+    cache.put(
+        session_id, list(chunk_ids), [], question, list(embedding), "resposta", []
+    )
+
+
+def test_normalize_question_ignores_case_spaces_and_punctuation():
+    assert normalize_question("  Qual o PRAZO   do contrato?? ") == (
+        "qual o prazo do contrato"
+    )
+
+
+def test_hit_requires_same_session_chunks_and_history():
+    cache = AnswerCache()
+    put(cache, "Qual o prazo?")
+
+    assert cache.get("s", ["c2", "c1"], [], "qual o prazo", [1.0, 0.0]) is not None
+    assert cache.get("outra", ["c1", "c2"], [], "qual o prazo", [1.0, 0.0]) is None
+    assert cache.get("s", ["c1", "c3"], [], "qual o prazo", [1.0, 0.0]) is None
+    assert cache.get("s", ["c1", "c2"], ["oi"], "qual o prazo", [1.0, 0.0]) is None
+
+
+def test_similar_questions_only_with_threshold():
+    exact = AnswerCache()
+    similar = AnswerCache(similarity_threshold=0.9)
+    for cache in (exact, similar):
+        put(cache, "Qual o prazo?", embedding=(1.0, 0.0))
+
+    assert exact.get("s", ["c1", "c2"], [], "E o prazo?", [0.99, 0.1]) is None
+    assert similar.get("s", ["c1", "c2"], [], "E o prazo?", [0.99, 0.1]) is not None
+    assert similar.get("s", ["c1", "c2"], [], "E a multa?", [0.0, 1.0]) is None
+
+
+def test_expired_and_evicted_entries_are_dropped():
+    expired = AnswerCache(ttl_seconds=0)
+    put(expired, "Qual o prazo?")
+    assert expired.get("s", ["c1", "c2"], [], "Qual o prazo?", [1.0, 0.0]) is None
+
+    small = AnswerCache(max_entries=1)
+    put(small, "primeira")
+    put(small, "segunda")
+    assert small.get("s", ["c1", "c2"], [], "primeira", [1.0, 0.0]) is None
+    assert small.get("s", ["c1", "c2"], [], "segunda", [1.0, 0.0]) is not None
+
+
+def test_invalidate_session():
+    cache = AnswerCache()
+    put(cache, "Qual o prazo?", session_id="a")
+    put(cache, "Qual o prazo?", session_id="b")
+
+    cache.invalidate_session("a")
+
+    assert cache.get("a", ["c1", "c2"], [], "Qual o prazo?", [1.0, 0.0]) is None
+    assert cache.get("b", ["c1", "c2"], [], "Qual o prazo?", [1.0, 0.0]) is not None
+
+
+def test_similar_lookup_returns_the_closest_live_question():
+    cache = AnswerCache(similarity_threshold=0.8, max_entries=3)
+    cache.put("s", ["c1"], [], "prazo", [1.0, 0.0], "resposta do prazo", [])
+    cache.put("s", ["c1"], [], "multa", [0.0, 1.0], "resposta da multa", [])
+    cache.put("s", ["c1"], [], "prazo e multa", [0.7, 0.7], "resposta mista", [])
+
+    hit = cache.get("s", ["c1"], [], "E a multa?", [0.2, 0.95])
+    assert hit.answer == "resposta da multa"
+
+    # A entrada descartada pelo limite também sai da busca por similaridade
+    cache.put("s", ["c1"], [], "vigência", [-1.0, 0.0], "resposta da vigência", [])
+    hit = cache.get("s", ["c1"], [], "E o prazo?", [0.95, 0.2])
+    assert hit.answer == "resposta mista"
+
+    cache.invalidate_session("s")
+    assert cache.get("s", ["c1"], [], "E o prazo?", [0.95, 0.2]) is None
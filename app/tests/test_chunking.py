@@ -0,0 +1,75 @@
+from services.chunking import PageAwareChunker, create_text_splitter
+
+PAGES = [
+    "Primeira página. " * 30,
+    "Segunda página com outro assunto. " * 20,
+    "",
+    "Quarta página, depois de uma página em branco. " * 25,
+]
+
+
+def chunk_pages(pages, buffer_chars=300, chunk_size=200, chunk_overlap=40):
+    chunker = PageAwareChunker(
+        create_text_splitter(chunk_size, chunk_overlap),
+        "doc.pdf",
+        buffer_chars=buffer_chars,
+        chunk_overlap=chunk_overlap,
+    )
+    chunks = []
+    for page in pages:
+        chunks.extend(chunker.add_page(page))
+    chunks.extend(chunker.finish())
+    return chunks
+
+
+def document_text(pages):
+    # O chunker separa as páginas com uma linha em branco
+    return "".join(page + "\n\n" for page in pages)
+
+
+def test_offsets_point_to_the_chunk_text():
+    text = document_text(PAGES)
+    chunks = chunk_pages(PAGES)
+
+    assert chunks
+    for chunk in chunks:
+        assert text[chunk.char_start : chunk.char_end] == chunk.text
+
+
+def test_offsets_do_not_depend_on_the_buffer_size():
+    small = chunk_pages(PAGES, buffer_chars=100)
+    large = chunk_pages(PAGES, buffer_chars=100_000)
+
+    assert [(c.text, c.char_start, c.char_end) for c in small] == [
+        (c.text, c.char_start, c.char_end) for c in large
+    ]
+
+
+def test_page_numbers_follow_page_boundaries():
+    text = document_text(PAGES)
+    page_starts = []
+    position = 0
+    for page in PAGES:
+        page_starts.append(position)
+        position += len(page) + 2
+
+    def page_at(offset):
+        return max(i for i, start in enumerate(page_starts) if start <= offset) + 1
+
+    for chunk in chunk_pages(PAGES):
+        assert chunk.source == "doc.pdf"
+        assert chunk.page_start == page_at(chunk.char_start)
+        assert chunk.page_end == page_at(chunk.char_end - 1)
+        assert text[chunk.char_start : chunk.char_end] == chunk.text
+
+    # A página em branco não gera chunks
+    assert 3 not in {chunk.page_start for chunk in chunk_pages(PAGES)}
+
+
+def test_repeated_text_is_located_after_the_previous_chunk():
+    pages = ["mesmo trecho repetido " * 40]
+    chunks = chunk_pages(pages, chunk_size=60, chunk_overlap=0)
+
+    starts = [chunk.char_start for chunk in chunks]
+    assert starts == sorted(starts)
+    assert len(set(starts)) == len(starts)
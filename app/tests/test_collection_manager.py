@@ -0,0 +1,84 @@
+import asyncio
+
+from services.vector_store import CollectionManager
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+
+    def release(self):
+        self.loaded = False
+
+
+def manager(max_loaded=1):
+    opened = []
+
+    def open_collection(session_id):
+        opened.append(FakeCollection(session_id))
+        return opened[-1]
+
+    return CollectionManager(open_collection, max_loaded), opened
+
+
+def test_concurrent_operations_share_one_load():
+    collections, opened = manager()
+
+    async def use():
+        async with collections.use("a") as collection:
+            await asyncio.sleep(0)
+            return collection
+
+    async def main():
+        return await asyncio.gather(*(use() for _ in range(5)))
+
+    results = asyncio.run(main())
+
+    assert len(opened) == 1
+    assert all(collection is opened[0] for collection in results)
+    assert collections.stats()["misses"] == 1
+
+
+def test_collection_in_use_is_released_only_after_the_operation():
+    collections, opened = manager()
+
+    async def main():
+        async with collections.use("a") as a:
+            async with collections.use("b"):
+                pass
+            # "a" está em uso, então "b" (sem uso) é que foi liberada
+            assert a.loaded
+            assert collections.stats()["loaded"] == 1
+
+            async with collections.use("a") as again:
+                assert again is a
+
+        async with collections.use("c"):
+            pass
+        return a
+
+    a = asyncio.run(main())
+
+    assert not a.loaded
+    assert [collection.name for collection in opened] == ["a", "b", "c"]
+    assert collections.stats()["evictions"] == 2
+
+
+def test_limit_is_restored_when_the_last_operation_ends():
+    collections, opened = manager()
+
+    async def main():
+        async with collections.use("a"):
+            async with collections.use("b"):
+                # As duas estão em uso: o limite fica temporariamente ultrapassado
+                assert collections.stats()["loaded"] == 2
+            assert collections.stats()["loaded"] == 1
+        assert collections.stats()["loaded"] == 1
+
+    asyncio.run(main())
+
+    assert [collection.loaded for collection in opened] == [True, False]
@@ -0,0 +1,83 @@
+import pytest
+
+from services import context_packer
+from services.context_packer import ContextPacker
+
+
+class CharEncoding:
+    """
+    Um token por caractere, para os testes não dependerem do download das codificações do tiktoken.
+    """
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture
+def packer(monkeypatch):
+    monkeypatch.setattr(
+        context_packer.tiktoken, "encoding_for_model", lambda model: CharEncoding()
+    )
+
+    def create(**budgets):
+        return ContextPacker("gpt-4o-mini", **budgets)
+
+    return create
+
+
+def chunk(text, score, source="a.pdf"):
+    return {"text": text, "source": source, "score": score}
+
+
+def test_best_chunks_fill_the_budget_and_the_last_one_is_cut(packer):
+    chunks = [chunk("b" * 80, 0.5), chunk("a" * 100, 0.9), chunk("c" * 80, 0.1)]
+
+    packed = packer(context_budget=160).pack_context(chunks)
+
+    assert [item["text"] for item in packed] == ["a" * 100, "b" * 60]
+
+
+def test_chunk_that_does_not_fit_is_dropped_without_a_useful_remainder(packer):
+    packed = packer(context_budget=130).pack_context(
+        [chunk("a" * 100, 0.9), chunk("b" * 80, 0.5)]
+    )
+
+    assert [item["text"] for item in packed] == ["a" * 100]
+
+
+def test_overlap_between_neighbouring_chunks_is_removed(packer):
+    shared = "cláusula quinta do contrato "
+    first = "início do documento, " + shared
+    second = shared + "e o restante do texto"
+
+    packed = packer().pack_context(
+        [
+            chunk(first, 0.9),
+            chunk(second, 0.8),
+            chunk(second, 0.7, source="b.pdf"),
+            chunk(shared, 0.6),
+        ]
+    )
+
+    # Só entre chunks do mesmo documento; um trecho já incluído inteiro é descartado
+    assert [item["text"] for item in packed] == [
+        first,
+        "e o restante do texto",
+        second,
+    ]
+
+
+def test_history_keeps_the_latest_messages(packer):
+    history = ["m" * 100, "antiga " * 20, "recente"]
+
+    packed = packer(history_budget=100).pack_history(history)
+
+    assert packed == [
+        "[1 mensagens anteriores omitidas]",
+        ("antiga " * 20)[-93:],
+        "recente",
+    ]
+    assert packer().pack_history(history) == history
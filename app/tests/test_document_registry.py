@@ -0,0 +1,111 @@
+import sqlite3
+from collections import Counter
+from services.document_registry import (
+    DocumentRegistry,
+    chunk_hash,
+    chunk_id,
+    document_fingerprint,
+)
+
+
+def chunk_ids(source, chunks):
+    """
+    Gera os IDs como a pipeline: hash do conteúdo mais o número da ocorrência.
+    """
+    occurrences = Counter()
+    ids = []
+    for text, _ in chunks:
+        content_hash = chunk_hash(text)
+        ids.append(chunk_id(source, content_hash, occurrences[content_hash]))
+        occurrences[content_hash] += 1
+    return ids
+
+
+def test_chunk_ids_fit_the_collection_schema():
+    [single] = chunk_ids("contrato.pdf", [("texto", 1)])
+    assert len(single) == 36
+
+
+def test_inserted_chunk_keeps_the_other_ids():
+    old = chunk_ids("doc.pdf", [("a", 1), ("b", 1), ("c", 2)])
+    new = chunk_ids("doc.pdf", [("novo", 1), ("a", 1), ("b", 1), ("c", 2)])
+
+    assert set(old) < set(new)
+    assert set(new) - set(old) == {new[0]}
+
+
+def test_changed_text_changes_the_id_but_pages_do_not():
+    [original] = chunk_ids("doc.pdf", [("a", 1)])
+    assert chunk_ids("doc.pdf", [("a", 2)]) == [original]
+    assert chunk_ids("doc.pdf", [("a!", 1)]) != [original]
+    assert chunk_ids("outro.pdf", [("a", 1)]) != [original]
+
+
+def test_repeated_chunks_get_distinct_ids():
+    ids = chunk_ids("doc.pdf", [("rodapé", 1), ("rodapé", 1), ("rodapé", 1)])
+    assert len(set(ids)) == 3
+
+
+def test_removed_chunks_are_the_set_difference():
+    old = chunk_ids("doc.pdf", [("a", 1), ("b", 1), ("c", 2)])
+    new = chunk_ids("doc.pdf", [("a", 1), ("c", 2)])
+
+    assert sorted(set(old).difference(new)) == [old[1]]
+
+
+def test_fingerprint_matches_for_bytes_and_file(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-1.4 conteudo")
+    empty = tmp_path / "vazio.pdf"
+    empty.write_bytes(b"")
+
+    assert document_fingerprint(str(path)) == document_fingerprint(b"%PDF-1.4 conteudo")
+    assert document_fingerprint(str(empty)) == document_fingerprint(b"")
+
+
+def test_registry_round_trip_and_lookup_by_fingerprint(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+    registry.put("s", "doc.pdf", "hash-1", ["id-1", "id-2"], [(1, 1), (1, 2)])
+
+    record = registry.get("s", "doc.pdf")
+    assert record.fingerprint == "hash-1"
+    assert record.chunk_ids == ["id-1", "id-2"]
+    assert record.chunk_pages == [(1, 1), (1, 2)]
+    assert registry.get("s", "outro.pdf") is None
+
+    assert registry.find_source("s", "hash-1") == "doc.pdf"
+    assert registry.find_source("outra", "hash-1") is None
+    assert registry.find_source("s", "hash-2") is None
+
+    registry.close()
+
+
+def test_chunks_of_a_renamed_copy_are_shared(tmp_path):
+    registry = DocumentRegistry()
+    ids = chunk_ids("doc.pdf", [("a", 1), ("b", 2)])
+    registry.put("s", "doc.pdf", "hash-1", ids, [(1, 1), (2, 2)])
+    # Cópia com outro nome registrada com os chunks do original
+    registry.put("s", "copia.pdf", "hash-1", ids, [(1, 1), (2, 2)])
+    registry.put("outra", "outro.pdf", "hash-1", ids, [(1, 1), (2, 2)])
+
+    assert registry.shared_chunk_ids("s", "doc.pdf", ids) == set(ids)
+    assert registry.shared_chunk_ids("s", "doc.pdf", ["id-x"]) == set()
+    assert registry.borrowed_chunk_ids("s", "doc.pdf") == set(ids)
+    # Os IDs da cópia foram gerados com o nome do original, não com o dela
+    assert registry.borrowed_chunk_ids("s", "copia.pdf") == set()
+
+
+def test_registry_without_chunk_pages_column_is_migrated(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE documents (session_id TEXT NOT NULL, source TEXT NOT NULL, fingerprint TEXT NOT NULL, chunk_ids TEXT NOT NULL, PRIMARY KEY (session_id, source))"
+    )
+    db.execute("INSERT INTO documents VALUES ('s', 'doc.pdf', 'hash-1', '[\"id-1\"]')")
+    db.commit()
+    db.close()
+
+    record = DocumentRegistry(path).get("s", "doc.pdf")
+
+    assert record.chunk_ids == ["id-1"]
+    assert record.chunk_pages == []
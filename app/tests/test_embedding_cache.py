@@ -0,0 +1,44 @@
+from services.embedding_cache import EmbeddingCache, embedding_key
+
+
+def test_key_depends_on_model_and_text():
+    assert embedding_key("m", "texto") == embedding_key("m", "texto")
+    assert embedding_key("m", "texto") != embedding_key("m#query", "texto")
+    assert embedding_key("m", "texto") != embedding_key("m", "texto!")
+
+
+def test_vectors_survive_a_new_cache_on_the_same_file(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path)
+    cache.put_many({"a": [0.5, -1.0], "b": [2.0, 0.25]})
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many(["a", "b", "c"]) == {"a": [0.5, -1.0], "b": [2.0, 0.25]}
+    reopened.close()
+
+
+def test_memory_keeps_only_the_most_recent_items():
+    cache = EmbeddingCache(max_memory_items=2)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    cache.get_many(["a"])
+    cache.put_many({"c": [3.0]})
+
+    # Sem disco, o item usado há mais tempo ("b") é perdido
+    assert cache.get_many(["a", "b", "c"]) == {"a": [1.0], "c": [3.0]}
+
+
+def test_items_evicted_from_memory_are_read_back_from_disk(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_memory_items=1)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+
+    assert cache.get_many(["a", "b"]) == {"a": [1.0], "b": [2.0]}
+
+
+def test_closed_cache_keeps_working_in_memory(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    cache.put_many({"a": [1.0]})
+    cache.close()
+    cache.put_many({"b": [2.0]})
+
+    assert cache.get_many(["a", "b"]) == {"a": [1.0], "b": [2.0]}
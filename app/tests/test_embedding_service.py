@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from services.embedding_backends import EmbeddingBackend
+from services.embedding_service import EmbeddingService
+
+
+class TransientError(Exception):
+    pass
+
+
+class RecordingBackend(EmbeddingBackend):
+    retryable_errors = (TransientError,)
+
+    def __init__(self, failures=0):
+        self.dim = 2
+        self.model_name = "teste"
+        self.query_model_name = "teste#query"
+        self.failures = failures
+        self.calls = []
+        self.closed = False
+
+    async def embed_documents(self, texts):
+        if self.failures:
+            self.failures -= 1
+            raise TransientError()
+        self.calls.append(("documents", list(texts)))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    async def embed_query(self, text):
+        self.calls.append(("query", [text]))
+        return [float(len(text)), -1.0]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", "")
+    monkeypatch.setenv("EMBEDDING_BACKOFF_SECONDS", "0")
+    monkeypatch.setenv("EMBEDDING_BATCH_SIZE", "2")
+
+    def create(backend):
+        return EmbeddingService(backend)
+
+    return create
+
+
+def test_backend_must_implement_the_embedding_methods():
+    class Incomplete(EmbeddingBackend):
+        async def embed_documents(self, texts):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_only_new_unique_texts_reach_the_backend(service):
+    backend = RecordingBackend()
+    embeddings = service(backend)
+
+    async def main():
+        first = await embeddings.embed_documents(["a", "bb", "a", "ccc"])
+        second = await embeddings.embed_documents(["bb", "dddd"])
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0]]
+    assert second == [[2.0, 1.0], [4.0, 1.0]]
+    # Lotes de EMBEDDING_BATCH_SIZE textos, sem repetir os que já estão no cache
+    sent = sorted(text for _, texts in backend.calls for text in texts)
+    assert sent == ["a", "bb", "ccc", "dddd"]
+    assert all(len(texts) <= 2 for _, texts in backend.calls)
+
+
+def test_queries_are_cached_apart_from_documents(service):
+    backend = RecordingBackend()
+    embeddings = service(backend)
+
+    async def main():
+        await embeddings.embed_documents(["prazo"])
+        query = await embeddings.embed_query("prazo")
+        again = await embeddings.embed_query("prazo")
+        return query, again
+
+    query, again = asyncio.run(main())
+
+    assert query == again == [5.0, -1.0]
+    assert backend.calls == [("documents", ["prazo"]), ("query", ["prazo"])]
+
+
+def test_transient_errors_are_retried(service, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MAX_RETRIES", "2")
+    embeddings = service(RecordingBackend(failures=2))
+    assert asyncio.run(embeddings.embed_documents(["a"])) == [[1.0, 1.0]]
+
+    embeddings = service(RecordingBackend(failures=3))
+    with pytest.raises(TransientError):
+        asyncio.run(embeddings.embed_documents(["a"]))
+
+
+def test_close_releases_the_backend(service):
+    backend = RecordingBackend()
+    service(backend).close()
+    assert backend.closed
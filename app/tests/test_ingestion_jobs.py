@@ -0,0 +1,111 @@
+import asyncio
+
+from services.document_source import DocumentSource
+from services.ingestion_jobs import IngestionJobQueue
+
+
+class FakePipeline:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.processed = []
+
+    async def process_document(self, source, filename, session_id, progress=None):
+        self.processed.append(filename)
+        progress("total_pages", 3)
+        progress("pages", 3)
+        progress("pages_pymupdf", 2)
+        progress("pages_ocr", 1)
+        progress("chunks", 5)
+        progress("desconhecido", 1)
+        if self.fail:
+            raise RuntimeError("PDF corrompido")
+        return 5
+
+
+async def wait_finished(queue, job_id):
+    while True:
+        job = await queue.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+
+
+def test_job_reports_progress_per_file_and_backend(tmp_path):
+    async def main():
+        queue = IngestionJobQueue(FakePipeline(), str(tmp_path / "jobs.sqlite3"))
+        await queue.start()
+        source = DocumentSource(data=b"%PDF")
+        job_id = await queue.submit("s", [("a.pdf", source)])
+        job = await wait_finished(queue, job_id)
+        await queue.stop()
+        queue.close()
+        return job, source
+
+    job, source = asyncio.run(main())
+
+    assert job["status"] == "done"
+    assert job["session_id"] == "s"
+    assert job["documents_indexed"] == 1
+    assert job["total_chunks"] == 5
+    [file] = job["files"]
+    assert file["total_pages"] == 3 and file["pages"] == 3
+    assert file["page_backends"] == {"pymupdf": 2, "ocr": 1}
+    # O documento em memória é liberado depois de processado
+    assert source.data is None
+
+
+def test_failed_file_keeps_the_error(tmp_path):
+    async def main():
+        queue = IngestionJobQueue(FakePipeline(fail=True), None)
+        await queue.start()
+        job_id = await queue.submit("s", [("a.pdf", DocumentSource(data=b"%PDF"))])
+        job = await wait_finished(queue, job_id)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert job["status"] == "failed"
+    assert job["files"][0]["error"] == "PDF corrompido"
+    assert job["documents_indexed"] == 0
+
+
+def test_restart_resumes_only_spilled_uploads(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    spilled = tmp_path / "grande.pdf"
+    spilled.write_bytes(b"%PDF grande")
+
+    async def submit():
+        # Sem `start`: os arquivos ficam pendentes, como num desligamento antes do processamento
+        queue = IngestionJobQueue(FakePipeline(), path)
+        job_id = await queue.submit(
+            "s",
+            [
+                ("grande.pdf", DocumentSource(path=str(spilled), owns_path=True)),
+                ("pequeno.pdf", DocumentSource(data=b"%PDF pequeno")),
+            ],
+        )
+        queue.close()
+        return job_id
+
+    async def restart(job_id):
+        pipeline = FakePipeline()
+        queue = IngestionJobQueue(pipeline, path)
+        await queue.start()
+        # Chamadas repetidas não recolocam os arquivos na fila
+        await queue.start()
+        job = await wait_finished(queue, job_id)
+        await queue.stop()
+        queue.close()
+        return job, pipeline
+
+    job_id = asyncio.run(submit())
+    job, pipeline = asyncio.run(restart(job_id))
+
+    assert pipeline.processed == ["grande.pdf"]
+    big, small = job["files"]
+    assert big["status"] == "done" and big["chunks"] == 5
+    assert small["status"] == "failed"
+    assert "envie o PDF novamente" in small["error"]
+    # O arquivo do spill é removido depois de processado
+    assert not spilled.exists()
@@ -0,0 +1,52 @@
+import pytest
+from services.keyword_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_codes_and_normalizes_case():
+    assert tokenize("Artigo A-123, item 4.2.1 do CNPJ/MF") == [
+        "artigo",
+        "a-123",
+        "item",
+        "4.2.1",
+        "do",
+        "cnpj/mf",
+    ]
+
+
+def test_search_ranks_rare_terms_first():
+    index = BM25Index()
+    index.add("a", "contrato de prestação de serviços")
+    index.add("b", "contrato de locação com cláusula de multa")
+    index.add("c", "relatório anual")
+
+    hits = index.search("multa do contrato", 3)
+
+    assert [doc_id for doc_id, _ in hits] == ["b", "a"]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_remove_and_readd_update_the_index():
+    index = BM25Index()
+    index.add("a", "cláusula de multa")
+    index.add("b", "outro assunto")
+    index.remove("a")
+
+    assert len(index) == 1
+    assert index.search("multa", 5) == []
+
+    index.add("b", "agora fala de multa")
+    assert [doc_id for doc_id, _ in index.search("multa", 5)] == ["b"]
+    assert len(index) == 1
+
+
+def test_empty_index_returns_nothing():
+    assert BM25Index().search("qualquer coisa", 5) == []
+
+
+def test_reciprocal_rank_fusion_weights_each_ranking():
+    scores = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], [1.0, 2.0], k=60)
+
+    assert scores["a"] == pytest.approx(1 / 61)
+    assert scores["b"] == pytest.approx(1 / 62 + 2 / 61)
+    assert scores["c"] == pytest.approx(2 / 62)
+    assert max(scores, key=scores.get) == "b"
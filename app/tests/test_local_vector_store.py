@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+import pytest
+
+from services.chunking import Chunk
+from services.local_vector_store import LocalCollection, LocalVectorStore
+
+
+def chunk(chunk_id, text, embedding, page=1):
+    return Chunk(
+        text, "a.pdf", page, page, 0, len(text), id=chunk_id, embedding=embedding
+    )
+
+
+CHUNKS = [
+    chunk("c1", "prazo do contrato de locação", [1.0, 0.0], page=1),
+    chunk("c2", "multa por rescisão antecipada", [0.0, 1.0], page=2),
+    chunk("c3", "reajuste anual do aluguel", [0.7, 0.7], page=3),
+]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOCAL_VECTOR_STORE_PATH", str(tmp_path))
+    monkeypatch.delenv("LOCAL_HNSW_MIN_ROWS", raising=False)
+
+    def create(hybrid=False):
+        monkeypatch.setenv("HYBRID_SEARCH", "true" if hybrid else "false")
+        return LocalVectorStore(dim=2, model_name="m")
+
+    return create
+
+
+def ids(results):
+    return [[hit["id"] for hit in hits] for hits in results]
+
+
+def test_exact_search_ranks_by_cosine(store):
+    vectors = store()
+
+    async def main():
+        await vectors.insert_chunks(CHUNKS, "s")
+        return await vectors.search_many([[2.0, 0.1], [0.0, 3.0]], 2, "s")
+
+    results = asyncio.run(main())
+
+    assert ids(results) == [["c1", "c3"], ["c2", "c3"]]
+    assert results[0][0]["score"] == pytest.approx(0.9988, abs=1e-3)
+    assert results[1][0]["page_start"] == 2
+
+
+def test_upsert_replaces_and_delete_hides_chunks(store):
+    vectors = store()
+
+    async def main():
+        await vectors.insert_chunks(CHUNKS, "s")
+        await vectors.insert_chunks([chunk("c1", "novo texto", [0.0, 1.0])], "s")
+        await vectors.delete_chunks(["c2"], "s")
+        return await vectors.search_many([[0.0, 1.0]], 5, "s")
+
+    [hits] = asyncio.run(main())
+
+    assert [hit["id"] for hit in hits] == ["c1", "c3"]
+    assert hits[0]["text"] == "novo texto"
+
+
+def test_collection_survives_a_reload_and_compacts_deleted_rows(store, tmp_path):
+    vectors = store()
+
+    async def main():
+        await vectors.insert_chunks(CHUNKS, "s")
+        await vectors.delete_chunks(["c1", "c2"], "s")
+        vectors.close()
+
+    asyncio.run(main())
+
+    collection = LocalCollection(str(tmp_path / "s"), 2, "m", use_keyword_index=False)
+    collection.load()
+
+    # Mais da metade das linhas estava inativa: a coleção foi regravada só com a ativa
+    assert collection.rows_by_id == {"c3": 0}
+    assert os.path.getsize(collection.vectors_path) == 2 * 4
+    assert ids(collection.search([[1.0, 1.0]], 3)) == [["c3"]]
+    collection.release()
+
+
+def test_hybrid_search_returns_chunks_found_only_by_keywords(store, monkeypatch):
+    monkeypatch.setenv("HYBRID_CANDIDATE_MULTIPLIER", "1")
+    monkeypatch.setenv("HYBRID_KEYWORD_WEIGHT", "2")
+    vectors = store(hybrid=True)
+
+    async def main():
+        await vectors.insert_chunks(CHUNKS, "s")
+        return await vectors.search_many([[1.0, 0.0]], 1, "s", ["multa rescisão"])
+
+    [hits] = asyncio.run(main())
+
+    # A busca vetorial só traz c1; c2 vem do BM25 e tem o texto lido da coleção
+    assert [hit["id"] for hit in hits] == ["c2"]
+    assert hits[0]["text"] == "multa por rescisão antecipada"
+    assert hits[0]["page_start"] == 2
+
+
+def test_collection_rejects_another_embedding_model(store, tmp_path):
+    asyncio.run(store().insert_chunks(CHUNKS, "s"))
+
+    with pytest.raises(ValueError):
+        LocalCollection(str(tmp_path / "s"), 3, "outro")
+
+
+def test_invalid_session_id_is_rejected(store):
+    with pytest.raises(ValueError):
+        asyncio.run(store().search_many([[1.0, 0.0]], 1, "../fora"))
@@ -0,0 +1,27 @@
+import asyncio
+
+from services.metrics import observe_stage, record_timings
+
+
+def test_timings_from_parallel_threads_are_all_summed():
+    async def main():
+        with record_timings() as timings:
+
+            def observe_many():
+                for _ in range(2000):
+                    observe_stage("vector_search", 0.001)
+
+            await asyncio.gather(*(asyncio.to_thread(observe_many) for _ in range(8)))
+        return timings
+
+    timings = asyncio.run(main())
+
+    assert round(timings["vector_search"], 6) == 16.0
+
+
+def test_stages_outside_the_block_are_not_recorded():
+    with record_timings() as timings:
+        observe_stage("llm", 0.5)
+    observe_stage("llm", 1.0)
+
+    assert timings == {"llm": 0.5}
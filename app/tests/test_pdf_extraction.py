@@ -0,0 +1,121 @@
+import pymupdf
+import pytest
+
+from services.pdf_extraction import (
+    ExtractedPage,
+    TextExtractor,
+    count_pages,
+    extract_page_range,
+    text_quality,
+)
+
+PARAGRAPH = (
+    "O prazo do contrato de locação é de doze meses, renovável por igual período."
+)
+
+
+def build_pdf(*pages):
+    """
+    Gera um PDF com uma página por item: "texto", "imagem", "tabela" ou "branco".
+    """
+    doc = pymupdf.open()
+    for kind in pages:
+        page = doc.new_page()
+        if kind in ("texto", "tabela"):
+            page.insert_text((72, 72), PARAGRAPH, fontsize=9)
+        if kind == "imagem":
+            pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 20, 20), False)
+            pixmap.clear_with(200)
+            page.insert_image(page.rect, pixmap=pixmap)
+        if kind == "tabela":
+            for row in range(5):
+                for column in range(2):
+                    page.draw_rect(
+                        pymupdf.Rect(
+                            72 + 100 * column,
+                            100 + 20 * row,
+                            172 + 100 * column,
+                            120 + 20 * row,
+                        )
+                    )
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class FakeOCREngine:
+    def __init__(self):
+        self.calls = []
+
+    def ocr_pages(self, document, page_numbers):
+        self.calls.append(list(page_numbers))
+        return {
+            page_number: f"texto da página {page_number}"
+            for page_number in page_numbers
+        }
+
+
+def test_text_quality_counts_unmapped_glyphs():
+    assert text_quality(PARAGRAPH) == 1.0
+    assert text_quality("(cid:12)(cid:7) ab") == 0.5
+    assert text_quality("   ") == 0.0
+
+
+def test_only_scanned_or_unreadable_pages_need_ocr():
+    extractor = TextExtractor(backend="pymupdf")
+    doc = pymupdf.open(stream=build_pdf("texto", "imagem", "branco"), filetype="pdf")
+
+    assert not extractor.needs_ocr(PARAGRAPH, doc[0])
+    # Texto suficiente, mas de uma fonte sem mapeamento unicode
+    assert extractor.needs_ocr("�" * 60, doc[0])
+    assert extractor.needs_ocr("", doc[1])
+    # Página em branco ou com pouco texto e sem imagem fica com o texto extraído
+    assert not extractor.needs_ocr("", doc[2])
+    assert not extractor.needs_ocr("Capítulo 2", doc[2])
+    doc.close()
+
+
+def test_ocr_runs_once_for_all_scanned_pages_of_the_range():
+    document = build_pdf("imagem", "texto", "imagem")
+    ocr = FakeOCREngine()
+
+    result = extract_page_range(document, 1, 3, TextExtractor(backend="pymupdf"), ocr)
+
+    assert ocr.calls == [[1, 3]]
+    assert result.pages[0] == ExtractedPage("texto da página 1", "ocr")
+    assert result.pages[1].backend == "pymupdf"
+    assert PARAGRAPH in result.pages[1].text.replace("\n", " ")
+    assert result.ocr_pages == 2
+
+
+def test_pages_with_tables_use_pdfplumber_when_installed(tmp_path):
+    pytest.importorskip("pdfplumber")
+    path = tmp_path / "tabela.pdf"
+    path.write_bytes(build_pdf("texto", "tabela"))
+
+    pages = TextExtractor().extract(str(path), 1, 2)
+
+    assert [page.backend for page in pages.values()] == ["pymupdf", "pdfplumber"]
+    assert "prazo do contrato" in pages[2].text
+
+
+def test_tables_stay_with_pymupdf_without_pdfplumber():
+    extractor = TextExtractor()
+    extractor.tables_backend = None
+
+    pages = extractor.extract(build_pdf("tabela"), 1, 1)
+
+    assert pages[1].backend == "pymupdf"
+
+
+def test_configured_backend_is_used_for_every_page():
+    document = build_pdf("texto", "tabela")
+
+    pages = TextExtractor(backend="pypdf2").extract(document, 1, 2)
+
+    assert count_pages(document) == 2
+    assert {page.backend for page in pages.values()} == {"pypdf2"}
+    assert "prazo do contrato" in pages[1].text
+
+    with pytest.raises(ValueError):
+        TextExtractor(backend="desconhecido")
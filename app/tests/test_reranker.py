@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from services.metrics import RERANK_FALLBACKS
+from services.reranker import LexicalScorer, Reranker
+
+
+def fallbacks(reason):
+    return sum(
+        value
+        for _, labels, value in RERANK_FALLBACKS.samples()
+        if labels["reason"] == reason
+    )
+
+
+def chunks(*texts):
+    return [
+        {"id": str(i), "text": text, "score": 1.0 - i / 10}
+        for i, text in enumerate(texts)
+    ]
+
+
+class SlowScorer:
+    """
+    Pontua pelo tamanho do texto, depois de esperar `seconds` ou até `release` ser sinalizado.
+    """
+
+    def __init__(self, seconds=0.0, release=None):
+        self.seconds = seconds
+        self.release = release
+        self.calls = 0
+
+    def score_many(self, queries, candidate_texts):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        time.sleep(self.seconds)
+        return [
+            np.asarray([len(text) for text in texts], dtype=np.float32)
+            for texts in candidate_texts
+        ]
+
+
+def test_lexical_rerank_keeps_the_best_candidates():
+    reranker = Reranker(LexicalScorer(), top_k=2, budget_ms=None, workers=1)
+    candidates = chunks(
+        "ata da reunião",
+        "o prazo do contrato é de um ano",
+        "contrato de locação",
+    )
+
+    [ranked] = asyncio.run(reranker.rerank_many(["prazo do contrato"], [candidates]))
+    reranker.close()
+
+    assert [chunk["id"] for chunk in ranked] == ["1", "2"]
+    assert ranked[0]["retrieval_score"] == candidates[1]["score"]
+
+
+def test_rerank_over_budget_keeps_the_search_order():
+    release = threading.Event()
+    reranker = Reranker(SlowScorer(release=release), top_k=2, budget_ms=20, workers=1)
+    timeouts = fallbacks("timeout")
+
+    ranked = asyncio.run(reranker.rerank_many(["q"], [chunks("a", "bbb", "cc")]))
+    release.set()
+    reranker.close()
+
+    assert ranked == [chunks("a", "bbb", "cc")[:2]]
+    assert fallbacks("timeout") == timeouts + 1
+
+
+def test_questions_wait_for_a_busy_thread_within_the_budget():
+    scorer = SlowScorer(seconds=0.02)
+    reranker = Reranker(scorer, top_k=1, budget_ms=2000, workers=1)
+    busy = fallbacks("busy")
+
+    async def main():
+        return await asyncio.gather(
+            *(reranker.rerank_many(["q"], [chunks("a", "bbb")]) for _ in range(3))
+        )
+
+    results = asyncio.run(main())
+    reranker.close()
+
+    # Com uma só thread, as perguntas esperam a vez em vez de pular o rerank
+    assert scorer.calls == 3
+    assert all(
+        ranked == [[{**chunks("a", "bbb")[1], "retrieval_score": 0.9, "score": 3.0}]]
+        for ranked in results
+    )
+    assert fallbacks("busy") == busy
+
+
+def test_question_skips_the_rerank_when_no_thread_frees_up_in_time():
+    release = threading.Event()
+    reranker = Reranker(SlowScorer(release=release), top_k=2, budget_ms=30, workers=1)
+    busy = fallbacks("busy")
+
+    async def main():
+        # A primeira pergunta segura a única thread até `release`, depois de estourar o orçamento
+        return await asyncio.gather(
+            reranker.rerank_many(["q"], [chunks("a", "bbb")]),
+            reranker.rerank_many(["q"], [chunks("a", "bbb")]),
+        )
+
+    results = asyncio.run(main())
+    release.set()
+    reranker.close()
+
+    assert results == [[chunks("a", "bbb")]] * 2
+    assert fallbacks("busy") == busy + 1
+
+
+def test_workers_default_to_the_cpu_count(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 3)
+    reranker = Reranker(LexicalScorer())
+    assert reranker._executor._max_workers == 3
+    reranker.close()
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+from pymilvus import CollectionSchema, DataType, FieldSchema
+
+from services import vector_store
+from services.embedding_cache import EmbeddingCache, embedding_key
+
+
+@pytest.fixture(autouse=True)
+def no_milvus(monkeypatch):
+    monkeypatch.setattr(vector_store.connections, "connect", lambda *a, **k: None)
+    monkeypatch.setenv("MILVUS_VECTOR_TYPE", "float16")
+    monkeypatch.setenv("MILVUS_RESCORE_MULTIPLIER", "4")
+
+
+def cache_with(path=None, **vectors):
+    cache = EmbeddingCache(path)
+    cache.put_many(
+        {embedding_key("m", text): vector for text, vector in vectors.items()}
+    )
+    return cache
+
+
+def hit(chunk_id, text, score):
+    return {"id": chunk_id, "text": text, "score": score}
+
+
+def test_rescore_reorders_candidates_by_the_full_embeddings(tmp_path):
+    cache = cache_with(
+        str(tmp_path / "embeddings.sqlite3"),
+        a=[1.0, 0.0],
+        b=[0.6, 0.8],
+        c=[0.0, 1.0],
+    )
+    store = vector_store.MilvusVectorStore(dim=2, model_name="m", embedding_cache=cache)
+
+    [ranked] = store._rescore(
+        [[0.0, 2.0]],
+        [[hit("1", "a", 0.9), hit("2", "b", 0.8), hit("3", "c", 0.7)]],
+        limit=2,
+    )
+
+    assert [chunk["id"] for chunk in ranked] == ["3", "2"]
+    assert ranked[0]["score"] == pytest.approx(1.0)
+    assert ranked[1]["score"] == pytest.approx(0.8)
+
+
+def test_query_with_a_candidate_missing_from_the_cache_keeps_the_compact_order(
+    tmp_path,
+):
+    cache = cache_with(str(tmp_path / "embeddings.sqlite3"), a=[1.0, 0.0])
+    store = vector_store.MilvusVectorStore(dim=2, model_name="m", embedding_cache=cache)
+    candidates = [hit("1", "a", 0.5), hit("2", "fora do cache", 0.4)]
+
+    [ranked] = store._rescore([[1.0, 0.0]], [candidates], limit=2)
+
+    # Sem misturar o cosseno re-pontuado de "a" com o score compacto do outro candidato
+    assert ranked == candidates
+
+
+def test_compact_vectors_require_the_embedding_cache(caplog):
+    with pytest.raises(ValueError):
+        vector_store.MilvusVectorStore(dim=2, model_name="m")
+
+    with caplog.at_level(logging.WARNING, logger=vector_store.__name__):
+        vector_store.MilvusVectorStore(
+            dim=2, model_name="m", embedding_cache=EmbeddingCache()
+        )
+    assert "só em memória" in caplog.text
+
+
+def test_full_precision_vectors_do_not_need_the_cache(monkeypatch):
+    monkeypatch.setenv("MILVUS_VECTOR_TYPE", "float32")
+    store = vector_store.MilvusVectorStore(dim=2, model_name="m")
+    assert store.embedding_cache is None
+
+
+class LoadedCollection:
+    name = "s"
+
+    def load(self):
+        pass
+
+    def release(self):
+        pass
+
+
+def test_hybrid_search_does_not_start_the_dense_search_without_the_keyword_index(
+    monkeypatch,
+):
+    monkeypatch.setenv("MILVUS_VECTOR_TYPE", "float32")
+    store = vector_store.MilvusVectorStore(dim=2, model_name="m")
+    store.collections.open_collection = lambda session_id: LoadedCollection()
+    dense_calls = []
+
+    async def broken_keyword_index(session_id):
+        raise RuntimeError("Milvus indisponível")
+
+    monkeypatch.setattr(store, "_get_keyword_index", broken_keyword_index)
+    monkeypatch.setattr(
+        store, "_dense_search", lambda *args: dense_calls.append(args) or [[]]
+    )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.search_many([[1.0, 0.0]], 3, "s", ["prazo"]))
+
+    assert dense_calls == []
+    # A coleção foi devolvida mesmo com a falha
+    assert not store.collections._in_use
+
+
+class FakeMilvus:
+    """
+    Registra as chamadas ao `utility` do Milvus e cria coleções falsas.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, *args))
+
+
+class FakeCollection:
+    def __init__(self, name, schema, rows=(), physical_name=None, index_type="FLAT"):
+        self.name = name
+        self.schema = schema
+        self.rows = list(rows)
+        self.physical_name = physical_name or name
+        self.indexes = [
+            SimpleNamespace(field_name="embedding", params={"index_type": index_type})
+        ]
+        self.count_queries = 0
+
+    def describe(self):
+        return {"collection_name": self.physical_name}
+
+    def query(self, expr, output_fields):
+        self.count_queries += 1
+        return [{"count(*)": len(self.rows)}]
+
+    def query_iterator(self, batch_size, output_fields):
+        batches = [self.rows[:2], self.rows[2:], []]
+        return SimpleNamespace(next=lambda: batches.pop(0), close=lambda: None)
+
+    def insert(self, columns):
+        names = [field.name for field in self.schema.fields]
+        self.rows.extend(dict(zip(names, row)) for row in zip(*columns))
+
+    def upsert(self, columns):
+        self.insert(columns)
+        return SimpleNamespace(upsert_count=len(columns[0]))
+
+    def delete(self, expr):
+        return SimpleNamespace(delete_count=len(json.loads(expr[len("id in ") :])))
+
+    def flush(self):
+        pass
+
+    def create_index(self, field_name, index_params):
+        self.indexes[0].params = index_params
+
+    def load(self):
+        pass
+
+    def release(self):
+        pass
+
+
+SCHEMA = CollectionSchema(
+    [
+        FieldSchema(name="id", dtype=DataType.VARCHAR, is_primary=True, max_length=36),
+        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=100),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=2),
+    ]
+)
+
+
+def rows(count):
+    return [
+        {"id": str(i), "text": f"t{i}", "embedding": [1.0, float(i)]}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def rebuild_store(monkeypatch):
+    monkeypatch.setenv("MILVUS_VECTOR_TYPE", "float32")
+    monkeypatch.setenv("MILVUS_FLAT_MAX_ROWS", "2")
+    milvus = FakeMilvus()
+    shadows = []
+
+    def create_shadow(name, schema):
+        shadows.append(FakeCollection(name, schema))
+        return shadows[-1]
+
+    monkeypatch.setattr(vector_store, "utility", milvus)
+    monkeypatch.setattr(vector_store, "Collection", create_shadow)
+    store = vector_store.MilvusVectorStore(dim=2, model_name="m")
+    return store, milvus, shadows
+
+
+def test_rebuild_switches_the_alias_before_dropping_the_old_collection(
+    rebuild_store,
+):
+    store, milvus, shadows = rebuild_store
+    collection = FakeCollection("s", SCHEMA, rows(3), physical_name="s_flat_1")
+
+    store._rebuild_index(collection)
+
+    [shadow] = shadows
+    assert [row["id"] for row in shadow.rows] == ["0", "1", "2"]
+    assert shadow.indexes[0].params["index_type"] == "HNSW"
+    assert milvus.calls[-2:] == [
+        ("alter_alias", shadow.name, "s"),
+        ("drop_collection", "s_flat_1"),
+    ]
+    # O número de linhas vem da cópia, sem outro count(*)
+    assert store._row_count(collection) == 3
+    assert collection.count_queries == 1
+
+
+def test_rebuild_of_a_collection_without_alias_renames_it_first(rebuild_store):
+    store, milvus, shadows = rebuild_store
+    collection = FakeCollection("s", SCHEMA, rows(3))
+
+    store._rebuild_index(collection)
+
+    [shadow] = shadows
+    (rename, old, renamed), create, drop = milvus.calls[-3:]
+    assert (rename, old) == ("rename_collection", "s")
+    assert create == ("create_alias", shadow.name, "s")
+    assert drop == ("drop_collection", renamed)
+
+
+def test_small_collection_keeps_its_index(rebuild_store):
+    store, milvus, shadows = rebuild_store
+
+    store._rebuild_index(FakeCollection("s", SCHEMA, rows(1)))
+
+    assert shadows == [] and milvus.calls == []
+
+
+def test_row_count_follows_upserts_and_deletes(rebuild_store, monkeypatch):
+    monkeypatch.setenv("HYBRID_SEARCH", "false")
+    store = vector_store.MilvusVectorStore(dim=2, model_name="m")
+    collection = FakeCollection("s", SCHEMA, rows(1))
+    store.collections.open_collection = lambda session_id: collection
+    chunks = [
+        SimpleNamespace(id=str(i), text="t", embedding=[1.0, 0.0]) for i in (5, 6)
+    ]
+
+    async def main():
+        assert store._row_count(collection) == 1
+        await store.insert_chunks(chunks, "s")
+        await store.delete_chunks(["0"], "s")
+
+    asyncio.run(main())
+
+    assert store._row_count(collection) == 2
+    assert collection.count_queries == 1
@@ -1,6 +1,8 @@
 import streamlit as st
 import requests
 import os
+import json
+import time
 import randomname
 from dotenv import load_dotenv
 
@@ -60,6 +62,10 @@ if "messages" not in st.session_state:
 if "processed_input" not in st.session_state:
     st.session_state.processed_input = ""
 
+# Pergunta enviada pelo chat que ainda vai ser respondida nesta execução do script
+if "pending_question" not in st.session_state:
+    st.session_state.pending_question = None
+
 # O ID da sessão é gerado automaticamente ao carregar a página pela primeira vez
 if "session_id" not in st.session_state:
     st.session_state.session_id = randomname.get_name(sep="_")
@@ -105,9 +111,29 @@ def state_messages_to_list():
     return formated_messages
 
 
+def iter_sse_events(response):
+    """
+    Lê os eventos Server-Sent Events de uma resposta em streaming da API.
+
+    Args:
+        response (requests.Response): Resposta aberta com `stream=True`.
+    """
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            # Linha em branco encerra o evento
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:") :].strip())
+
+
 def ask_question(question):
     """
-    Faz uma pergunta à API, ou seja, envia uma mensagem.
+    Faz uma pergunta à API, ou seja, envia uma mensagem, mostrando a resposta conforme é gerada.
 
     Args:
         question (str): Mensagem a ser enviada.
@@ -117,22 +143,40 @@ def ask_question(question):
         st.session_state.messages.append({"role": "user", "content": question})
 
         response = requests.post(
-            f"{API_URL}/question",
+            f"{API_URL}/question/stream",
             json={
                 "session_id": st.session_state.session_id,
                 "question": question,
                 "chat_history": state_messages_to_list(),
             },
+            stream=True,
         )
         response.raise_for_status()
-        response_text = response.json()["answer"]
+
+        result = {"answer": "", "context_chunks": []}
+
+        def answer_tokens():
+            for event, data in iter_sse_events(response):
+                if event == "context":
+                    result["context_chunks"] = data
+                elif event == "token":
+                    yield data
+                elif event == "error":
+                    raise requests.exceptions.RequestException(data)
+
+        with st.chat_message(
+            "assistant",
+            avatar="resources/icon.png",
+        ):
+            st.write("**Mestre dos PDFs**")
+            result["answer"] = st.write_stream(answer_tokens())
 
         # Adiciona no histórico de mensagens
         st.session_state.messages.append(
-            {"role": "assistant", "content": response_text}
+            {"role": "assistant", "content": result["answer"]}
         )
 
-        return response.json()
+        return result
     except requests.exceptions.RequestException as e:
         st.error(f"Erro ao gerar resposta: {str(e)}")
         return None
@@ -140,21 +184,31 @@ def ask_question(question):
 
 def handle_user_input():
     """
-    Processa a mensagem do usuário e pega a resposta da API do RAG.
+    Guarda a mensagem do usuário para ser respondida no corpo do script, onde a resposta pode ser mostrada em streaming.
     """
-    question = st.session_state.user_input
+    st.session_state.pending_question = st.session_state.user_input
 
-    with st.spinner("Gerando resposta..."):
-        result = ask_question(question)
 
-        if result:
-            # Armazena o contexto dos chunks para poder ver na UI do Streamlit
-            st.session_state.last_context = result.get("context_chunks", [])
+def answer_pending_question():
+    """
+    Processa a mensagem pendente do usuário e pega a resposta da API do RAG.
+    """
+    question = st.session_state.pending_question
+    st.session_state.pending_question = None
+
+    display_chat_message("user", question)
+    result = ask_question(question)
+
+    if result:
+        # Armazena o contexto dos chunks para poder ver na UI do Streamlit
+        st.session_state.last_context = result.get("context_chunks", [])
+        # Atualiza a página para a sidebar enxergar a nova mensagem
+        st.rerun()
 
 
 def upload_documents(files):
     """
-    Faz o upload dos PDFs.
+    Faz o upload dos PDFs e acompanha o processamento em segundo plano até o fim.
 
     Args:
         files: PDFs a serem enviados para o Milvus DB.
@@ -165,9 +219,40 @@ def upload_documents(files):
     files_data = [("files", file) for file in files]
 
     try:
-        response = requests.post(f"{API_URL}/documents", files=files_data)
+        response = requests.post(
+            f"{API_URL}/documents",
+            files=files_data,
+            params={"session_id": st.session_state.session_id},
+        )
         response.raise_for_status()
-        return response.json()
+        job_id = response.json()["job_id"]
+
+        progress_bar = st.progress(0.0, text="Processando PDFs...")
+        while True:
+            response = requests.get(f"{API_URL}/documents/jobs/{job_id}")
+            response.raise_for_status()
+            job = response.json()
+
+            total_pages = sum(file["total_pages"] for file in job["files"])
+            pages = sum(file["pages"] for file in job["files"])
+            finished = sum(
+                file["status"] in ("done", "failed") for file in job["files"]
+            )
+            progress_bar.progress(
+                min(pages / total_pages, 1.0) if total_pages else 0.0,
+                text=f"Processando PDFs... {finished}/{len(job['files'])} concluídos, {pages}/{total_pages} páginas",
+            )
+
+            if job["status"] in ("done", "failed"):
+                progress_bar.empty()
+                for file in job["files"]:
+                    if file["status"] == "failed":
+                        st.error(
+                            f"Erro ao processar {file['filename']}: {file['error']}"
+                        )
+                return job
+
+            time.sleep(1)
     except requests.exceptions.RequestException as e:
         st.error(f"Erro ao processar documento: {str(e)}")
         return None
@@ -209,8 +294,13 @@ def context_dialog():
 
     if hasattr(st.session_state, "last_context") and st.session_state.last_context:
         for i, chunk in enumerate(st.session_state.last_context):
+            pages = ""
+            if chunk.get("page_start"):
+                pages = f", página {chunk['page_start']}"
+                if chunk.get("page_end") and chunk["page_end"] != chunk["page_start"]:
+                    pages = f", páginas {chunk['page_start']}-{chunk['page_end']}"
             with st.expander(
-                f"Chunk {i + 1} do documento {chunk['source']} (Score: {chunk['score']:.4f})"
+                f"Chunk {i + 1} do documento {chunk['source']}{pages} (Score: {chunk['score']:.4f})"
             ):
                 st.markdown(chunk["text"])
     else:
@@ -233,17 +323,19 @@ with st.sidebar:
 
     if uploaded_files:
         if st.button("Processar PDFs"):
-            with st.spinner("Processando PDFs..."):
-                result = upload_documents(uploaded_files)
-                if result:
-                    st.success(
-                        f"{result['documents_indexed']} documentos processados com sucesso ({result['total_chunks']} chunks)"
-                    )
+            result = upload_documents(uploaded_files)
+            if result and result["documents_indexed"]:
+                st.success(
+                    f"{result['documents_indexed']} documentos processados com sucesso ({result['total_chunks']} chunks)"
+                )
 
 # Mantém o chat atualizado
 for message in st.session_state.messages:
     display_chat_message(message["role"], message["content"])
 
+if st.session_state.pending_question:
+    answer_pending_question()
+
 st.chat_input(
     key="user_input",
     placeholder="Me pergunte algo...",